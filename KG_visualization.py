@@ -1,8 +1,13 @@
+import os
+import json
 import dash
 from dash import html, dcc
 import dash_cytoscape as cyto
 import dash_daq as daq
 from dash.dependencies import Input, Output, State
+from graph_builder import load_graph_index
+from graph_index import GraphIndex
+from scale_classifier import ScaleClassifier, load_scales
 
 app = dash.Dash(__name__)
 
@@ -33,22 +38,155 @@ app = dash.Dash(__name__)
 nodes = []
 edges = []
 
-# Initialize default styles for each node (this dictionary will be updated dynamically)
-default_styles = {
-    node['data']['id']: {
-        'width': 50,
-        'height': 50,
-        'font-size': 12,
-        'background-color': '#87D88B',
-        'color': '#FFFFFF',
-        'text-outline-color': '#0074D9'
-    } 
-    for node in nodes
+# Alternatively, build the graph from the output of entity_extraction.py
+# (output.jsonl or output.json). Positions are computed server-side with a
+# force-directed layout and cached in `layout_cache_dir` by graph hash. The graph
+# is saved as a compact index in `graph_index_dir` and memory-mapped on later
+# starts while the output file is unchanged. Set to None to disable.
+graph_source_path = "output.jsonl"
+entity_index_path = "entity_index.json"  # Labels for canonical IDs, if available
+layout_cache_dir = "layout_cache"
+graph_index_dir = "graph_index"
+layout_iterations = 100
+
+# The browser only receives a bounded view of the graph, served from the graph
+# index: the top-k nodes by degree or frequency (after the scale and source-paper
+# filters) plus the k-hop neighborhoods of the nodes clicked so far
+max_visible_nodes = 300
+default_top_k = 100
+scales_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scales.json")
+
+scales = load_scales(scales_config_path)
+spatial_classifier = ScaleClassifier(scales["spatial_scale"])
+temporal_classifier = ScaleClassifier(scales["temporal_scale"])
+
+if not nodes and graph_source_path and os.path.exists(graph_source_path):
+    graph_index = load_graph_index(
+        graph_source_path, graph_index_dir, cache_dir=layout_cache_dir, labels_path=entity_index_path,
+        iterations=layout_iterations, spatial_classifier=spatial_classifier,
+        temporal_classifier=temporal_classifier, signature_extra=scales
+    )
+    print(f"Loaded {graph_index.num_nodes} nodes and {graph_index.num_edges} edges from {graph_source_path}")
+else:
+    graph_index = GraphIndex.from_elements(
+        nodes, edges, spatial_classifier=spatial_classifier, temporal_classifier=temporal_classifier
+    )
+spatial_scales, temporal_scales = graph_index.scale_names()
+initial_nodes = graph_index.top_nodes(default_top_k)
+
+# Default node style; the user's per-node changes are kept as overrides of it
+default_node_style = {
+    'width': 50,
+    'height': 50,
+    'font-size': 12,
+    'background-color': '#87D88B',
+    'color': '#FFFFFF',
+    'text-outline-color': '#0074D9'
+}
+default_styles = {'default': default_node_style, 'overrides': {}}
+
+edge_style = {
+    'width': 2,
+    'line-color': 'gray',
+    'curve-style': 'bezier',
+    'target-arrow-color': 'gray',
+    'target-arrow-shape': 'triangle',
+    'label': 'data(label)',
+    'text-rotation': 'autorotate',
+    'font-size': 10,
+    'color': 'black',
+    'text-background-opacity': 1,
+    'text-background-color': 'white',
+    'text-background-padding': 2
+}
+
+# Properties of a node style set by the controls, and the fixed properties of every node rule
+node_style_keys = ['width', 'height', 'font-size', 'background-color', 'color', 'text-outline-color']
+node_rule_fixed = {'content': 'data(label)', 'text-valign': 'center', 'text-outline-width': 0, 'text-wrap': 'wrap'}
+label_padding = 10
+
+# Update the stylesheet in the browser (no server round-trip per control change);
+# set to False to use the server-side `update_stylesheet` callback instead
+clientside_stylesheet = True
+
+def node_rule(selector, style):
+    """
+    Returns the Cytoscape stylesheet rule applying a node style to `selector`.
+    """
+    rule_style = {key: style[key] for key in node_style_keys}
+    rule_style.update(node_rule_fixed)
+    rule_style['text-max-width'] = style['width'] - label_padding
+    return {'selector': selector, 'style': rule_style}
+
+def build_stylesheet(styles):
+    """
+    Builds the stylesheet from the styles store: one rule for the default node style
+    plus one rule per overridden node, so its size does not grow with the graph.
+    """
+    stylesheet = [node_rule('node', styles['default'])]
+    for node_id, style in styles['overrides'].items():
+        escaped_id = node_id.replace('\\', '\\\\').replace('"', '\\"')
+        stylesheet.append(node_rule(f'node[id="{escaped_id}"]', style))
+    stylesheet.append({'selector': 'edge', 'style': edge_style})
+    return stylesheet
+
+def update_styles(styles, apply_all, style, selected_node):
+    """
+    Returns the styles store with `style` applied: if 'apply-all' is 'yes', it becomes
+    the default style and all overrides are cleared; otherwise only the selected node
+    gets it as an override.
+    """
+    styles = {'default': styles['default'], 'overrides': dict(styles['overrides'])}
+    if apply_all == 'yes':
+        styles['default'] = style
+        styles['overrides'] = {}
+    elif selected_node:
+        styles['overrides'][selected_node] = style
+    return styles
+
+# `update_stylesheet` and `build_stylesheet` in JavaScript for the clientside callback;
+# the node rule is generated from `node_style_keys`, `node_rule_fixed` and `label_padding`
+clientside_update_stylesheet = """
+function(applyAll, nodeSize, fontSize, nodeColor, fontColor, fontOutlineColor, selectedNode, styles, edgeStyle) {
+    var style = {
+        'width': nodeSize,
+        'height': nodeSize,
+        'font-size': fontSize,
+        'background-color': nodeColor.hex,
+        'color': fontColor.hex,
+        'text-outline-color': fontOutlineColor.hex
+    };
+    styles = {'default': styles['default'], 'overrides': Object.assign({}, styles['overrides'])};
+    if (applyAll === 'yes') {
+        styles['default'] = style;
+        styles['overrides'] = {};
+    } else if (selectedNode) {
+        styles['overrides'][selectedNode] = style;
+    }
+
+    function nodeRule(selector, style) {
+        var ruleStyle = {};
+        NODE_STYLE_KEYS.forEach(function(key) { ruleStyle[key] = style[key]; });
+        Object.assign(ruleStyle, NODE_RULE_FIXED);
+        ruleStyle['text-max-width'] = style['width'] - LABEL_PADDING;
+        return {'selector': selector, 'style': ruleStyle};
+    }
+
+    var stylesheet = [nodeRule('node', styles['default'])];
+    Object.keys(styles['overrides']).forEach(function(nodeId) {
+        var escapedId = nodeId.replace(/\\\\/g, '\\\\\\\\').replace(/"/g, '\\\\"');
+        stylesheet.push(nodeRule('node[id="' + escapedId + '"]', styles['overrides'][nodeId]));
+    });
+    stylesheet.push({'selector': 'edge', 'style': edgeStyle});
+    return [stylesheet, styles];
 }
+""".replace('NODE_STYLE_KEYS', json.dumps(node_style_keys)).replace(
+    'NODE_RULE_FIXED', json.dumps(node_rule_fixed)).replace('LABEL_PADDING', str(label_padding))
 
 app.layout = html.Div([
     # Store for persisting node style data
     dcc.Store(id='styles-store', data=default_styles),
+    dcc.Store(id='edge-style', data=edge_style),
     
     # Left control panel
     html.Div([
@@ -107,19 +245,75 @@ app.layout = html.Div([
         dcc.Dropdown(
             id='node-selector',
             # Options will be dynamically updated if you add nodes
-            options=[{'label': node['data']['label'], 'value': node['data']['id']} for node in nodes],
+            options=[{'label': graph_index.labels[i], 'value': graph_index.node_ids[i]} for i in initial_nodes],
             value=None,
             disabled=False
-        )
+        ),
+        html.Br(),
+
+        html.Label("Show Top Nodes By:"),
+        dcc.RadioItems(
+            id='rank-by',
+            options=[
+                {'label': 'Degree', 'value': 'degree'},
+                {'label': 'Frequency', 'value': 'mentions'}
+            ],
+            value='degree',
+            labelStyle={'display': 'inline-block'}
+        ),
+
+        html.Label("Number of Nodes:"),
+        dcc.Slider(
+            id='top-k-slider',
+            min=10,
+            max=max_visible_nodes,
+            step=10,
+            value=default_top_k,
+            marks={i: str(i) for i in range(0, max_visible_nodes + 1, 100)}
+        ),
+
+        html.Label("Spatial Scale:"),
+        dcc.Dropdown(
+            id='spatial-filter',
+            options=[{'label': scale, 'value': scale} for scale in spatial_scales],
+            value=None
+        ),
+
+        html.Label("Temporal Scale:"),
+        dcc.Dropdown(
+            id='temporal-filter',
+            options=[{'label': scale, 'value': scale} for scale in temporal_scales],
+            value=None
+        ),
+
+        html.Label("Source Paper:"),
+        dcc.Dropdown(
+            id='source-filter',
+            options=[{'label': os.path.basename(source), 'value': source} for source in graph_index.source_names()],
+            value=None
+        ),
+
+        html.Label("Expand Clicked Nodes (Hops):"),
+        dcc.Slider(
+            id='expand-hops-slider',
+            min=0,
+            max=3,
+            step=1,
+            value=1,
+            marks={i: str(i) for i in range(4)}
+        ),
+        html.Button("Reset View", id='reset-view-button', n_clicks=0),
+        dcc.Store(id='expanded-nodes', data=[])
     ], style={'width': '20%', 'float': 'left', 'padding': '20px'}),
     
     # Cytoscape graph
     html.Div([
         cyto.Cytoscape(
             id='cytoscape',
-            elements=nodes + edges,
+            elements=graph_index.elements(initial_nodes),
             style={'width': '100%', 'height': '600px'},
             layout={'name': 'preset'},
+            stylesheet=build_stylesheet(default_styles),
         )
     ], style={'width': '75%', 'float': 'right', 'padding': '20px'}),
     
@@ -129,20 +323,6 @@ app.layout = html.Div([
     dcc.Download(id="download")
 ])
 
-@app.callback(
-    [Output('cytoscape', 'stylesheet'),
-     Output('styles-store', 'data')],
-    [
-        Input('apply-all', 'value'),
-        Input('node-size-slider', 'value'),
-        Input('font-size-slider', 'value'),
-        Input('node-color-picker', 'value'),
-        Input('font-color-picker', 'value'),
-        Input('font-outline-color-picker', 'value'),
-        Input('node-selector', 'value')
-    ],
-    [State('styles-store', 'data')]
-)
 def update_stylesheet(
     apply_all,
     node_size,
@@ -157,72 +337,77 @@ def update_stylesheet(
     Updates the stylesheet for Cytoscape based on user inputs (size, colors, etc.).
     If 'apply-all' is 'yes', all nodes are updated. Otherwise, only the selected node is updated.
     """
-    if not nodes:
-        # If no nodes are defined, return empty stylesheet
-        return [], styles
-    
-    if apply_all == 'yes':
-        for node_id in styles:
-            styles[node_id] = {
-                'width': node_size,
-                'height': node_size,
-                'font-size': font_size,
-                'background-color': node_color['hex'],
-                'color': font_color['hex'],
-                'text-outline-color': font_outline_color['hex']
-            }
+    style = {
+        'width': node_size,
+        'height': node_size,
+        'font-size': font_size,
+        'background-color': node_color['hex'],
+        'color': font_color['hex'],
+        'text-outline-color': font_outline_color['hex']
+    }
+    styles = update_styles(styles, apply_all, style, selected_node)
+    return build_stylesheet(styles), styles
+
+stylesheet_inputs = [
+    Input('apply-all', 'value'),
+    Input('node-size-slider', 'value'),
+    Input('font-size-slider', 'value'),
+    Input('node-color-picker', 'value'),
+    Input('font-color-picker', 'value'),
+    Input('font-outline-color-picker', 'value'),
+    Input('node-selector', 'value')
+]
+stylesheet_outputs = [Output('cytoscape', 'stylesheet'), Output('styles-store', 'data')]
+
+if clientside_stylesheet:
+    app.clientside_callback(
+        clientside_update_stylesheet, stylesheet_outputs, stylesheet_inputs,
+        [State('styles-store', 'data'), State('edge-style', 'data')]
+    )
+else:
+    app.callback(stylesheet_outputs, stylesheet_inputs, [State('styles-store', 'data')])(update_stylesheet)
+
+@app.callback(
+    [Output('cytoscape', 'elements'),
+     Output('node-selector', 'options'),
+     Output('expanded-nodes', 'data')],
+    [
+        Input('rank-by', 'value'),
+        Input('top-k-slider', 'value'),
+        Input('spatial-filter', 'value'),
+        Input('temporal-filter', 'value'),
+        Input('source-filter', 'value'),
+        Input('cytoscape', 'tapNodeData'),
+        Input('reset-view-button', 'n_clicks')
+    ],
+    [State('expand-hops-slider', 'value'),
+     State('expanded-nodes', 'data')]
+)
+def update_view(rank_by, top_k, spatial, temporal, source, tapped_node, reset_clicks, hops, expanded):
+    """
+    Serves the visible part of the graph from the adjacency index: the top-k nodes
+    matching the filters, plus the neighborhoods of the clicked nodes, with at most
+    `max_visible_nodes` nodes. Changing a filter or resetting collapses the neighborhoods.
+    """
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if 'cytoscape.tapNodeData' in triggered:
+        if tapped_node and hops and tapped_node['id'] not in expanded:
+            expanded = expanded + [tapped_node['id']]
     else:
-        # Update only the selected node (if it exists in styles)
-        if selected_node in styles:
-            styles[selected_node] = {
-                'width': node_size,
-                'height': node_size,
-                'font-size': font_size,
-                'background-color': node_color['hex'],
-                'color': font_color['hex'],
-                'text-outline-color': font_outline_color['hex']
-            }
-
-    # Construct the new stylesheet
-    stylesheet = [
-        {
-            'selector': f'node[id="{node_id}"]',
-            'style': {
-                'width': styles[node_id]['width'],
-                'height': styles[node_id]['height'],
-                'font-size': styles[node_id]['font-size'],
-                'background-color': styles[node_id]['background-color'],
-                'color': styles[node_id]['color'],
-                'content': 'data(label)',
-                'text-valign': 'center',
-                'text-outline-width': 0,
-                'text-outline-color': styles[node_id]['text-outline-color'],
-                'text-wrap': 'wrap',
-                'text-max-width': styles[node_id]['width'] - 10
-            }
-        }
-        for node_id in styles
-    ]
-    
-    stylesheet.append({
-        'selector': 'edge',
-        'style': {
-            'width': 2,
-            'line-color': 'gray',
-            'curve-style': 'bezier',
-            'target-arrow-color': 'gray',
-            'target-arrow-shape': 'triangle',
-            'label': 'data(label)',
-            'text-rotation': 'autorotate',
-            'font-size': 10,
-            'color': 'black',
-            'text-background-opacity': 1,
-            'text-background-color': 'white',
-            'text-background-padding': 2
-        }
-    })
-    
-    return stylesheet, styles
+        expanded = []
+
+    visible = graph_index.top_nodes(min(top_k, max_visible_nodes), rank_by, spatial, temporal, source)
+    seen = set(visible)
+    for node_id in expanded:
+        for node in graph_index.neighborhood(node_id, hops, limit=max_visible_nodes):
+            if len(seen) >= max_visible_nodes:
+                break
+            if node not in seen:
+                seen.add(node)
+                visible.append(node)
+
+    options = [{'label': graph_index.labels[i], 'value': graph_index.node_ids[i]} for i in visible]
+    return graph_index.elements(visible), options, expanded
 
 # Client-side callback to download the graph as a PNG
 app.clientside_callback(
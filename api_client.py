@@ -0,0 +1,213 @@
+import json
+import time
+import random
+import threading
+import openai
+from chunking import approximate_token_count
+from metrics import metrics
+
+# Errors worth retrying: rate limits, timeouts, connection problems and server errors
+retryable_errors = (
+    openai.error.RateLimitError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIError
+)
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` units per minute, holding at
+    most one minute's worth. `acquire` blocks until the requested amount is available.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount):
+        amount = min(amount, self.capacity)  # A single oversized request must still go through
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+
+    def refund(self, amount):
+        """
+        Corrects an earlier estimate: returns `amount` units (or takes them if negative).
+        """
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+def retry_after_seconds(error):
+    """
+    Returns the delay requested by the server's Retry-After header, if any.
+    """
+    headers = getattr(error, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1)):
+        value = headers.get(name) or headers.get(name.title())
+        if value is not None:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return None
+
+def request_prompt_tokens(request, count_tokens=approximate_token_count):
+    """
+    Estimates the prompt tokens of a ChatCompletion request: its messages and, for a
+    function call request, the serialized `functions` schema, which is sent to the
+    model as part of the prompt.
+    """
+    prompt = sum(count_tokens(message.get("content") or "") for message in request.get("messages", []))
+    if request.get("functions"):
+        prompt += count_tokens(json.dumps(request["functions"], ensure_ascii=False))
+    return prompt
+
+class RateLimitedClient:
+    """
+    ChatCompletion client shared by the scripts. Requests wait for the requests-per-minute
+    and tokens-per-minute buckets and for a concurrency slot. Failed requests are
+    retried with exponential backoff and full jitter (or after the server's Retry-After).
+    The concurrency limit grows additively after successes and is halved on
+    rate-limit errors (AIMD), so it settles near the highest rate the account allows.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8,
+                 min_concurrency=1, max_retries=5, base_delay=1.0, max_delay=60.0,
+                 default_response_tokens=512, count_tokens=approximate_token_count):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_response_tokens = default_response_tokens
+        self.count_tokens = count_tokens
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._epoch = 0  # Incremented on every decrease, so one burst of 429s halves the limit once
+        self.counters = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0}
+
+    def estimate_tokens(self, request):
+        prompt = request_prompt_tokens(request, self.count_tokens)
+        return prompt + (request.get("max_tokens") or self.default_response_tokens)
+
+    def _acquire_slot(self):
+        with self._condition:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause <= 0 and self._in_flight < int(self.concurrency):
+                    self._in_flight += 1
+                    return self._epoch
+                self._condition.wait(timeout=pause if pause > 0 else None)
+
+    def _release_slot(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_success(self):
+        with self._condition:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._condition.notify_all()
+
+    def _count(self, name):
+        with self._condition:
+            self.counters[name] += 1
+        metrics.count(f"api_{name}")
+
+    def _on_rate_limited(self, epoch, delay):
+        self._count("rate_limited")
+        with self._condition:
+            if epoch == self._epoch:
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self._epoch += 1
+            # Hold back every request until the delay has passed
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def _backoff_delay(self, attempt, error):
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _call(self, request, stream):
+        estimate = self.estimate_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            if self.request_bucket:
+                self.request_bucket.acquire(1)
+            if self.token_bucket:
+                self.token_bucket.acquire(estimate)
+            epoch = self._acquire_slot()
+            try:
+                self._count("requests")
+                # For streaming requests this measures the time until the stream starts
+                with metrics.timer("api_request", model=request.get("model"), stream=stream):
+                    response = openai.ChatCompletion.create(stream=stream, **request)
+            except retryable_errors as e:
+                self._release_slot()
+                delay = self._backoff_delay(attempt, e)
+                if isinstance(e, openai.error.RateLimitError):
+                    self._on_rate_limited(epoch, delay)
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                print(f"API error ({type(e).__name__}): {e}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                self._release_slot()
+                self._count("failures")
+                raise
+
+            self._on_success()
+            if not stream:
+                self._release_slot()
+                usage = response.get("usage") if hasattr(response, "get") else None
+                if usage:
+                    metrics.record_usage(request.get("model"), usage)
+                if self.token_bucket and usage and usage.get("total_tokens"):
+                    self.token_bucket.refund(estimate - usage["total_tokens"])
+            return response
+
+    def chat_completion(self, **request):
+        """
+        Sends a ChatCompletion request, retrying retryable errors.
+        Raises the last error once the retries are exhausted.
+        """
+        return self._call(request, stream=False)
+
+    def stream_chat_completion(self, **request):
+        """
+        Sends a streaming ChatCompletion request and yields its events. Errors before
+        the stream starts are retried; the concurrency slot is held until it ends.
+        """
+        events = self._call(request, stream=True)
+        try:
+            yield from events
+        finally:
+            self._release_slot()
+
+    def stats(self):
+        with self._condition:
+            return dict(self.counters, concurrency=round(self.concurrency, 2))
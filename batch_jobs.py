@@ -0,0 +1,74 @@
+import json
+from compact_schema import message_text
+
+# Endpoint every batch request is sent to
+batch_endpoint = "/v1/chat/completions"
+
+def make_custom_id(doc_id, chunk_index):
+    """
+    Returns the ID that ties a batch request back to its document and chunk.
+    """
+    return f"{doc_id}:{chunk_index}"
+
+def parse_custom_id(custom_id):
+    """
+    Splits a custom ID back into (doc_id, chunk_index).
+    """
+    doc_id, chunk_index = custom_id.rsplit(":", 1)
+    return doc_id, int(chunk_index)
+
+def append_batch_requests(path, requests):
+    """
+    Appends (custom_id, body) requests to a batch input JSONL file
+    in the OpenAI Batch API format, writing each one as it is produced.
+    Returns the number of requests written.
+    """
+    count = 0
+    with open(path, 'a', encoding='utf-8') as f:
+        for custom_id, body in requests:
+            count += 1
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": batch_endpoint,
+                "body": body
+            }, ensure_ascii=False) + "\n")
+    return count
+
+def append_document_requests(path, doc_id, chunks, completed, build_request):
+    """
+    Appends a batch request for every chunk of a document that is not in `completed`,
+    consuming the `chunks` lazily. Returns (requests written, number of chunks of the
+    document), the latter to be recorded so ingestion can tell missing results apart.
+    """
+    num_chunks = 0
+
+    def requests():
+        nonlocal num_chunks
+        for index, chunk in enumerate(chunks):
+            num_chunks = index + 1
+            if index not in completed:
+                yield make_custom_id(doc_id, index), build_request(chunk)
+
+    count = append_batch_requests(path, requests())
+    return count, num_chunks
+
+def iter_batch_results(path):
+    """
+    Yields (custom_id, content) for every line of a batch results JSONL file.
+    `content` is the assistant message (or its function call arguments), or None if
+    the request failed.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                print(f"Batch request {result.get('custom_id')} failed: {result.get('error') or response.get('status_code')}")
+                yield result.get("custom_id"), None
+                continue
+            content = message_text(response["body"]["choices"][0]["message"])
+            yield result.get("custom_id"), content.strip() if content else None
@@ -0,0 +1,598 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import openai
+import mock_completion_server
+from metrics import metrics
+from scale_classifier import ScaleClassifier, load_scales
+from near_duplicates import NearDuplicateIndex, print_report
+
+# Offline benchmarks of the pipeline: a synthetic PDF corpus is generated and the
+# scripts are pointed at the local mock completion server, so no API calls are made.
+# Example: python benchmark.py --papers 8 --pages 6 --latency 0.2 --rate-limit 0.05
+
+scales_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scales.json")
+scales = load_scales(scales_config_path)
+
+# Vocabulary of the synthetic papers. Scale keywords are mixed in so the classifiers
+# and the extraction prompts see realistic labels.
+subjects = [
+    "RuBisCO activity", "the electron transport chain", "chloroplast movement", "stomatal conductance",
+    "mesophyll conductance", "canopy photosynthesis", "leaf surface temperature", "guard cells",
+    "photosynthetic pigments", "the Calvin cycle", "non-photochemical quenching", "crop yield",
+    "water stress", "soil composition", "the microclimate", "diurnal carbon gain", "seasonal growth"
+]
+verbs = [
+    "increases with", "is limited by", "responds to", "is regulated by", "declines under",
+    "correlates with", "acclimates to", "is coupled to"
+]
+objects = [
+    "light intensity", "elevated CO2", "leaf nitrogen content", "irrigation frequency",
+    "vapour pressure deficit", "canopy vertical structure", "temperature fluctuations",
+    "circadian rhythms", "drought episodes", "enzyme kinetics", "internal structure of the leaf"
+]
+qualifiers = [
+    "in field-grown wheat", "across the growing season", "at the molecular level", "under controlled conditions",
+    "in the upper canopy", "within minutes", "over several years", "in C3 and C4 species"
+]
+section_titles = ["Introduction", "Methods", "Results", "Discussion", "Conclusion"]
+
+def synthetic_sentence(rng):
+    return f"{rng.choice(subjects).capitalize()} {rng.choice(verbs)} {rng.choice(objects)} {rng.choice(qualifiers)}."
+
+def synthetic_paragraph(rng, words):
+    sentences = []
+    count = 0
+    while count < words:
+        sentence = synthetic_sentence(rng)
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+def near_duplicate_text(text, rng, edit_rate=0.01):
+    """
+    Returns the text with about `edit_rate` of its words replaced, like a preprint
+    and its published version.
+    """
+    return "\n".join(
+        " ".join(rng.choice(objects).split()[0] if word and rng.random() < edit_rate else word for word in line.split(" "))
+        for line in text.split("\n")
+    )
+
+def write_pdf(path, texts):
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def generate_corpus(folder, papers, pages, words_per_page=350, seed=0, near_duplicates=0):
+    """
+    Writes `papers` synthetic photosynthesis papers of `pages` pages each to `folder`
+    (title, authors and abstract on the first page, numbered sections after it and
+    references on the last page), plus a near-duplicate copy (a "preprint" with about
+    1% of the words changed) of the first `near_duplicates` papers.
+    Returns the PDF paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for paper in range(papers):
+        texts = []
+        for page_number in range(pages):
+            if page_number == 0:
+                text = (
+                    f"Synthetic study {paper} of {rng.choice(subjects)}\n"
+                    f"A. Author, B. Author and C. Author\n\n"
+                    f"Abstract\n{synthetic_paragraph(rng, words_per_page // 2)}\n\n"
+                    f"1. {section_titles[0]}\n{synthetic_paragraph(rng, words_per_page // 2)}"
+                )
+            elif page_number == pages - 1:
+                text = "References\n" + "\n".join(
+                    f"[{i + 1}] Author, A. ({2000 + i}). {synthetic_sentence(rng)} J. Exp. Bot. {i + 10}, 1-12."
+                    for i in range(words_per_page // 25)
+                )
+            else:
+                section = page_number % len(section_titles)
+                text = f"{section + 1}. {section_titles[section]}\n{synthetic_paragraph(rng, words_per_page)}"
+            texts.append(text)
+        path = os.path.join(folder, f"synthetic_{paper:04d}.pdf")
+        write_pdf(path, texts)
+        paths.append(path)
+        if paper < near_duplicates:
+            path = os.path.join(folder, f"synthetic_{paper:04d}_preprint.pdf")
+            write_pdf(path, [near_duplicate_text(text, rng) for text in texts])
+            paths.append(path)
+    return paths
+
+def synthetic_labels(count, seed=0):
+    """
+    Entity labels, about half of them containing a scale keyword.
+    """
+    rng = random.Random(seed)
+    keywords = [keyword for scale in scales.values() for keywords in scale.values() for keyword in keywords]
+    labels = []
+    for i in range(count):
+        if rng.random() < 0.5:
+            labels.append(f"{rng.choice(['', 'Leaf ', 'Reduced ', 'Mean '])}{rng.choice(keywords)} {rng.choice(['rate', 'response', 'index', ''])}".strip())
+        else:
+            labels.append(f"{rng.choice(objects).title()} {i}")
+    return labels
+
+def synthetic_extraction(chunk_index, entities=5, relationships=4, seed=0):
+    """
+    Extraction result of one chunk in the shape returned by the API.
+    """
+    rng = random.Random(seed * 100003 + chunk_index)
+    labels = synthetic_labels(entities, seed=rng.random())
+    return {
+        "entities": [
+            {"id": f"e{i}", "label": label, "type": "process", "properties": {"chunk": chunk_index}}
+            for i, label in enumerate(labels)
+        ],
+        "relationships": [
+            {"from": f"e{rng.randrange(entities)}", "to": f"e{rng.randrange(entities)}", "type": rng.choice(verbs).upper()}
+            for _ in range(relationships)
+        ]
+    }
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def stage_seconds(trace_path, stage):
+    """
+    Returns the durations of the `stage` spans recorded in a metrics trace.
+    """
+    seconds = []
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            event = json.loads(line)
+            if event.get("event") == "span" and event.get("stage") == stage:
+                seconds.append(event["seconds"])
+    return seconds
+
+def start_trace(workdir, name):
+    metrics.close()
+    metrics.reset()
+    trace_path = os.path.join(workdir, f"{name}_trace.jsonl")
+    metrics.open_trace(trace_path)
+    return trace_path
+
+def latency_stats(trace_path, stage):
+    metrics.close()  # Flushes the trace
+    seconds = stage_seconds(trace_path, stage)
+    return {
+        f"{stage}_p50_ms": round(1000 * percentile(seconds, 50), 1) if seconds else None,
+        f"{stage}_p95_ms": round(1000 * percentile(seconds, 95), 1) if seconds else None
+    }
+
+def open_duplicate_index(workdir, task):
+    return NearDuplicateIndex(os.path.join(workdir, "near_duplicates.sqlite"), task)
+
+def close_duplicate_index(duplicate_index):
+    """
+    Prints the duplicate report, closes the index and returns the API calls saved.
+    """
+    report = duplicate_index.report()
+    print_report(report)
+    duplicate_index.close()
+    return report["calls_saved"]
+
+def bench_evaluation(corpus_dir, workdir):
+    """
+    Scores the corpus with paper_evaluation.evaluate_papers_in_folder.
+    """
+    import paper_evaluation
+    openai.api_base = os.environ["OPENAI_API_BASE"]
+    paper_evaluation.duplicate_index = open_duplicate_index(workdir, "evaluation")
+
+    trace_path = start_trace(workdir, "evaluation")
+    papers = len([name for name in os.listdir(corpus_dir) if name.endswith(".pdf")])
+    started = time.perf_counter()
+    paper_evaluation.evaluate_papers_in_folder(
+        corpus_dir, os.path.join(workdir, "evaluation_results.csv"), os.path.join(workdir, "evaluation_ledger.sqlite")
+    )
+    seconds = time.perf_counter() - started
+    calls_saved = close_duplicate_index(paper_evaluation.duplicate_index)
+    summary = metrics.summary()
+    requests = summary["counters"].get("api_requests", 0)
+    return [dict(
+        papers=papers, seconds=round(seconds, 2), papers_per_s=round(papers / seconds, 2),
+        requests=requests, requests_per_s=round(requests / seconds, 2),
+        rate_limited=summary["counters"].get("api_rate_limited", 0),
+        retries=summary["counters"].get("api_retries", 0),
+        tokens=sum(totals["total_tokens"] for totals in summary["tokens"].values()),
+        duplicate_calls_saved=calls_saved,
+        **latency_stats(trace_path, "api_request")
+    )]
+
+def bench_cascade(corpus_dir, workdir, screening_models):
+    """
+    Scores the corpus with `evaluation_model` only and then with the cascade for each
+    screening model, and reports time, requests, estimated cost, escalations and the
+    drift of the paper scores from the scores of the evaluation model alone.
+    """
+    import paper_evaluation
+    from cascade import CascadeStats
+    from run_ledger import RunLedger
+    openai.api_base = os.environ["OPENAI_API_BASE"]
+
+    rows = []
+    baseline = None
+    for screening_model in [None] + screening_models:
+        variant = f"cascade ({screening_model})" if screening_model else f"{paper_evaluation.evaluation_model} only"
+        paper_evaluation.cascade_mode = screening_model is not None
+        paper_evaluation.screening_model = screening_model
+        paper_evaluation.cascade_stats = CascadeStats()
+        paper_evaluation.duplicate_index = None
+        folder = tempfile.mkdtemp(dir=workdir, prefix="cascade_")
+        ledger_path = os.path.join(folder, "evaluation_ledger.sqlite")
+
+        metrics.close()
+        metrics.reset()
+        started = time.perf_counter()
+        paper_evaluation.evaluate_papers_in_folder(corpus_dir, os.path.join(folder, "evaluation_results.csv"), ledger_path)
+        seconds = time.perf_counter() - started
+
+        ledger = RunLedger(ledger_path)
+        scores = {name: result for name, result in ledger.iter_done_documents()}
+        ledger.close()
+        summary = metrics.summary()
+        cost = sum(
+            (totals["prompt_tokens"] * paper_evaluation.model_prices.get(model, (0, 0))[0]
+             + totals["completion_tokens"] * paper_evaluation.model_prices.get(model, (0, 0))[1]) / 1000
+            for model, totals in summary["tokens"].items()
+        )
+        if baseline is None:
+            baseline = scores
+        drift = [
+            (abs(scores[name]["scientific_depth"] - baseline[name]["scientific_depth"]),
+             abs(scores[name]["domain_coverage"] - baseline[name]["domain_coverage"]))
+            for name in scores if name in baseline
+        ]
+        rows.append(dict(
+            variant=variant, papers=len(scores), seconds=round(seconds, 2),
+            requests=summary["counters"].get("api_requests", 0),
+            escalated=summary["counters"].get("cascade_escalated", 0) if screening_model else None,
+            cost=round(cost, 4),
+            depth_drift=round(sum(d for d, _ in drift) / len(drift), 3) if drift else None,
+            coverage_drift=round(sum(c for _, c in drift) / len(drift), 3) if drift else None
+        ))
+    paper_evaluation.cascade_mode = False
+    return rows
+
+def bench_output_formats(corpus_paths, workdir):
+    """
+    Scores and extracts the corpus with free-text answers and with schema-constrained
+    function calls, and reports the output tokens per chunk and the parse-failure rate
+    of each (see compact_schema.output_stats).
+    """
+    import paper_evaluation
+    import entity_extraction
+    from compact_schema import output_stats
+    openai.api_base = os.environ["OPENAI_API_BASE"]
+
+    rows = []
+    for structured in (False, True):
+        mode = "function call" if structured else "free text"
+        for task, module in (("scoring", paper_evaluation), ("extraction", entity_extraction)):
+            module.structured_outputs = structured
+            module.duplicate_index = None
+            folder = tempfile.mkdtemp(dir=workdir, prefix=f"{task}_{'schema' if structured else 'text'}_")
+            metrics.close()
+            metrics.reset()
+            started = time.perf_counter()
+            if task == "scoring":
+                paper_evaluation.evaluate_papers_in_folder(
+                    os.path.dirname(corpus_paths[0]), os.path.join(folder, "evaluation_results.csv"),
+                    os.path.join(folder, "evaluation_ledger.sqlite")
+                )
+            else:
+                entity_extraction.ledger_path = os.path.join(folder, "extraction_ledger.sqlite")
+                entity_extraction.output_csv = os.path.join(folder, "output.csv")
+                entity_extraction.output_jsonl = os.path.join(folder, "output.jsonl")
+                entity_extraction.output_json = os.path.join(folder, "output.json")
+                entity_extraction.process_pdfs(corpus_paths)
+            seconds = time.perf_counter() - started
+            stats = output_stats(metrics.summary()["counters"], task) or {}
+            rows.append(dict(
+                task=task, mode=mode, seconds=round(seconds, 2), responses=stats.get("responses", 0),
+                output_tokens_per_chunk=stats.get("output_tokens_per_response"),
+                parse_failure_rate=stats.get("parse_failure_rate"),
+                partial_parse_rate=stats.get("partial_parse_rate")
+            ))
+    paper_evaluation.structured_outputs = False
+    entity_extraction.structured_outputs = False
+    return rows
+
+def bench_extraction(corpus_paths, workdir):
+    """
+    Extracts entities and relationships from the corpus with entity_extraction.process_pdfs.
+    """
+    import entity_extraction
+    openai.api_base = os.environ["OPENAI_API_BASE"]
+    entity_extraction.ledger_path = os.path.join(workdir, "extraction_ledger.sqlite")
+    entity_extraction.output_csv = os.path.join(workdir, "output.csv")
+    entity_extraction.output_jsonl = os.path.join(workdir, "output.jsonl")
+    entity_extraction.output_json = os.path.join(workdir, "output.json")
+    entity_extraction.duplicate_index = open_duplicate_index(workdir, "extraction")
+
+    trace_path = start_trace(workdir, "extraction")
+    started = time.perf_counter()
+    entity_extraction.process_pdfs(corpus_paths)
+    seconds = time.perf_counter() - started
+    calls_saved = close_duplicate_index(entity_extraction.duplicate_index)
+    summary = metrics.summary()
+    requests = summary["counters"].get("api_requests", 0)
+    return [dict(
+        papers=len(corpus_paths), seconds=round(seconds, 2), papers_per_s=round(len(corpus_paths) / seconds, 2),
+        requests=requests, requests_per_s=round(requests / seconds, 2),
+        rate_limited=summary["counters"].get("api_rate_limited", 0),
+        retries=summary["counters"].get("api_retries", 0),
+        duplicate_calls_saved=calls_saved,
+        **latency_stats(trace_path, "api_stream"),
+        **latency_stats(trace_path, "pdf_parse")
+    )]
+
+def bench_output_writes(workdir, sizes):
+    """
+    Appends `size` synthetic chunk results with each output writer and reports the
+    mean time per chunk. `append_to_json` rewrites the whole file on every append.
+    """
+    import entity_extraction
+    from extraction_store import ExtractionStore
+
+    spatial_classifier = ScaleClassifier(scales["spatial_scale"])
+    temporal_classifier = ScaleClassifier(scales["temporal_scale"])
+    rows = []
+    for size in sizes:
+        chunks = [synthetic_extraction(i) for i in range(size)]
+        folder = tempfile.mkdtemp(dir=workdir, prefix=f"writes_{size}_")
+        store = ExtractionStore(os.path.join(folder, "output.sqlite"))
+        writers = {
+            "append_to_json": lambda data, i: entity_extraction.append_to_json(data, os.path.join(folder, "output.json")),
+            "append_to_jsonl": lambda data, i: entity_extraction.append_to_jsonl(
+                data, os.path.join(folder, "output.jsonl"), "synthetic.pdf", i
+            ),
+            "append_to_csv": lambda data, i: entity_extraction.append_to_csv(
+                data, os.path.join(folder, "output.csv"), spatial_classifier, temporal_classifier
+            ),
+            "sqlite_store": lambda data, i: store.add_chunk(
+                "synthetic.pdf", i, data, spatial_classifier, temporal_classifier
+            )
+        }
+        for name, write in writers.items():
+            started = time.perf_counter()
+            for i, data in enumerate(chunks):
+                write(data, i)
+            seconds = time.perf_counter() - started
+            rows.append(dict(
+                writer=name, chunks=size, seconds=round(seconds, 3),
+                ms_per_chunk=round(1000 * seconds / size, 3), chunks_per_s=round(size / seconds)
+            ))
+        store.close()
+    return rows
+
+def classify_spatial(label, spatial_scale):
+    """
+    Baseline classifier replaced by `ScaleClassifier`: scans the keywords of every
+    scale for each label.
+    """
+    if label is None:
+        return "Unknown"
+
+    for scale, keywords in spatial_scale.items():
+        if any(keyword in label for keyword in keywords):
+            return scale
+    return "Unknown"
+
+def bench_classifiers(sizes):
+    """
+    Classifies `size` labels with the per-label keyword scan of `classify_spatial`
+    and with `ScaleClassifier.classify_many`.
+    """
+    classifier = ScaleClassifier(scales["spatial_scale"])
+    rows = []
+    for size in sizes:
+        labels = synthetic_labels(size)
+
+        started = time.perf_counter()
+        scanned = [classify_spatial(label, scales["spatial_scale"]) for label in labels]
+        scan_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        classified = classifier.classify_many(labels)
+        classifier_seconds = time.perf_counter() - started
+
+        agreement = sum(a == b for a, b in zip(scanned, classified)) / size
+        for name, seconds in (("classify_spatial", scan_seconds), ("ScaleClassifier", classifier_seconds)):
+            rows.append(dict(
+                classifier=name, labels=size, seconds=round(seconds, 4),
+                labels_per_s=round(size / seconds), agreement=round(agreement, 4)
+            ))
+    return rows
+
+def bench_stylesheet(sizes, overrides=10, repeats=5):
+    """
+    Builds the stylesheet for graphs of `size` nodes with `build_stylesheet`, once with
+    every node overridden (one rule per node, as before the default rule) and once with
+    `overrides` per-node overrides, and reports the build time and the JSON size sent
+    to the browser.
+    """
+    # Imported from an empty directory so that it does not load a graph at import time
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="stylesheet_"))
+    try:
+        from KG_visualization import build_stylesheet, default_node_style
+    finally:
+        os.chdir(cwd)
+
+    rows = []
+    for size in sizes:
+        node_ids = [f"E{i:012x}" for i in range(size)]
+        per_node_styles = {
+            'default': default_node_style,
+            'overrides': {node_id: default_node_style for node_id in node_ids}
+        }
+        styles = {
+            'default': default_node_style,
+            'overrides': {node_id: dict(default_node_style, width=80) for node_id in node_ids[:overrides]}
+        }
+        builders = {
+            "per_node": lambda: build_stylesheet(per_node_styles),
+            "build_stylesheet": lambda: build_stylesheet(styles)
+        }
+        for name, build in builders.items():
+            started = time.perf_counter()
+            for _ in range(repeats):
+                stylesheet = build()
+                payload = json.dumps(stylesheet)
+            seconds = (time.perf_counter() - started) / repeats
+            rows.append(dict(
+                builder=name, nodes=size, rules=len(stylesheet),
+                ms=round(1000 * seconds, 3), payload_kb=round(len(payload) / 1024, 1)
+            ))
+    return rows
+
+def print_rows(name, rows):
+    print(f"\n== {name} ==")
+    if not rows:
+        return
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(str(row.get(column))) for row in rows)) for column in columns]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(column)).rjust(width) for column, width in zip(columns, widths)))
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Prints the timing columns that got more than `tolerance` slower than in the
+    baseline results (rows are matched by position). Returns the number of regressions.
+    """
+    regressions = 0
+    for name, rows in results.items():
+        for row, baseline_row in zip(rows, baseline.get(name, [])):
+            for column, value in row.items():
+                old = baseline_row.get(column)
+                slower_is_worse = column in ("seconds", "ms", "ms_per_chunk") or column.endswith("_ms")
+                if not slower_is_worse or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old <= 0:
+                    continue
+                if value > old * (1 + tolerance):
+                    regressions += 1
+                    label = ", ".join(f"{key}={row[key]}" for key in list(row)[:2])
+                    print(f"[REGRESSION] {name} ({label}): {column} {old} -> {value}")
+    return regressions
+
+def check_cascade_costs(rows):
+    """
+    Prints every cascade that costs at least as much as scoring with `evaluation_model`
+    alone (the first row of the cascade benchmark). Returns the number of such cascades.
+    """
+    failures = 0
+    for row in rows[1:]:
+        if row["cost"] >= rows[0]["cost"]:
+            failures += 1
+            print(f"[FAILED] {row['variant']} costs ${row['cost']}, not less than {rows[0]['variant']} (${rows[0]['cost']})")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks with a synthetic corpus and the mock completion server")
+    parser.add_argument("--papers", type=int, default=8, help="Number of synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=6, help="Pages per synthetic PDF")
+    parser.add_argument("--near-duplicates", type=int, default=0,
+                        help="Number of papers that also get a near-duplicate copy in the corpus")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock server latency per request (seconds)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Fraction of mock requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After sent with the 429s (seconds)")
+    parser.add_argument("--write-sizes", type=int, nargs="+", default=[100, 400, 1600],
+                        help="Chunk counts for the output writer benchmark")
+    parser.add_argument("--label-sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Label counts for the classifier benchmark")
+    parser.add_argument("--graph-sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000],
+                        help="Node counts for the stylesheet benchmark")
+    parser.add_argument("--malformed", type=float, default=0.0,
+                        help="Fraction of free-text mock answers cut off at a random point")
+    parser.add_argument("--screening-models", nargs="+", default=["gpt-3.5-turbo", "heuristic"],
+                        help="Screening models of the cascade benchmark ('heuristic' for the local scorer)")
+    parser.add_argument("--screening-latency", type=float, default=None,
+                        help="Mock server latency of the screening models (default: a quarter of --latency)")
+    parser.add_argument("--only", nargs="+",
+                        choices=["evaluation", "cascade", "extraction", "formats", "writes", "classifiers", "stylesheet"],
+                        help="Run only these benchmarks")
+    parser.add_argument("--workdir", help="Directory for the corpus and outputs (default: a new temporary directory)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="kg_benchmark_"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)  # Keeps the scripts' relative default paths out of the repository
+    selected = set(args.only or ["evaluation", "cascade", "extraction", "formats", "writes", "classifiers", "stylesheet"])
+
+    mock_completion_server.latency = args.latency
+    mock_completion_server.rate_limit_probability = args.rate_limit
+    mock_completion_server.retry_after = args.retry_after
+    mock_completion_server.malformed_probability = args.malformed
+    mock_completion_server.model_latency = {
+        model: args.screening_latency if args.screening_latency is not None else args.latency / 4
+        for model in args.screening_models if model != "heuristic"
+    }
+    server = mock_completion_server.start_server_thread()
+    os.environ["OPENAI_API_BASE"] = f"http://{server.server_address[0]}:{server.server_address[1]}/v1"
+    openai.api_key = openai.api_key or "mock"
+    print(f"Working directory: {workdir}")
+    print(f"Mock server: {os.environ['OPENAI_API_BASE']} (latency {args.latency}s, 429 rate {args.rate_limit})")
+
+    results = {}
+    if selected & {"evaluation", "cascade", "extraction", "formats"}:
+        started = time.perf_counter()
+        corpus_paths = generate_corpus(
+            os.path.join(workdir, "corpus"), args.papers, args.pages, near_duplicates=args.near_duplicates
+        )
+        print(f"Generated {len(corpus_paths)} PDFs of {args.pages} pages in {time.perf_counter() - started:.1f}s")
+        if "evaluation" in selected:
+            results["evaluation"] = bench_evaluation(os.path.join(workdir, "corpus"), workdir)
+        if "cascade" in selected:
+            results["cascade"] = bench_cascade(os.path.join(workdir, "corpus"), workdir, args.screening_models)
+        if "extraction" in selected:
+            results["extraction"] = bench_extraction(corpus_paths, workdir)
+        if "formats" in selected:
+            results["formats"] = bench_output_formats(corpus_paths, workdir)
+    if "writes" in selected:
+        results["writes"] = bench_output_writes(workdir, args.write_sizes)
+    if "classifiers" in selected:
+        results["classifiers"] = bench_classifiers(args.label_sizes)
+    if "stylesheet" in selected:
+        results["stylesheet"] = bench_stylesheet(args.graph_sizes)
+    server.shutdown()
+    metrics.close()
+
+    for name, rows in results.items():
+        print_rows(name, rows)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "results": results
+        }, f, indent=4)
+    print(f"\nResults written to {output_path}")
+
+    failures = check_cascade_costs(results["cascade"]) if "cascade" in results else 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline)
+        print(f"{regressions} regression(s) against {args.baseline}")
+        failures += regressions
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,182 @@
+import re
+import zlib
+import threading
+
+# Keywords of the domains named in the scoring prompt, used by the local screening scorer
+domain_keywords = {
+    "plant physiology": ["stomat", "transpiration", "water potential", "leaf", "guard cell", "turgor", "phloem", "xylem"],
+    "biochemistry": ["rubisco", "enzyme", "calvin", "carboxylat", "atp", "nadph", "metabol", "kinetic"],
+    "photochemistry": ["photosystem", "electron transport", "quenching", "fluorescence", "light harvesting", "excitation", "chlorophyll"],
+    "plant architecture": ["canopy", "leaf angle", "morpholog", "mesophyll", "root", "vertical structure"],
+    "environmental science": ["co2", "drought", "temperature", "nitrogen", "soil", "vapour pressure", "vapor pressure"],
+    "agronomy": ["yield", "crop", "cultivar", "irrigation", "fertili", "wheat", "maize", "rice"],
+    "climatology": ["climate", "warming", "precipitation", "season", "microclimate", "diurnal"],
+    "environmental engineering": ["model", "sensor", "remote sensing", "bioreactor", "simulation", "measurement"]
+}
+
+# Keywords match at the start of a word, so "root" does not match "uprooted"
+domain_patterns = {
+    domain: re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + ")")
+    for domain, keywords in domain_keywords.items()
+}
+
+word_pattern = re.compile(r"\w+")
+
+# Lines that look like entries of a reference list
+reference_line_pattern = re.compile(r"\(\d{4}[a-z]?\)|\bet al\.|\bdoi\b|\b\d+\s*[,:(]\s*\d+\s*[-–]\s*\d+|^\s*\[\d+\]", re.IGNORECASE)
+
+def heuristic_scores(chunk):
+    """
+    Local screening scorer: returns rough (scientific_depth, domain_coverage) scores
+    from the density of domain keywords and the number of domains they come from.
+    Chunks that read like reference lists or have no domain vocabulary score near 0.
+    """
+    text = chunk.lower()
+    words = len(word_pattern.findall(text))
+    if words == 0:
+        return 0.0, 0.0
+
+    hits = {domain: len(pattern.findall(text)) for domain, pattern in domain_patterns.items()}
+    lines = [line for line in chunk.splitlines() if line.strip()]
+    reference_share = sum(1 for line in lines if reference_line_pattern.search(line)) / len(lines) if lines else 0.0
+
+    density = 100 * sum(hits.values()) / words  # Domain keywords per 100 words
+    scientific_depth = min(10.0, density / 2) * (1 - reference_share)
+    domain_coverage = min(10.0, 10 * sum(1 for count in hits.values() if count) / 6) * (1 - reference_share)
+    return round(scientific_depth, 2), round(domain_coverage, 2)
+
+def in_band(scores, band):
+    """
+    Returns True if both scores lie within the (low, high) uncertainty band. A chunk
+    with either score clearly outside it keeps its screening scores.
+    """
+    low, high = band
+    return all(low <= score <= high for score in scores)
+
+def audit_sample(chunk, rate):
+    """
+    Returns True for a fixed fraction `rate` of chunks, chosen by a hash of the chunk
+    text so the same chunks are audited on every run.
+    """
+    return zlib.crc32(chunk.encode("utf-8")) / 2 ** 32 < rate
+
+class CascadeStats:
+    """
+    Thread-safe record of the chunks scored by a model cascade: the screening scores,
+    the final scores, whether the chunk was escalated (and whether as an audit sample),
+    the time spent and the estimated tokens of each tier. `report` compares the cascade
+    with scoring every chunk with the expensive model.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self._lock = threading.Lock()
+
+    def record(self, screening, final, escalated, audited, screening_seconds, escalation_seconds,
+               screening_usage, escalation_usage, baseline_prompt_tokens):
+        with self._lock:
+            self.chunks.append({
+                "screening": screening, "final": final, "escalated": escalated, "audited": audited,
+                "screening_seconds": screening_seconds, "escalation_seconds": escalation_seconds,
+                "screening_usage": screening_usage, "escalation_usage": escalation_usage,
+                "baseline_prompt_tokens": baseline_prompt_tokens
+            })
+
+    @staticmethod
+    def drift(pairs):
+        """
+        Returns the mean and mean absolute difference (expensive minus screening model)
+        of both scores over (screening, final) pairs.
+        """
+        if not pairs:
+            return None
+        return {
+            "chunks": len(pairs),
+            "depth_mean": round(sum(final[0] - screening[0] for screening, final in pairs) / len(pairs), 3),
+            "depth_mean_abs": round(sum(abs(final[0] - screening[0]) for screening, final in pairs) / len(pairs), 3),
+            "coverage_mean": round(sum(final[1] - screening[1] for screening, final in pairs) / len(pairs), 3),
+            "coverage_mean_abs": round(sum(abs(final[1] - screening[1]) for screening, final in pairs) / len(pairs), 3)
+        }
+
+    def report(self, token_totals, prices, screening_model, evaluation_model, completion_tokens_estimate=300):
+        """
+        Returns the cascade report. `prices` are the (prompt, completion) price per 1000
+        tokens of each model. The cascade cost is estimated from the tokens of every
+        request, answered from the response cache or not, and the all-expensive-model
+        baseline from the prompt tokens of every chunk and the mean completion tokens and
+        latency of the escalated requests, so both are priced alike. `api_cost` is what
+        the run actually paid according to `token_totals`, the per-model token totals of
+        the run (see Metrics.summary), in which cache hits are free.
+        """
+        with self._lock:
+            chunks = list(self.chunks)
+        if not chunks:
+            return None
+
+        def cost(model, prompt_tokens, completion_tokens):
+            prompt_price, completion_price = prices.get(model, (0.0, 0.0))
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+        def usage_cost(model, usage):
+            return cost(model, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+        escalated = [chunk for chunk in chunks if chunk["escalated"]]
+        expensive_seconds = [chunk["escalation_seconds"] for chunk in escalated if chunk["escalation_seconds"] is not None]
+        expensive_completions = [chunk["escalation_usage"]["completion_tokens"] for chunk in escalated if chunk["escalation_usage"]]
+        completion_tokens = (
+            sum(expensive_completions) / len(expensive_completions) if expensive_completions else completion_tokens_estimate
+        )
+
+        cascade_cost = sum(
+            usage_cost(screening_model, chunk["screening_usage"]) + usage_cost(evaluation_model, chunk["escalation_usage"])
+            for chunk in chunks
+        )
+        baseline_cost = sum(
+            cost(evaluation_model, chunk["baseline_prompt_tokens"], completion_tokens) for chunk in chunks
+        )
+        api_cost = sum(
+            cost(model, totals.get("prompt_tokens", 0), totals.get("completion_tokens", 0))
+            for model, totals in token_totals.items() if model in (screening_model, evaluation_model)
+        )
+        cascade_seconds = sum(chunk["screening_seconds"] + (chunk["escalation_seconds"] or 0) for chunk in chunks)
+        baseline_seconds = len(chunks) * sum(expensive_seconds) / len(expensive_seconds) if expensive_seconds else None
+
+        def pairs(selected):
+            return [
+                (chunk["screening"], chunk["final"]) for chunk in selected
+                if chunk["escalated"] and chunk["screening"] is not None and chunk["final"] is not None
+            ]
+
+        return {
+            "screening_model": screening_model,
+            "evaluation_model": evaluation_model,
+            "chunks": len(chunks),
+            "escalated": len(escalated),
+            "audited": sum(1 for chunk in chunks if chunk["audited"]),
+            "cost": round(cascade_cost, 4),
+            "baseline_cost": round(baseline_cost, 4),
+            "api_cost": round(api_cost, 4),
+            "seconds_per_chunk": round(cascade_seconds / len(chunks), 4),
+            "baseline_seconds_per_chunk": round(baseline_seconds / len(chunks), 4) if baseline_seconds is not None else None,
+            # The audit sample is escalated regardless of its screening scores, so it
+            # estimates the drift of the chunks that were not escalated
+            "drift_audited": self.drift(pairs([chunk for chunk in chunks if chunk["audited"]])),
+            "drift_escalated": self.drift(pairs(escalated))
+        }
+
+def print_cascade_report(report):
+    if report is None:
+        return
+    print(f"Cascade: {report['escalated']} of {report['chunks']} chunks escalated from {report['screening_model']} "
+          f"to {report['evaluation_model']} ({report['audited']} audit samples)")
+    print(f"  cost ${report['cost']:.4f} vs. ${report['baseline_cost']:.4f} estimated for {report['evaluation_model']} only "
+          f"(${report['api_cost']:.4f} paid, net of cached answers)")
+    if report["baseline_seconds_per_chunk"] is not None:
+        print(f"  {report['seconds_per_chunk']:.3f}s per chunk vs. {report['baseline_seconds_per_chunk']:.3f}s estimated "
+              f"for {report['evaluation_model']} only")
+    for name in ("drift_audited", "drift_escalated"):
+        drift = report[name]
+        if drift:
+            print(f"  score drift ({name[6:]}, {drift['chunks']} chunks): depth {drift['depth_mean']:+.2f} "
+                  f"(mean abs {drift['depth_mean_abs']:.2f}), coverage {drift['coverage_mean']:+.2f} "
+                  f"(mean abs {drift['coverage_mean_abs']:.2f})")
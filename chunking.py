@@ -0,0 +1,255 @@
+import os
+import re
+import sys
+from section_index import heading_line_pattern
+
+# Sentence ends: terminal punctuation followed by whitespace and an upper-case letter, digit or bracket
+sentence_boundary_pattern = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+word_piece_pattern = re.compile(r"\w+|[^\w\s]")
+
+def approximate_token_count(text):
+    """
+    Offline token estimate used when no tokenizer is installed:
+    about one token per four characters of each word, one per punctuation mark.
+    """
+    return sum((len(piece) + 3) // 4 for piece in word_piece_pattern.findall(text))
+
+def get_token_counter(model=None):
+    """
+    Returns a function counting the tokens of a string. Uses the model's
+    tiktoken encoding if tiktoken is installed, otherwise `approximate_token_count`.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return approximate_token_count
+
+    try:
+        encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+def chunk_budget(context_window, prompt_tokens, response_tokens):
+    """
+    Returns the number of tokens left for chunk text once the prompt
+    and the expected response are accounted for.
+    """
+    return max(context_window - prompt_tokens - response_tokens, 1)
+
+def split_sentences(text):
+    """
+    Splits text into sentences with whitespace normalized to single spaces.
+    """
+    text = re.sub(r"(\w)-\s*\n\s*(\w)", r"\1\2", text)  # Re-join words hyphenated across lines
+    sentences = []
+    for sentence in sentence_boundary_pattern.split(text):
+        sentence = " ".join(sentence.split())
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+def split_oversized(sentence, max_tokens, count_tokens):
+    """
+    Splits a sentence longer than `max_tokens` at word boundaries.
+    """
+    if count_tokens(sentence) <= max_tokens:
+        return [sentence]
+
+    pieces = []
+    words = []
+    tokens = 0
+    for word in sentence.split():
+        word_tokens = count_tokens(word)
+        if words and tokens + word_tokens > max_tokens:
+            pieces.append(" ".join(words))
+            words = []
+            tokens = 0
+        words.append(word)
+        tokens += word_tokens
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+def iter_chunks(pieces, max_tokens, overlap_tokens=0, count_tokens=approximate_token_count, min_section_fill=0.5):
+    """
+    Packs sentences into chunks of at most `max_tokens` tokens, as measured by `count_tokens`,
+    and yields each chunk as soon as it is full.
+
+    `pieces` is a string or an iterable of consecutive text pieces (e.g. pages), consumed
+    lazily: only the text after the last complete sentence is kept between pieces, so
+    the chunker's own state does not grow with the length of the document.
+
+    Chunks end on sentence boundaries, and a new section starts a new chunk once the
+    current chunk is at least `min_section_fill` full. The last sentences of a chunk, up to
+    `overlap_tokens`, are repeated at the start of the next chunk within the same section.
+    """
+    if isinstance(pieces, str):
+        pieces = [pieces]
+
+    current = []  # (sentence, tokens) pairs
+    current_tokens = 0
+    fresh = False  # Whether `current` holds anything beyond the carried-over overlap
+
+    def flush(carry):
+        nonlocal current, current_tokens, fresh
+        chunk = " ".join(sentence for sentence, _ in current) if fresh else None
+
+        carried = []
+        carried_tokens = 0
+        if carry and fresh:
+            for sentence, tokens in reversed(current):
+                if carried_tokens + tokens > overlap_tokens:
+                    break
+                carried.insert(0, (sentence, tokens))
+                carried_tokens += tokens
+        current = carried
+        current_tokens = carried_tokens
+        fresh = False
+        return chunk
+
+    def add_text(text, section_start):
+        nonlocal current, current_tokens, fresh
+        if section_start and fresh and current_tokens >= min_section_fill * max_tokens:
+            yield flush(carry=False)
+
+        for sentence in split_sentences(text):
+            for piece in split_oversized(sentence, max_tokens, count_tokens):
+                tokens = count_tokens(piece)
+                if current and current_tokens + tokens > max_tokens:
+                    chunk = flush(carry=True)
+                    if chunk is not None:
+                        yield chunk
+                    if current_tokens + tokens > max_tokens:
+                        # The overlap does not leave room for this sentence
+                        current = []
+                        current_tokens = 0
+                current.append((piece, tokens))
+                current_tokens += tokens
+                fresh = True
+
+    def add_sections(text, final):
+        """
+        Adds the complete sections and sentences of `text`. Returns the unprocessed rest
+        (from the last sentence boundary on), which is empty if `final`.
+        """
+        starts = [match.start() for match in heading_line_pattern.finditer(text)]
+        bounds = sorted(set([0] + starts))
+        ends = bounds[1:] + [len(text)]
+        for start, end in zip(bounds, ends):
+            section = text[start:end]
+            if end == len(text) and not final:
+                # The last section may continue in the next piece: keep its last sentence
+                last_boundary = None
+                for last_boundary in sentence_boundary_pattern.finditer(section):
+                    pass
+                if last_boundary is None:
+                    return section
+                yield from add_text(section[:last_boundary.start()], start in starts)
+                return section[last_boundary.end():]
+            if section.strip():
+                yield from add_text(section, start in starts)
+        return ""
+
+    rest = ""
+    for piece in pieces:
+        rest += piece
+        # Only complete lines can be told apart from section headings
+        cut = rest.rfind("\n") + 1
+        if cut:
+            remainder = yield from add_sections(rest[:cut], final=False)
+            rest = remainder + rest[cut:]
+    yield from add_sections(rest, final=True)
+
+    chunk = flush(carry=False)
+    if chunk is not None:
+        yield chunk
+
+def chunk_by_tokens(text, max_tokens, overlap_tokens=0, count_tokens=approximate_token_count, min_section_fill=0.5):
+    """
+    Returns the chunks of `iter_chunks` as a list.
+    """
+    return list(iter_chunks(text, max_tokens, overlap_tokens, count_tokens, min_section_fill))
+
+def split_by_characters(text, max_chars=4000):
+    """
+    Previous paper_evaluation.py chunker: words packed up to `max_chars` characters.
+    Kept as a baseline for `chunk_count_report`.
+    """
+    chunks = []
+    chunk = []
+    chunk_length = 0
+    for word in text.split():
+        chunk.append(word)
+        chunk_length += len(word) + 1
+        if chunk_length >= max_chars:
+            chunks.append(' '.join(chunk))
+            chunk = []
+            chunk_length = 0
+    if chunk:
+        chunks.append(' '.join(chunk))
+    return chunks
+
+def split_by_words(text, chunk_size=1500):
+    """
+    Previous entity_extraction.py chunker: fixed groups of `chunk_size` words.
+    Kept as a baseline for `chunk_count_report`.
+    """
+    words = text.split()
+    return [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+
+def chunk_count_report(texts, chunkers, count_tokens=approximate_token_count):
+    """
+    Runs each chunker (name -> function of text) over the corpus and returns
+    {name: {"chunks": ..., "mean_tokens": ...}}.
+    """
+    report = {name: {"chunks": 0, "tokens": 0} for name in chunkers}
+    for text in texts:
+        for name, chunker in chunkers.items():
+            chunks = chunker(text)
+            report[name]["chunks"] += len(chunks)
+            report[name]["tokens"] += sum(count_tokens(chunk) for chunk in chunks)
+
+    for stats in report.values():
+        stats["mean_tokens"] = stats.pop("tokens") / stats["chunks"] if stats["chunks"] else 0.0
+    return report
+
+def read_corpus(paths):
+    """
+    Yields the text of every .txt or .pdf file among `paths` (files or folders).
+    PDFs are read with PyMuPDF.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            yield from read_corpus(sorted(os.path.join(path, name) for name in os.listdir(path)))
+        elif path.endswith(".txt"):
+            with open(path, 'r', encoding='utf-8') as f:
+                yield f.read()
+        elif path.endswith(".pdf"):
+            import fitz  # PyMuPDF
+            with fitz.open(path) as doc:
+                yield "".join(page.get_text() for page in doc)
+
+if __name__ == "__main__":
+    # Example: python chunking.py /path/to/your/papers 6000
+    corpus_path = sys.argv[1]
+    max_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 6000
+    count_tokens = get_token_counter("gpt-4")
+
+    report = chunk_count_report(
+        read_corpus([corpus_path]),
+        {
+            "characters (4000)": split_by_characters,
+            "words (1500)": split_by_words,
+            f"tokens ({max_tokens})": lambda text: chunk_by_tokens(text, max_tokens, count_tokens=count_tokens),
+        },
+        count_tokens=count_tokens
+    )
+    for name, stats in report.items():
+        print(f"{name:>20}: {stats['chunks']} chunks, {stats['mean_tokens']:.0f} tokens per chunk on average")
+
+    baseline = min(stats["chunks"] for name, stats in report.items() if not name.startswith("tokens"))
+    packed = report[f"tokens ({max_tokens})"]["chunks"]
+    if baseline:
+        print(f"Chunk-count reduction vs. the smaller baseline: {100 * (1 - packed / baseline):.1f}%")
@@ -0,0 +1,133 @@
+import json
+
+# Compact function-calling schemas: the model answers with the arguments of a forced
+# function call instead of free-text JSON, and records are arrays instead of objects
+# with repeated field names, so answers are shorter and always have the same shape.
+
+extraction_function = {
+    "name": "record_graph",
+    "description": "Records the entities and relationships found in the text.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "e": {
+                "type": "array",
+                "description": "Entities as [id, label, type, property...]; ids are short (e1, e2, ...) "
+                               "and each optional property is a \"key=value\" string",
+                "items": {"type": "array", "items": {"type": "string"}, "minItems": 3}
+            },
+            "r": {
+                "type": "array",
+                "description": "Relationships as [from_id, to_id, TYPE] between entity ids",
+                "items": {"type": "array", "items": {"type": "string"}, "minItems": 3, "maxItems": 3}
+            }
+        },
+        "required": ["e", "r"]
+    }
+}
+
+scoring_function = {
+    "name": "record_scores",
+    "description": "Records the scores of the section.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "d": {"type": "number", "minimum": 0, "maximum": 10, "description": "Scientific depth (0.00 to 10.00)"},
+            "c": {"type": "number", "minimum": 0, "maximum": 10, "description": "Domain coverage (0.00 to 10.00)"}
+        },
+        "required": ["d", "c"]
+    }
+}
+
+def function_call_request(function):
+    """
+    Returns the ChatCompletion parameters that make the model answer by calling `function`.
+    """
+    return {"functions": [function], "function_call": {"name": function["name"]}}
+
+def schema_cache_prompt(system_prompt, function):
+    """
+    Returns the system prompt under which schema-constrained answers are cached, so
+    they are never served to free-text requests (or the other way round).
+    """
+    return f"{system_prompt}\n{json.dumps(function, sort_keys=True)}"
+
+def message_text(message):
+    """
+    Returns the answer of a ChatCompletion message: the function call arguments if
+    the model called a function, otherwise the content.
+    """
+    function_call = message.get("function_call")
+    if function_call and function_call.get("arguments") is not None:
+        return function_call["arguments"]
+    return message.get("content")
+
+def decode_entity(item):
+    """
+    Expands a compact entity [id, label, type, "key=value"...] into an entity object.
+    """
+    if not isinstance(item, list) or len(item) < 3:
+        return None
+    properties = {}
+    for pair in item[3:]:
+        key, separator, value = str(pair).partition("=")
+        if separator:
+            properties[key.strip()] = value.strip()
+    return {"id": str(item[0]), "label": item[1], "type": item[2], "properties": properties}
+
+def decode_relationship(item):
+    """
+    Expands a compact relationship [from_id, to_id, TYPE] into a relationship object.
+    """
+    if not isinstance(item, list) or len(item) < 3:
+        return None
+    return {"from": str(item[0]), "to": str(item[1]), "type": item[2]}
+
+# Compact array keys, the record kinds they hold and their decoders
+compact_kinds = {"e": "entities", "r": "relationships"}
+compact_decoders = {"e": decode_entity, "r": decode_relationship}
+
+def expand_compact_extraction(data):
+    """
+    Expands parsed `record_graph` arguments into {"entities": [...], "relationships": [...]}.
+    """
+    expanded = {"entities": [], "relationships": []}
+    for key, kind in compact_kinds.items():
+        for item in data.get(key) or []:
+            record = compact_decoders[key](item)
+            if record is not None:
+                expanded[kind].append(record)
+    return expanded
+
+def parse_score_arguments(arguments):
+    """
+    Parses `record_scores` arguments. Returns a (scientific_depth, domain_coverage)
+    tuple, or None if they are not valid.
+    """
+    try:
+        data = json.loads(arguments)
+        return float(data["d"]), float(data["c"])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+def output_stats(counters, task):
+    """
+    Returns the responses, output tokens per response and parse-failure rate of a task
+    ("extraction" or "scoring") from the metrics counters.
+    """
+    responses = counters.get(f"{task}_responses", 0)
+    if not responses:
+        return None
+    return {
+        "responses": responses,
+        "output_tokens_per_response": round(counters.get(f"{task}_output_tokens", 0) / responses, 1),
+        "parse_failure_rate": round(counters.get(f"{task}_parse_failures", 0) / responses, 4),
+        "partial_parse_rate": round(counters.get(f"{task}_parse_partial", 0) / responses, 4)
+    }
+
+def print_output_stats(stats, task, mode):
+    if stats is None:
+        return
+    print(f"{task.capitalize()} responses ({mode}): {stats['output_tokens_per_response']} output tokens per chunk, "
+          f"{100 * stats['parse_failure_rate']:.1f}% parse failures, "
+          f"{100 * stats['partial_parse_rate']:.1f}% partially parsed ({stats['responses']} responses)")
@@ -1,160 +1,196 @@
 import os
+import sys
+import argparse
 import json
 import csv
+import threading
 import time
-import fitz  # PyMuPDF
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import openai
+from pdf_pipeline import iter_extracted_texts, open_text_cache, default_text_extractor, extractor_version
+from llm_cache import LLMCache
+from text_cache import TextCache
+from run_ledger import RunLedger, file_document_id
+from batch_jobs import parse_custom_id, append_document_requests, iter_batch_results
+from scale_classifier import ScaleClassifier, load_scales
+from entity_index import EntityIndex, is_canonical_id
+from extraction_store import ExtractionStore
+from json_stream import IncrementalJSONParser
+from compact_schema import (
+    extraction_function, function_call_request, schema_cache_prompt, message_text,
+    compact_kinds, compact_decoders, expand_compact_extraction, output_stats, print_output_stats
+)
+from chunking import iter_chunks, chunk_budget, get_token_counter
+from section_index import SectionIndex, section_names, find_sections, select_sections
+from near_duplicates import NearDuplicateIndex, task_scope, print_report
+from api_client import RateLimitedClient, request_prompt_tokens
+from metrics import metrics, paper_context, start_metrics_server
 
 # Set your OpenAI API key here
 # Example: openai.api_key = os.getenv("OPENAI_API_KEY")
 openai.api_key = "YOUR_OPENAI_API_KEY"
 
+# Optionally point the client at another endpoint, e.g. the local mock server
+# Example: OPENAI_API_BASE=http://127.0.0.1:8000/v1 (see mock_completion_server.py)
+openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+
 # Folder containing the PDF files to process
 # Example: folder_path = "/path/to/your/papers"
 folder_path = "/path/to/your/papers"
 
 # Define output file names or paths
-chunk_file_path = "chunks.json"
-checkpoint_file = "checkpoint.txt"
+ledger_path = "extraction_ledger.sqlite"  # Per-document chunk manifest and completion state
 output_csv = "output.csv"
 output_json = "output.json"
-
-class PDFParser:
-    def __init__(self, pdf_path):
-        self.pdf_path = pdf_path
-
-    def extract_text(self):
-        """
-        Extracts text from the PDF file using PyMuPDF (fitz).
-        """
-        try:
-            doc = fitz.open(self.pdf_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            return text
-        except Exception as e:
-            print(f"Failed to extract text from {self.pdf_path}: {e}")
-            return ""
-
-    def extract_abstract_or_full_text(self):
-        """
-        Attempts to extract only the 'Abstract' section. If not found, 
-        returns the full text.
-        """
-        text = self.extract_text()
-
-        # Search for Abstract keywords
-        abstract_start_keywords = ["Abstract", "ABSTRACT", "A B S T R A C T"]
-        abstract_text = None
-
-        for keyword in abstract_start_keywords:
-            if keyword in text:
-                start_index = text.find(keyword) + len(keyword)
-                abstract_text = text[start_index:].strip()
-                break
-
-        # If Abstract is not found, use full text
-        if abstract_text:
-            return abstract_text
-        else:
-            print("[INFO] Abstract not found, using full text instead.")
-            return text
-
-def chunk_text(text, chunk_size=1500):
+output_jsonl = "output.jsonl"  # Append-only record store that output_json is exported from
+
+# Optional SQLite store of entities, relationships and their source chunks (e.g. "output.sqlite")
+output_sqlite = None
+output_store = None  # Opened in __main__
+
+# Number of PDFs whose chunks are sent to the API concurrently
+max_concurrent_documents = 4
+
+# Account rate limits (requests and tokens per minute; None for no limit)
+requests_per_minute = None
+tokens_per_minute = None
+
+# Serializes writes to the shared output files across documents
+output_lock = threading.Lock()
+
+# PDF parsing processes, and parsed texts waiting for the API stage
+extraction_workers = os.cpu_count()
+extraction_queue_size = 8
+
+# PDF text extractor; "PyMuPDF" gives the text of earlier versions of this script
+text_extractor = default_text_extractor
+
+# Model and prompts used for entity and relationship extraction
+extraction_model = "gpt-4"  # Adjust model if needed
+extraction_system_prompt = "You are a helpful assistant."
+
+# Answer with a record_graph function call instead of free-text JSON (or pass --structured)
+structured_outputs = False
+
+# Stream responses and parse each entity and relationship as it arrives
+stream_responses = True
+
+# Attempts at a chunk before its partial records are kept and its document marked "incomplete"
+max_chunk_attempts = 3
+
+# Chunking: the model's context window, the answer's token limit, and the chunk size and overlap
+model_context_window = 8192
+extraction_max_tokens = 2048
+chunk_target_tokens = 3000  # Below the context budget so the answer can list every entity
+chunk_overlap_tokens = 0
+count_tokens = get_token_counter(extraction_model)
+chunk_max_tokens = min(
+    chunk_target_tokens,
+    chunk_budget(model_context_window, count_tokens(extraction_system_prompt) + 50, extraction_max_tokens)
+)
+
+# Settings that determine the chunks of a text, part of each document's ID in the run ledger
+chunk_parameters = {"max_tokens": chunk_max_tokens, "overlap_tokens": chunk_overlap_tokens, "model": extraction_model}
+
+# Paths to the metrics trace and summary, and the Prometheus port (None to disable)
+metrics_trace_path = "extraction_trace.jsonl"
+metrics_summary_path = "extraction_metrics.json"
+metrics_port = None
+
+# API client shared by every document: rate limits, retries and adaptive concurrency
+api_client = RateLimitedClient(
+    requests_per_minute=requests_per_minute,
+    tokens_per_minute=tokens_per_minute,
+    max_concurrency=max_concurrent_documents,
+    count_tokens=count_tokens
+)
+
+# Response cache shared with paper_evaluation.py, and its size and age limits (None to disable)
+llm_cache_path = "llm_cache.sqlite"
+llm_cache_max_entries = 200000
+llm_cache_max_age = 90 * 24 * 3600
+response_cache = None  # Opened in __main__
+
+# Near-duplicate chunks: record of matches (None to disable), similarity threshold, "reuse" or "skip"
+near_duplicates_path = "near_duplicates.sqlite"
+near_duplicate_threshold = 0.85
+near_duplicate_action = "reuse"
+near_duplicate_wait = 600
+duplicate_index = None  # Opened in __main__
+
+# Sections of each paper sent to the API, or None for the whole text (or pass --sections)
+selected_sections = ["abstract"]
+
+# Record of the sections found in each PDF (None to disable)
+section_index_path = "section_index.sqlite"
+section_index = None  # Opened in __main__
+
+# Cache of extracted PDF pages, shared with paper_evaluation.py (None to disable)
+text_cache_path = "text_cache.sqlite"
+text_cache = None  # Opened in __main__
+
+# Keyword vocabularies used to classify entities by spatial and temporal scale
+scales_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scales.json")
+scale_case_insensitive = False
+
+scales = load_scales(scales_config_path)
+spatial_scale = scales["spatial_scale"]
+temporal_scale = scales["temporal_scale"]
+
+# Classifiers compiled once from the scale vocabularies and shared by every document
+spatial_classifier = ScaleClassifier(spatial_scale, case_insensitive=scale_case_insensitive)
+temporal_classifier = ScaleClassifier(temporal_scale, case_insensitive=scale_case_insensitive)
+
+# Entity canonicalization: index path (None to disable), alias table and fuzzy match threshold
+entity_index_path = "entity_index.json"
+entity_aliases_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "entity_aliases.json")
+fuzzy_match_threshold = 0.85  # None to disable fuzzy matching
+entity_index = None  # Opened in __main__
+entity_index_save_interval = 300  # Seconds between saves of the index during a run
+
+def chunk_text(pieces, max_tokens=chunk_max_tokens):
     """
-    Splits the text into chunks of words. Each chunk contains up to `chunk_size` words.
-    """
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), chunk_size):
-        chunks.append(' '.join(words[i:i + chunk_size]))
-    return chunks
-
-def save_chunks_to_file(chunks, file_path):
-    """
-    Saves the list of text chunks to a JSON file.
-    """
-    with open(file_path, 'w') as f:
-        json.dump(chunks, f)
-
-def load_chunks_from_file(file_path):
+    Yields the chunks of the text (a string or consecutive pieces such as pages) as
+    they fill, each of up to `max_tokens` tokens, ending on sentence boundaries and
+    starting new sections in new chunks where possible.
     """
-    Loads text chunks from a JSON file if it exists.
-    """
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    return None
-
-def save_checkpoint(filename, chunk_index):
-    """
-    Saves checkpoint data (current file name and chunk index) to resume processing.
-    """
-    with open(checkpoint_file, 'w') as f:
-        f.write(f"{filename},{chunk_index}")
-
-def load_checkpoint():
-    """
-    Loads checkpoint data from the file to determine the last processed chunk index.
-    """
-    if os.path.exists(checkpoint_file):
-        with open(checkpoint_file, 'r') as f:
-            data = f.read().strip()
-            if data:
-                filename, chunk_index = data.split(',')
-                return filename, int(chunk_index)
-    return None, 0
-
-def classify_spatial(label, spatial_scale):
-    """
-    Determines the spatial classification of an entity 
-    based on predefined keywords in `spatial_scale`.
-    """
-    if label is None:
-        return "Unknown"
-    
-    for scale, keywords in spatial_scale.items():
-        if any(keyword in label for keyword in keywords):
-            return scale
-    return "Unknown"
-
-def classify_temporal(label, temporal_scale):
-    """
-    Determines the temporal classification of an entity 
-    based on predefined keywords in `temporal_scale`.
-    """
-    if label is None:
-        return "Unknown"
-    
-    for scale, keywords in temporal_scale.items():
-        if any(keyword in label for keyword in keywords):
-            return scale
-    return "Unknown"
-
-def append_to_csv(data, filename, spatial_scale, temporal_scale):
+    chunks = iter_chunks(pieces, max_tokens, overlap_tokens=chunk_overlap_tokens, count_tokens=count_tokens)
+    while True:
+        with metrics.timer("chunking"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def append_to_csv(data, filename, spatial_classifier, temporal_classifier):
     """
     Appends extracted entities and relationships to a CSV file.
-    Each entity is classified according to spatial and temporal scales.
+    Each entity is classified according to spatial and temporal scales;
+    the labels of the whole chunk are classified in one pass per classifier.
     """
+    entities = [
+        entity for entity in data.get("entities", [])
+        if entity.get("type") not in ["publication", "organization"]
+    ]
+    labels = [entity.get("label") for entity in entities]
+    spatial_labels = spatial_classifier.classify_many(labels)
+    temporal_labels = temporal_classifier.classify_many(labels)
+
     file_exists = os.path.isfile(filename)
     with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
         if not file_exists:
             writer.writerow(["Entity/Relationship", "Label/Type", "Spatial Scale", "Temporal Scale", "Properties/From", "To"])
         
-        for entity in data.get("entities", []):
-            if entity.get("type") not in ["publication", "organization"]:
-                spatial_label = classify_spatial(entity.get("label"), spatial_scale)
-                temporal_label = classify_temporal(entity.get("label"), temporal_scale)
-                writer.writerow([
-                    "Entity",
-                    entity.get("label"),
-                    spatial_label,
-                    temporal_label,
-                    json.dumps(entity.get("properties"), ensure_ascii=False),
-                    ""
-                ])
+        for entity, spatial_label, temporal_label in zip(entities, spatial_labels, temporal_labels):
+            writer.writerow([
+                "Entity",
+                entity.get("label"),
+                spatial_label,
+                temporal_label,
+                json.dumps(entity.get("properties"), ensure_ascii=False),
+                ""
+            ])
 
         for relationship in data.get("relationships", []):
             writer.writerow([
@@ -180,6 +216,7 @@ def append_to_json(data, filename):
             existing_data["relationships"].extend(data.get("relationships", []))
             file.seek(0)
             json.dump(existing_data, file, ensure_ascii=False, indent=4)
+            file.truncate()
     else:
         with open(filename, 'w', encoding='utf-8') as file:
             json.dump({
@@ -189,107 +226,711 @@ def append_to_json(data, filename):
                 "relationships": data.get("relationships", [])
             }, file, ensure_ascii=False, indent=4)
 
-def extract_entities_and_relationships(text):
+def append_to_jsonl(data, filename, source=None, chunk_index=None):
+    """
+    Appends extracted entities and relationships to a JSON-Lines record store,
+    one record per line. Unlike `append_to_json`, the cost of each append does not
+    grow with the size of the file; use `export_jsonl_to_json` to produce the
+    aggregated JSON.
+    """
+    lines = []
+    for entity in data.get("entities", []):
+        if entity.get("type") not in ["publication", "organization"]:
+            lines.append({"kind": "entity", "source": source, "chunk": chunk_index, "data": entity})
+    for relationship in data.get("relationships", []):
+        lines.append({"kind": "relationship", "source": source, "chunk": chunk_index, "data": relationship})
+
+    if not lines:
+        return
+
+    payload = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+    with open(filename, 'a+b') as file:
+        # Start on a fresh line if an interrupted run left a partial record behind
+        file.seek(0, os.SEEK_END)
+        if file.tell() > 0:
+            file.seek(-1, os.SEEK_END)
+            if file.read(1) != b"\n":
+                payload = b"\n" + payload
+        file.write(payload)
+
+def iter_jsonl_records(filename):
+    """
+    Yields the records stored by `append_to_jsonl`. A truncated last line
+    (e.g. from an interrupted run) is skipped.
+    """
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[WARN] Skipping malformed record in {filename}: {line[:100]}")
+
+def export_jsonl_to_json(jsonl_filename, json_filename):
+    """
+    Compacts the JSON-Lines record store into the aggregated
+    {"entities": [...], "relationships": [...]} JSON file.
+    Entities sharing a canonical ID are merged into one entry listing their
+    other labels as "aliases", and identical relationships are merged, both
+    with a "mentions" count.
+    """
+    entities = {}
+    relationships = {}
+    for record in iter_jsonl_records(jsonl_filename):
+        data = record.get("data")
+        if record.get("kind") == "entity":
+            key = data.get("canonical_id") if isinstance(data, dict) else None
+            if key is None:
+                entities[len(entities), None] = data
+                continue
+            merged = entities.get(key)
+            if merged is None:
+                entities[key] = dict(data, aliases=[], mentions=1)
+            else:
+                merged["mentions"] += 1
+                if data.get("label") != merged.get("label") and data.get("label") not in merged["aliases"]:
+                    merged["aliases"].append(data.get("label"))
+        elif record.get("kind") == "relationship":
+            # Only relationships between canonical entities can be merged; chunk-local ids
+            # such as "e1" mean different entities in different chunks
+            if not isinstance(data, dict) or not (is_canonical_id(data.get("from")) and is_canonical_id(data.get("to"))):
+                relationships[len(relationships), None] = data
+                continue
+            key = json.dumps([data.get("from"), data.get("to"), data.get("type")], ensure_ascii=False)
+            if key in relationships:
+                relationships[key]["mentions"] += 1
+            else:
+                relationships[key] = dict(data, mentions=1)
+
+    aggregated = {"entities": list(entities.values()), "relationships": list(relationships.values())}
+
+    # Write to a temporary file first so an interrupted export never leaves a partial file
+    temp_filename = json_filename + ".tmp"
+    with open(temp_filename, 'w', encoding='utf-8') as file:
+        json.dump(aggregated, file, ensure_ascii=False, indent=4)
+    os.replace(temp_filename, json_filename)
+
+def build_extraction_request(text):
+    """
+    Returns the ChatCompletion parameters for extracting entities and relationships from `text`.
+    With `structured_outputs`, the model is made to answer with a `record_graph` function call.
+    """
+    request = {
+        "model": extraction_model,
+        "messages": [
+            {"role": "system", "content": extraction_system_prompt},
+            {"role": "user", "content": f"Extract entities and relationships from the following text and format them as JSON:\n{text}"}
+        ],
+        "max_tokens": extraction_max_tokens,
+        "n": 1,
+        "stop": None,
+        "temperature": 0.5
+    }
+    if structured_outputs:
+        request.update(function_call_request(extraction_function))
+    return request
+
+def extraction_cache_prompt():
+    """
+    Returns the system prompt under which extraction answers are cached.
+    """
+    if structured_outputs:
+        return schema_cache_prompt(extraction_system_prompt, extraction_function)
+    return extraction_system_prompt
+
+def response_parser():
+    """
+    Returns an incremental parser for both answer formats: free-text JSON
+    ("entities", "relationships") and compact function call arguments ("e", "r").
+    """
+    return IncrementalJSONParser(("entities", "relationships") + tuple(compact_kinds), compact_decoders)
+
+def strip_code_fence(response_content):
+    """
+    Removes a Markdown code fence (e.g. "```json ... ```") around the answer.
+    """
+    response_content = response_content.strip()
+    if response_content.startswith("```"):
+        response_content = response_content.split("\n", 1)[1] if "\n" in response_content else ""
+        if response_content.rstrip().endswith("```"):
+            response_content = response_content.rstrip()[:-3]
+    return response_content.strip()
+
+def parse_extraction_response(response_content):
+    """
+    Parses the JSON answer of an extraction request, free-text JSON or compact function
+    call arguments. If the answer is truncated or followed by stray text, the entities
+    and relationships completed before that point are kept. Raises json.JSONDecodeError
+    if nothing could be parsed.
+    """
+    response_content = strip_code_fence(response_content)
+    try:
+        data = json.loads(response_content)
+        if isinstance(data, dict) and any(key in data for key in compact_kinds):
+            return expand_compact_extraction(data)
+        return data
+    except json.JSONDecodeError:
+        parser = response_parser()
+        parser.feed(response_content)
+        records = parser.result()
+        data = {kind: records[kind] + records[key] for key, kind in compact_kinds.items()}
+        if not any(data.values()):
+            raise
+        metrics.count("extraction_parse_partial")
+        print(f"[WARN] Incomplete JSON response, kept {len(data['entities'])} entities "
+              f"and {len(data['relationships'])} relationships")
+        return data
+
+def stream_extraction_response(request, on_record):
+    """
+    Sends a streaming extraction request and passes each entity and relationship to
+    `on_record(kind, record)` as soon as its JSON object is complete.
+    Returns (response_content, complete): the full response text (what arrived, if the
+    stream was interrupted), and False if the stream was interrupted or the answer was
+    cut off at `max_tokens`.
+    """
+    parser = response_parser()
+    pieces = []
+    complete = True
+    try:
+        with metrics.timer("api_stream", model=request["model"]):
+            for event in api_client.stream_chat_completion(**request):
+                choice = event['choices'][0]
+                if choice.get('finish_reason') == "length":
+                    complete = False
+                delta = choice.get('delta', {})
+                piece = delta.get('content') or (delta.get('function_call') or {}).get('arguments')
+                if not piece:
+                    continue
+                pieces.append(piece)
+                for key, record in parser.feed(piece):
+                    on_record(compact_kinds.get(key, key), record)
+    except Exception as e:
+        print(f"API stream interrupted after {len(pieces)} pieces: {e}")
+        metrics.count("api_stream_interrupted")
+        complete = False
+    response_content = "".join(pieces).strip()
+
+    # Streamed responses carry no usage, so it is estimated with the token counter
+    prompt_tokens = request_prompt_tokens(request, count_tokens)
+    completion_tokens = count_tokens(response_content)
+    metrics.record_usage(request["model"], {
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens
+    }, estimated=True)
+    metrics.count("extraction_output_tokens", completion_tokens)
+    return response_content, complete
+
+def extract_entities_and_relationships(text, on_record=None):
     """
     Uses the OpenAI ChatCompletion API to extract entities and relationships 
-    from the provided text, returning the results as a JSON-like dictionary.
+    from the provided text, returning the results as a JSON-like dictionary,
+    or None if the request failed or the answer could not be parsed.
+    Responses are served from the shared response cache when available.
+    If `on_record(kind, record)` is given, every entity ("entities") and relationship
+    ("relationships") is passed to it once, as soon as it is parsed.
+    An interrupted or truncated answer is not cached and returns None, after the
+    records parsed from it have been passed to `on_record`.
     """
+    request = build_extraction_request(text)
+    user_prompt = request["messages"][-1]["content"]
+    cache_prompt = extraction_cache_prompt()
+    emitted = {"entities": 0, "relationships": 0}
+
+    def emit(kind, record):
+        emitted[kind] += 1
+        if on_record:
+            on_record(kind, record)
+
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",  # Adjust model if needed
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": f"Extract entities and relationships from the following text and format them as JSON:\n{text}"}
-            ],
-            max_tokens=2048,
-            n=1,
-            stop=None,
-            temperature=0.5
-        )
-
-        response_content = response['choices'][0]['message']['content'].strip()
+        response_content = None
+        if response_cache:
+            response_content = response_cache.get(extraction_model, cache_prompt, user_prompt, text)
+        from_cache = response_content is not None
+        complete = True
+
+        if not from_cache:
+            if stream_responses:
+                response_content, complete = stream_extraction_response(request, emit)
+            else:
+                response = api_client.chat_completion(**request)
+                response_content = (message_text(response['choices'][0]['message']) or "").strip()
+                complete = response['choices'][0].get('finish_reason') != "length"
+                usage = response.get('usage') or {}
+                metrics.count("extraction_output_tokens", usage.get('completion_tokens') or count_tokens(response_content))
+            metrics.count("extraction_responses")
 
         if not response_content:
-            print("API returned an empty response.")
-            return {"entities": [], "relationships": []}
-
-        # If the response is enclosed in triple backticks or similar, remove them
-        if response_content.startswith("```json"):
-            response_content = response_content.lstrip("```json").rstrip("```").strip()
+            if complete:
+                print("API returned an empty response.")
+                if not from_cache:
+                    metrics.count("extraction_parse_failures")
+            return None
 
-        return json.loads(response_content)
+        try:
+            data = parse_extraction_response(response_content)
+        except json.JSONDecodeError:
+            if not complete:
+                print("Incomplete response, no records kept")
+                return None
+            if not from_cache:
+                metrics.count("extraction_parse_failures")
+            raise
+
+        # Pass on the records not streamed yet (all of them unless the answer was streamed)
+        for kind in emitted:
+            records = [record for record in data.get(kind, []) if isinstance(record, dict)]
+            for record in records[emitted[kind]:]:
+                emit(kind, record)
+
+        if not complete:
+            # The records are kept, but the chunk is sent again on the next run
+            print(f"Incomplete response, kept {emitted['entities']} entities and {emitted['relationships']} relationships")
+            metrics.count("extraction_incomplete")
+            return None
+
+        # Only cache responses that could be parsed, so bad answers are retried on the next run
+        if response_cache and not from_cache:
+            response_cache.put(extraction_model, cache_prompt, user_prompt, text, response_content)
+        return data
     except json.JSONDecodeError as e:
         print(f"Failed to decode JSON from API response: {e}")
-        return {"entities": [], "relationships": []}
+        return None
     except Exception as e:
         print(f"API request failed: {e}")
-        return {"entities": [], "relationships": []}
+        return None
 
-def process_pdfs(pdf_paths):
+def canonicalize_records(entities_and_relationships):
     """
-    Main function to process the list of PDF files. Extracts text from each file,
-    splits it into chunks, and sends each chunk to the OpenAI API for entity 
-    and relationship extraction.
-    """
-    spatial_scale = {
-        "Molecular Level": ["Electron Transport Chain", "Photosynthetic Pigments", "RuBisCO", "Enzyme"],
-        "Cellular and Tissue Level": ["Chloroplast", "Cytoplasmic", "Mesophyll", "Guard Cells"],
-        "Leaf and Canopy Level": ["Leaf Surface", "Internal Structure", "Vertical Structure", "Horizontal Structure"],
-        "Crop Arrangement": ["Crop", "Irrigation", "Water Stress"],
-        "Microenvironment Level": ["Microclimate", "Soil Composition"],
-        "Macroenvironment Level": ["Climate Change", "Atmospheric Composition"]
-    }
+    Assigns canonical IDs to the entities and relationship endpoints of one chunk
+    (see `EntityIndex.canonicalize`). Returns the canonicalized data.
+    """
+    if entity_index is None:
+        return entities_and_relationships
+    return entity_index.canonicalize(entities_and_relationships)
 
-    temporal_scale = {
-        "Immediate Response": ["Light Saturation", "Photoprotection", "Instantaneous"],
-        "Short-Term Response": ["Stomatal Opening", "Gene Expression", "Diurnal Changes"],
-        "Medium-Term Response": ["Chlorophyll Content", "Circadian Rhythm"],
-        "Medium to Long-Term Response": ["Photosynthetic Machinery", "Acclimation", "Seasonal Changes"],
-        "Long-Term Response": ["Evolutionary Adaptation", "Community Adaptation"],
-        "Very Long-Term Response": ["Ecosystem Changes", "Evolutionary Replacement"]
+def output_sizes():
+    """
+    Returns {filename: size in bytes, or None if missing} of the CSV and JSONL outputs.
+    """
+    return {
+        filename: os.path.getsize(filename) if os.path.exists(filename) else None
+        for filename in (output_csv, output_jsonl)
     }
 
-    for pdf_path in pdf_paths:
-        pdf_parser = PDFParser(pdf_path)
-        text = pdf_parser.extract_abstract_or_full_text()
+def write_chunk_outputs(entities_and_relationships, pdf_path, chunk_index, ledger, doc_id, summary):
+    """
+    Appends the canonicalized data of one chunk to the CSV and JSONL outputs and,
+    if enabled, the SQLite store, and records the chunk in the run ledger with its
+    `summary`. The sizes of the files are recorded in the ledger before the append,
+    so a write interrupted before the chunk is recorded is rolled back on the next
+    run (see `roll_back_interrupted_writes`) instead of being appended a second time.
+    """
+    with output_lock, metrics.timer("output_write"):
+        ledger.begin_chunk_write(doc_id, chunk_index, output_sizes())
+        append_to_csv(entities_and_relationships, output_csv, spatial_classifier, temporal_classifier)
+        append_to_jsonl(entities_and_relationships, output_jsonl, pdf_path, chunk_index)
+        if output_store is not None:
+            output_store.add_chunk(pdf_path, chunk_index, entities_and_relationships, spatial_classifier, temporal_classifier)
+        ledger.record_chunk(doc_id, chunk_index, summary)
+
+def roll_back_interrupted_writes(ledger):
+    """
+    Truncates the CSV and JSONL outputs to their sizes before any chunk write the run
+    ledger lists as interrupted (removing files that did not exist yet), so the chunk
+    is written once when it is sent again. The SQLite store needs no rollback, as it
+    replaces the rows of a chunk written again.
+    """
+    for doc_id, chunk_index, sizes in ledger.interrupted_writes():
+        for filename, size in sizes.items():
+            if size is None:
+                if os.path.exists(filename):
+                    os.remove(filename)
+            elif os.path.exists(filename) and os.path.getsize(filename) > size:
+                with open(filename, 'r+b') as file:
+                    file.truncate(size)
+        print(f"Rolled back the interrupted write of chunk {chunk_index} of document {doc_id[:12]}")
+        ledger.clear_chunk_write(doc_id, chunk_index)
+
+def extract_chunk(chunk, keep_partial=False):
+    """
+    Extracts the entities and relationships of one chunk. The records parsed from the
+    (streamed) response are buffered and only canonicalized, which registers their
+    entities in the entity index, once the extraction has succeeded, so a failed
+    attempt leaves no entities in the index; with `keep_partial`, the records parsed
+    before a failure are canonicalized all the same. Returns (extracted, canonical):
+    the records as parsed (None if the extraction failed) and as canonicalized (None
+    if there is nothing to write).
+    """
+    extracted = {"entities": [], "relationships": []}
 
-        if not text:
-            print(f"No text found in {pdf_path}, skipping this file.")
-            continue
+    def on_record(kind, record):
+        extracted[kind].append(record)
 
-        # Attempt to load existing chunks from file
-        chunks = load_chunks_from_file(chunk_file_path)
-        if chunks is None:
-            # If no chunks file found, create new chunks
-            chunks = chunk_text(text)
-            save_chunks_to_file(chunks, chunk_file_path)
+    data = extract_entities_and_relationships(chunk, on_record=on_record)
+    if data is None and not keep_partial:
+        return None, None
+    return (extracted if data is not None else None), canonicalize_records(extracted)
 
-        last_filename, last_chunk_index = load_checkpoint()
-        start_index = last_chunk_index if last_filename == pdf_path else 0
+def extract_or_reuse_chunk(chunk, pdf_path, chunk_index, keep_partial=False):
+    """
+    Extracts one chunk with `extract_chunk`, unless the duplicate index finds it to be
+    a near-duplicate of a chunk already extracted. The earlier chunk's records are then
+    written again under this paper, or nothing is written, according to
+    `near_duplicate_action`. Returns (records, complete): the canonicalized records to
+    write (None if the extraction failed and nothing is to be written), and False if
+    they are only those parsed before a failure (with `keep_partial`).
+    """
+    if duplicate_index is None:
+        extracted, records = extract_chunk(chunk, keep_partial)
+        return records, extracted is not None
+
+    with metrics.timer("minhash"):
+        match = duplicate_index.claim(pdf_path, chunk_index, chunk)
+    if match is not None:
+        extracted = duplicate_index.result(match, timeout=near_duplicate_wait)
+        if extracted is not None:
+            metrics.count("near_duplicate_chunks")
+            if near_duplicate_action != "reuse":
+                duplicate_index.record_match(pdf_path, chunk_index, match, "skipped")
+                return {"entities": [], "relationships": []}, True
+            duplicate_index.record_match(pdf_path, chunk_index, match, "reused")
+            return canonicalize_records(extracted), True
+        # The earlier chunk has no results, so this one is sent after all
+        extracted, records = extract_chunk(chunk, keep_partial)
+        return records, extracted is not None
+
+    extracted = records = None
+    try:
+        extracted, records = extract_chunk(chunk, keep_partial)
+    finally:
+        # Empty results (failed requests) are not reused
+        duplicate_index.resolve(pdf_path, chunk_index, extracted if extracted and any(extracted.values()) else None)
+    return records, extracted is not None
+
+def chunk_summary(entities_and_relationships, partial=False):
+    """
+    Returns the per-chunk record kept in the run ledger. A `partial` chunk was given
+    up after `max_chunk_attempts` failures, keeping the records parsed before the last one.
+    """
+    summary = {
+        "entities": len(entities_and_relationships.get("entities", [])),
+        "relationships": len(entities_and_relationships.get("relationships", []))
+    }
+    if partial:
+        summary["partial"] = True
+    return summary
+
+def process_document(pdf_path, pieces, doc_id, ledger):
+    """
+    Chunks the selected text of one PDF and sends each chunk to the OpenAI API as soon
+    as it is filled, skipping chunks already completed according to the run ledger,
+    and appends the results to the outputs. Failed chunks write nothing and are not
+    recorded, and the document is only marked as done once every chunk has completed,
+    so the next run sends the failed chunks again. On its `max_chunk_attempts`-th
+    attempt, a chunk is recorded whatever happens, with the records parsed before a
+    failure, and its document is marked "incomplete".
+    """
+    with paper_context(pdf_path):
+        completed = ledger.completed_chunks(doc_id)
+        attempts = ledger.failed_attempts(doc_id)
+        num_chunks = 0
+        failed = 0
+        partial = sum(1 for summary in completed.values() if summary and summary.get("partial"))
 
         # Process each chunk and extract entities and relationships
-        for i in range(start_index, len(chunks)):
-            entities_and_relationships = extract_entities_and_relationships(chunks[i])
+        for i, chunk in enumerate(chunk_text(pieces)):
+            num_chunks += 1
+            if i in completed:
+                continue
+
+            last_attempt = attempts.get(i, 0) + 1 >= max_chunk_attempts
+            entities_and_relationships, complete = extract_or_reuse_chunk(chunk, pdf_path, i, keep_partial=last_attempt)
+            if not complete:
+                ledger.record_failure(doc_id, i)
+            if entities_and_relationships is None:
+                failed += 1
+                continue
+            if not complete:
+                print(f"Giving up on chunk {i} of {pdf_path} after {max_chunk_attempts} attempts")
+                partial += 1
+
+            # Write the chunk's records and mark it as completed
+            write_chunk_outputs(
+                entities_and_relationships, pdf_path, i, ledger, doc_id,
+                chunk_summary(entities_and_relationships, partial=not complete)
+            )
 
-            # Append extracted data to CSV and JSON
-            append_to_csv(entities_and_relationships, output_csv, spatial_scale, temporal_scale)
-            append_to_json(entities_and_relationships, output_json)
+        if failed:
+            print(f"{failed} of {num_chunks} chunks of {pdf_path} failed; the document stays pending")
+            return
+        ledger.finish_document(doc_id, pdf_path, num_chunks=num_chunks, complete=not partial)
 
-            # Update checkpoint
-            save_checkpoint(pdf_path, i)
-            time.sleep(1)
+def document_parameters():
+    """
+    Returns the settings that are part of each PDF's ID in the run ledger besides its
+    file hash: the extractor, the section selection and the chunking settings.
+    """
+    return dict(
+        chunk_parameters, sections=selected_sections,
+        extractor=text_extractor, extractor_version=extractor_version(text_extractor)
+    )
+
+def iter_pending_documents(pdf_paths, ledger, text_cache):
+    """
+    Yields (pdf_path, pieces, doc_id) for every PDF the run ledger does not list as
+    processed, registering each one in the ledger. `pieces` is a generator of the text
+    of the `selected_sections`, read page by page from the `text_cache` and not yet
+    chunked. PDFs are parsed in a process pool ahead of the consumer, and their
+    sections are recorded in the section index.
+    """
+    processed_files = ledger.done_names()
+    pending_paths = [pdf_path for pdf_path in pdf_paths if pdf_path not in processed_files]
+    texts = iter_extracted_texts(
+        pending_paths, text_cache, selected_sections,
+        max_workers=extraction_workers, max_pending=extraction_queue_size, extractor=text_extractor
+    )
+    for pdf_path, file_hash, pages in texts:
+        if not any(page.strip() for page in pages):
+            print(f"No text found in {pdf_path}, skipping this file.")
+            continue
+        sections = find_sections(pages)
+        if section_index is not None:
+            section_index.put(pdf_path, text_extractor, sections)
+        pieces, selected_chars, read_chars = select_sections(pages, selected_sections, sections)
+        metrics.count("section_chars_read", read_chars)
+        metrics.count("section_chars_selected", selected_chars)
+
+        doc_id = file_document_id(file_hash, document_parameters())
+        ledger.start_document(doc_id, pdf_path)
+        yield pdf_path, pieces, doc_id
+
+def process_pdfs(pdf_paths, max_workers=max_concurrent_documents):
+    """
+    Main function to process the list of PDF files. Extracts text from each file
+    in a process pool (while earlier files are being sent to the API),
+    splits it into chunks, and sends each chunk to the OpenAI API for entity 
+    and relationship extraction as soon as it is filled. Up to `max_workers` PDFs are
+    processed concurrently. Each PDF's per-chunk completion state is kept in the run
+    ledger under a hash of its file, section selection and chunking settings, so every
+    PDF resumes exactly where it stopped.
+    """
+    ledger = RunLedger(ledger_path)
+    roll_back_interrupted_writes(ledger)
+    futures = {}
+    last_save = time.monotonic()
+
+    def finish(done):
+        nonlocal last_save
+        for future in done:
+            pdf_path = futures.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to process {pdf_path}: {e}")
+        if entity_index is not None and time.monotonic() - last_save >= entity_index_save_interval:
+            entity_index.save(entity_index_path)
+            last_save = time.monotonic()
 
-        # Remove temporary chunk and checkpoint files after processing each PDF
-        if os.path.exists(chunk_file_path):
-            os.remove(chunk_file_path)
-        if os.path.exists(checkpoint_file):
-            os.remove(checkpoint_file)
+    try:
+        with open_text_cache(text_cache) as cache, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for pdf_path, pieces, doc_id in iter_pending_documents(pdf_paths, ledger, cache):
+                # Only pull the next text once a document slot is free
+                while len(futures) >= max_workers:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    finish(done)
+
+                futures[executor.submit(process_document, pdf_path, pieces, doc_id, ledger)] = pdf_path
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                finish(done)
+    finally:
+        ledger.close()
+        if entity_index is not None:
+            entity_index.save(entity_index_path)
+
+    # Produce the aggregated JSON from the record store
+    with metrics.timer("json_export"):
+        export_jsonl_to_json(output_jsonl, output_json)
+
+def write_extraction_batch(pdf_paths, batch_path):
+    """
+    Offline batch mode: instead of calling the API, appends one Batch API request
+    per chunk still missing from the run ledger to `batch_path`.
+    Returns the number of requests written.
+    """
+    ledger = RunLedger(ledger_path)
+    written = set()
+    count = 0
+    try:
+        with open_text_cache(text_cache) as cache:
+            for pdf_path, pieces, doc_id in iter_pending_documents(pdf_paths, ledger, cache):
+                if doc_id in written:
+                    continue  # Identical to a PDF already in this batch
+                written.add(doc_id)
+                requests, num_chunks = append_document_requests(
+                    batch_path, doc_id, chunk_text(pieces), ledger.completed_chunks(doc_id), build_extraction_request
+                )
+                ledger.set_num_chunks(doc_id, num_chunks)
+                count += requests
+    finally:
+        ledger.close()
+    return count
+
+def ingest_extraction_batch(results_path):
+    """
+    Maps a Batch API results file back to PDFs and chunks: appends each chunk's
+    entities and relationships to the outputs, records the chunk in the run ledger,
+    and marks every PDF in the batch whose chunks all completed as processed.
+    Chunks the ledger already records are skipped, so ingesting a file twice writes
+    nothing twice, and a PDF with chunks missing from the results stays pending.
+    Failed requests and unparsable answers are not recorded, and their PDFs stay
+    pending so `--write-batch` sends those chunks again, until a chunk has failed
+    `max_chunk_attempts` times and is given up.
+    """
+    ledger = RunLedger(ledger_path)
+    roll_back_interrupted_writes(ledger)
+    doc_names = {}
+    recorded = {}  # doc_id -> chunks recorded in the ledger
+    failed = set()
+    try:
+        for custom_id, response_content in iter_batch_results(results_path):
+            doc_id, chunk_index = parse_custom_id(custom_id)
+            if doc_id not in doc_names:
+                doc_names[doc_id] = ledger.pending_names(doc_id)
+                recorded[doc_id] = set(ledger.completed_chunks(doc_id))
+            if not doc_names[doc_id] or chunk_index in recorded[doc_id]:
+                continue  # Already ingested, e.g. from the same results file
+            entities_and_relationships = None
+            if response_content is not None:
+                metrics.count("extraction_responses")
+                try:
+                    entities_and_relationships = parse_extraction_response(response_content)
+                except json.JSONDecodeError as e:
+                    print(f"Failed to decode JSON from batch result {custom_id}: {e}")
+                    metrics.count("extraction_parse_failures")
+            partial = False
+            if entities_and_relationships is None:
+                if ledger.record_failure(doc_id, chunk_index) < max_chunk_attempts:
+                    failed.add(doc_id)
+                    continue
+                print(f"Giving up on chunk {chunk_index} of {', '.join(doc_names[doc_id])} after {max_chunk_attempts} attempts")
+                entities_and_relationships = {"entities": [], "relationships": []}
+                partial = True
+
+            # Files with identical content are attributed to the first one registered
+            written = canonicalize_records(entities_and_relationships)
+            write_chunk_outputs(
+                written, doc_names[doc_id][0], chunk_index, ledger, doc_id, chunk_summary(written, partial=partial)
+            )
+            recorded[doc_id].add(chunk_index)
+
+        for doc_id, names in doc_names.items():
+            if not names:
+                continue
+            if doc_id in failed:
+                print(f"Some chunks of {', '.join(names)} failed; left pending for the next batch")
+                continue
+            missing = ledger.missing_chunks(doc_id)
+            if missing:
+                print(f"{missing} chunks of {', '.join(names)} have no results yet; left pending")
+                failed.add(doc_id)
+                continue
+            complete = not any(summary and summary.get("partial") for summary in ledger.completed_chunks(doc_id).values())
+            for name in names:
+                ledger.finish_document(doc_id, name, complete=complete)
+    finally:
+        ledger.close()
+        if entity_index is not None:
+            entity_index.save(entity_index_path)
+
+    export_jsonl_to_json(output_jsonl, output_json)
+    return sum(len(names) for doc_id, names in doc_names.items() if doc_id not in failed)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract entities and relationships from research papers")
+    parser.add_argument("--export-json", action="store_true", help=f"Rebuild {output_json} from {output_jsonl} and exit")
+    parser.add_argument("--write-batch", metavar="PATH", help="Write Batch API requests to PATH instead of calling the API")
+    parser.add_argument("--ingest-batch", metavar="PATH", help="Ingest a Batch API results file into the outputs")
+    parser.add_argument("--sections", nargs="+", choices=section_names + ["all"],
+                        help=f"Sections to send to the API (default: {' '.join(selected_sections or ['all'])})")
+    parser.add_argument("--structured", action="store_true", help="Ask for a compact function call instead of free-text JSON")
+    args = parser.parse_args()
+    if args.sections:
+        selected_sections = None if "all" in args.sections else args.sections
+    if args.structured:
+        structured_outputs = True
+
+    if args.export_json:
+        # Only rebuild the aggregated JSON from the record store
+        export_jsonl_to_json(output_jsonl, output_json)
+        print(f"Exported {output_jsonl} to {output_json}")
+        sys.exit(0)
+
+    if entity_index_path:
+        entity_index = EntityIndex.load(entity_index_path, fuzzy_threshold=fuzzy_match_threshold, aliases_path=entity_aliases_path)
+
+    if output_sqlite:
+        output_store = ExtractionStore(output_sqlite)
+
+    if args.ingest_batch:
+        papers = ingest_extraction_batch(args.ingest_batch)
+        print(f"Ingested batch results for {papers} papers into {output_csv} and {output_json}")
+        if output_store:
+            output_store.close()
+        sys.exit(0)
+
     # Gather PDF files from the specified folder
     pdf_paths = [
         os.path.join(folder_path, f) 
         for f in os.listdir(folder_path) 
         if f.endswith('.pdf')
     ]
-    process_pdfs(pdf_paths)
+    if text_cache_path:
+        text_cache = TextCache(text_cache_path)
+    if section_index_path:
+        section_index = SectionIndex(section_index_path)
+    if metrics_trace_path:
+        metrics.open_trace(metrics_trace_path)
+    if metrics_port:
+        start_metrics_server(metrics_port)
+
+    if args.write_batch:
+        requests = write_extraction_batch(pdf_paths, args.write_batch)
+        print(f"Wrote {requests} batch requests to {args.write_batch}")
+    else:
+        if llm_cache_path:
+            response_cache = LLMCache(llm_cache_path, max_entries=llm_cache_max_entries, max_age=llm_cache_max_age)
+        if near_duplicates_path:
+            duplicate_index = NearDuplicateIndex(
+                near_duplicates_path, task_scope("extraction", extraction_model, extraction_system_prompt),
+                threshold=near_duplicate_threshold
+            )
+        process_pdfs(pdf_paths)
+
+    if text_cache:
+        print(f"Text cache: {text_cache.stats()}")
+        text_cache.close()
+    if response_cache:
+        print(f"LLM cache: {response_cache.stats()}")
+        response_cache.close()
+    print(f"API client: {api_client.stats()}")
+    print_output_stats(
+        output_stats(metrics.summary()["counters"], "extraction"), "extraction",
+        "function call" if structured_outputs else "free text"
+    )
+    if duplicate_index:
+        print_report(duplicate_index.report())
+        duplicate_index.close()
+    if output_store:
+        output_store.close()
+    if section_index:
+        section_index.close()
+    if metrics_summary_path:
+        metrics.write_summary(metrics_summary_path)
+        print(f"Metrics written to {metrics_summary_path}")
+    metrics.close()
@@ -0,0 +1,221 @@
+import os
+import re
+import math
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import defaultdict
+
+def singularize(token):
+    """
+    Strips a plural "s"/"es" from longer tokens ("chloroplasts" -> "chloroplast"),
+    leaving endings such as "-ss", "-us" and "-is" ("stress", "photosynthesis") alone.
+    """
+    if len(token) > 4 and token.endswith(("xes", "ches", "shes", "sses")):
+        return token[:-2]
+    if len(token) > 4 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+def normalize_label(label):
+    """
+    Normalizes an entity label for exact lookups: Unicode-compatible forms,
+    case-folded, singularized, with punctuation and repeated whitespace collapsed
+    to single spaces.
+    """
+    label = unicodedata.normalize("NFKC", label).casefold()
+    return " ".join(singularize(token) for token in re.sub(r"[^\w]+", " ", label).split())
+
+def label_ngrams(normalized, n=3):
+    """
+    Returns the set of character n-grams of a normalized label, padded at both ends.
+    """
+    padded = f" {normalized} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+def distinguishing_tokens(normalized):
+    """
+    Tokens that must agree for a fuzzy match: numbers and very short tokens, so that
+    e.g. "photosystem i"/"photosystem ii" or "c3 plants"/"c4 plants" are never merged.
+    """
+    return {token for token in normalized.split() if len(token) <= 2 or any(char.isdigit() for char in token)}
+
+canonical_id_pattern = re.compile(r"E[0-9a-f]{12}")
+
+# Shape of chunk-local entity ids given by the model ("e1", "E12", "n_3"); labels such
+# as "CO2" or "C4" share it, so a value is only a local id if the chunk declares it
+local_id_pattern = re.compile(r"[A-Za-z]{1,3}_?\d+")
+
+def is_canonical_id(value):
+    """
+    Returns True if `value` looks like an ID assigned by `EntityIndex`.
+    """
+    return isinstance(value, str) and canonical_id_pattern.fullmatch(value) is not None
+
+class EntityIndex:
+    """
+    Assigns stable canonical IDs to entity labels during ingestion.
+
+    Labels are looked up by normalized-label hash, then in an alias table, then
+    (optionally) by character-trigram similarity through an inverted n-gram index,
+    so each lookup only touches labels that share n-grams with the query.
+    """
+
+    def __init__(self, fuzzy_threshold=0.85, ngram_size=3):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.ngram_size = ngram_size
+        self.labels = {}  # canonical_id -> canonical label
+        self.keys = {}  # normalized label or alias -> canonical_id
+        self._ngrams = defaultdict(set)  # n-gram -> normalized keys
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_id(normalized):
+        return "E" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+    def _add_key(self, normalized, canonical_id):
+        self.keys[normalized] = canonical_id
+        for ngram in label_ngrams(normalized, self.ngram_size):
+            self._ngrams[ngram].add(normalized)
+
+    def _fuzzy_lookup(self, normalized):
+        # Prefix filtering: a key with Jaccard similarity >= threshold must share at least one
+        # of the query's rarest n-grams, so only those posting lists are scanned
+        ngrams = label_ngrams(normalized, self.ngram_size)
+        min_shared = math.ceil(self.fuzzy_threshold * len(ngrams))
+        rarest = sorted(ngrams, key=lambda ngram: len(self._ngrams.get(ngram, ())))
+        candidates = set()
+        for ngram in rarest[:len(ngrams) - min_shared + 1]:
+            candidates.update(self._ngrams.get(ngram, ()))
+
+        best_key = None
+        best_score = self.fuzzy_threshold
+        tokens = distinguishing_tokens(normalized)
+        for key in candidates:
+            key_ngrams = label_ngrams(key, self.ngram_size)
+            shared = len(ngrams & key_ngrams)
+            score = shared / (len(ngrams) + len(key_ngrams) - shared)  # Jaccard similarity
+            if score >= best_score and distinguishing_tokens(key) == tokens:
+                best_key = key
+                best_score = score
+        return self.keys[best_key] if best_key is not None else None
+
+    def add_aliases(self, aliases):
+        """
+        Registers an alias table {canonical label: [alias, ...]}.
+        """
+        with self._lock:
+            for canonical_label, alias_list in aliases.items():
+                normalized = normalize_label(canonical_label)
+                canonical_id = self.keys.get(normalized)
+                if canonical_id is None:
+                    canonical_id = self.make_id(normalized)
+                    self.labels[canonical_id] = canonical_label
+                    self._add_key(normalized, canonical_id)
+                for alias in alias_list:
+                    self._add_key(normalize_label(alias), canonical_id)
+
+    def resolve(self, label):
+        """
+        Returns the canonical ID for a label, registering it as a new entity if nothing matches.
+        """
+        normalized = normalize_label(label)
+        if not normalized:
+            return None
+
+        with self._lock:
+            canonical_id = self.keys.get(normalized)
+            if canonical_id is None and self.fuzzy_threshold is not None:
+                canonical_id = self._fuzzy_lookup(normalized)
+                if canonical_id is not None:
+                    self._add_key(normalized, canonical_id)  # Remember the variant for exact lookups
+            if canonical_id is None:
+                canonical_id = self.make_id(normalized)
+                self.labels[canonical_id] = label
+                self._add_key(normalized, canonical_id)
+            return canonical_id
+
+    def lookup(self, label):
+        """
+        Returns the canonical ID of a label already in the index (by normalized label
+        or alias), or None, without registering it.
+        """
+        with self._lock:
+            return self.keys.get(normalize_label(label))
+
+    def canonicalize(self, data):
+        """
+        Returns a copy of the extraction result of one chunk in which every entity
+        carries its `canonical_id` and relationship endpoints are rewritten to canonical
+        IDs. Endpoints may refer to an entity's chunk-local "id" or to its label.
+        An endpoint shaped like a local id ("e2") that the chunk does not declare is
+        resolved as a label if the index knows it (as with "CO2" or "C4"), and kept
+        verbatim otherwise.
+        """
+        local_ids = {}
+        entities = []
+        for entity in data.get("entities", []):
+            if not isinstance(entity, dict) or not isinstance(entity.get("label"), str):
+                entities.append(entity)
+                continue
+            canonical_id = self.resolve(entity["label"])
+            entities.append(dict(entity, canonical_id=canonical_id))
+            # Declared ids take precedence over labels of other entities
+            local_ids.setdefault(entity["label"], canonical_id)
+            if entity.get("id") is not None:
+                local_ids[str(entity["id"])] = canonical_id
+
+        def endpoint(value):
+            if isinstance(value, dict):
+                value = value.get("id", value.get("label"))
+            if value is None:
+                return None
+            value = str(value)
+            if value in local_ids:
+                return local_ids[value]
+            if is_canonical_id(value):
+                return value
+            if local_id_pattern.fullmatch(value):
+                canonical_id = self.lookup(value)
+                if canonical_id is None:
+                    print(f"[WARN] Relationship endpoint {value!r} is neither declared in the chunk nor a known label; kept verbatim")
+                return canonical_id or value
+            return self.resolve(value) or value
+
+        relationships = [
+            dict(relationship, **{"from": endpoint(relationship.get("from")), "to": endpoint(relationship.get("to"))})
+            if isinstance(relationship, dict) else relationship
+            for relationship in data.get("relationships", [])
+        ]
+
+        return dict(data, entities=entities, relationships=relationships)
+
+    def save(self, path):
+        """
+        Writes the canonical labels and lookup keys to a JSON file.
+        """
+        with self._lock:
+            state = {"labels": self.labels, "keys": self.keys}
+            temp_path = path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, fuzzy_threshold=0.85, aliases_path=None):
+        """
+        Loads an index saved with `save` (if the file exists) and the optional
+        alias table, returning a ready-to-use index.
+        """
+        index = cls(fuzzy_threshold=fuzzy_threshold)
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            index.labels = state["labels"]
+            for normalized, canonical_id in state["keys"].items():
+                index._add_key(normalized, canonical_id)
+        if aliases_path and os.path.exists(aliases_path):
+            with open(aliases_path, 'r', encoding='utf-8') as f:
+                index.add_aliases(json.load(f))
+        return index
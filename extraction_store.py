@@ -0,0 +1,198 @@
+import json
+import time
+import sqlite3
+import threading
+from metrics import metrics
+
+# Entity types that are not written to the outputs
+excluded_entity_types = ["publication", "organization"]
+
+class ExtractionStore:
+    """
+    SQLite store (WAL mode) of extracted entities and relationships with their provenance.
+    Each chunk's records are written in one transaction, and entities are indexed by
+    label, canonical ID and scale and chunks by paper, so subsets can be queried
+    without reading the whole output.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id INTEGER PRIMARY KEY,
+                paper TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                UNIQUE (paper, chunk_index)
+            );
+            CREATE TABLE IF NOT EXISTS entities (
+                entity_id INTEGER PRIMARY KEY,
+                chunk_id INTEGER NOT NULL REFERENCES chunks (chunk_id) ON DELETE CASCADE,
+                local_id TEXT,
+                canonical_id TEXT,
+                label TEXT,
+                type TEXT,
+                spatial_scale TEXT,
+                temporal_scale TEXT,
+                properties TEXT
+            );
+            CREATE TABLE IF NOT EXISTS relationships (
+                relationship_id INTEGER PRIMARY KEY,
+                chunk_id INTEGER NOT NULL REFERENCES chunks (chunk_id) ON DELETE CASCADE,
+                type TEXT,
+                source TEXT,
+                target TEXT,
+                properties TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_paper ON chunks (paper);
+            CREATE INDEX IF NOT EXISTS idx_entities_chunk ON entities (chunk_id);
+            CREATE INDEX IF NOT EXISTS idx_entities_label ON entities (label);
+            CREATE INDEX IF NOT EXISTS idx_entities_canonical_id ON entities (canonical_id);
+            CREATE INDEX IF NOT EXISTS idx_entities_spatial_scale ON entities (spatial_scale);
+            CREATE INDEX IF NOT EXISTS idx_entities_temporal_scale ON entities (temporal_scale);
+            CREATE INDEX IF NOT EXISTS idx_relationships_chunk ON relationships (chunk_id);
+            CREATE INDEX IF NOT EXISTS idx_relationships_source ON relationships (source);
+            CREATE INDEX IF NOT EXISTS idx_relationships_target ON relationships (target);
+            CREATE INDEX IF NOT EXISTS idx_relationships_type ON relationships (type);
+        """)
+        self._conn.commit()
+
+    def add_chunk(self, paper, chunk_index, data, spatial_classifier=None, temporal_classifier=None):
+        """
+        Stores the entities and relationships extracted from one chunk in a single
+        transaction, replacing anything stored for the same chunk before.
+        Relationship endpoints are stored as given (canonical IDs once canonicalized).
+        """
+        entities = [
+            entity for entity in data.get("entities", [])
+            if isinstance(entity, dict) and entity.get("type") not in excluded_entity_types
+        ]
+        labels = [entity.get("label") for entity in entities]
+        spatial_labels = spatial_classifier.classify_many(labels) if spatial_classifier else [None] * len(entities)
+        temporal_labels = temporal_classifier.classify_many(labels) if temporal_classifier else [None] * len(entities)
+
+        def endpoint(value):
+            if isinstance(value, dict):
+                value = value.get("id", value.get("label"))
+            return str(value) if value is not None else None
+
+        with self._lock, self._conn, metrics.timer("sqlite_write"):
+            self._conn.execute("DELETE FROM chunks WHERE paper = ? AND chunk_index = ?", (paper, chunk_index))
+            chunk_id = self._conn.execute(
+                "INSERT INTO chunks (paper, chunk_index, created_at) VALUES (?, ?, ?)",
+                (paper, chunk_index, time.time())
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO entities (chunk_id, local_id, canonical_id, label, type, spatial_scale, temporal_scale, properties) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        chunk_id,
+                        str(entity["id"]) if entity.get("id") is not None else None,
+                        entity.get("canonical_id"),
+                        entity.get("label"),
+                        entity.get("type"),
+                        spatial_label,
+                        temporal_label,
+                        json.dumps(entity.get("properties"), ensure_ascii=False)
+                    )
+                    for entity, spatial_label, temporal_label in zip(entities, spatial_labels, temporal_labels)
+                ]
+            )
+            self._conn.executemany(
+                "INSERT INTO relationships (chunk_id, type, source, target, properties) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        chunk_id,
+                        relationship.get("type"),
+                        endpoint(relationship.get("from")),
+                        endpoint(relationship.get("to")),
+                        json.dumps(
+                            {key: value for key, value in relationship.items() if key not in ("type", "from", "to")},
+                            ensure_ascii=False
+                        )
+                    )
+                    for relationship in data.get("relationships", []) if isinstance(relationship, dict)
+                ]
+            )
+
+    def _query(self, sql, params):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def entities(self, label=None, canonical_id=None, spatial_scale=None, temporal_scale=None, paper=None):
+        """
+        Returns the stored entities matching all given filters, with their paper and chunk index.
+        """
+        conditions = []
+        params = []
+        for column, value in (
+            ("e.label", label), ("e.canonical_id", canonical_id), ("e.spatial_scale", spatial_scale),
+            ("e.temporal_scale", temporal_scale), ("c.paper", paper)
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        rows = self._query(
+            "SELECT c.paper, c.chunk_index, e.local_id, e.canonical_id, e.label, e.type, "
+            "e.spatial_scale, e.temporal_scale, e.properties "
+            f"FROM entities e JOIN chunks c ON c.chunk_id = e.chunk_id{where} ORDER BY e.entity_id",
+            params
+        )
+        for row in rows:
+            row["properties"] = json.loads(row["properties"]) if row["properties"] is not None else None
+        return rows
+
+    def relationships(self, node=None, type=None, paper=None):
+        """
+        Returns the stored relationships matching all given filters; `node` matches
+        either endpoint.
+        """
+        conditions = []
+        params = []
+        if node is not None:
+            conditions.append("(r.source = ? OR r.target = ?)")
+            params.extend([node, node])
+        for column, value in (("r.type", type), ("c.paper", paper)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        rows = self._query(
+            "SELECT c.paper, c.chunk_index, r.type, r.source, r.target, r.properties "
+            f"FROM relationships r JOIN chunks c ON c.chunk_id = r.chunk_id{where} ORDER BY r.relationship_id",
+            params
+        )
+        for row in rows:
+            row["properties"] = json.loads(row["properties"]) if row["properties"] else {}
+        return rows
+
+    def iter_records(self, paper=None):
+        """
+        Yields (paper, chunk_index, kind, data) in the shape of the JSON-Lines records
+        of entity_extraction.py, so the graph builder can read from the store.
+        """
+        for row in self.entities(paper=paper):
+            data = {"label": row["label"], "type": row["type"], "properties": row["properties"]}
+            if row["local_id"] is not None:
+                data["id"] = row["local_id"]
+            if row["canonical_id"] is not None:
+                data["canonical_id"] = row["canonical_id"]
+            yield row["paper"], row["chunk_index"], "entity", data
+        for row in self.relationships(paper=paper):
+            yield row["paper"], row["chunk_index"], "relationship", dict(
+                row["properties"], type=row["type"], **{"from": row["source"], "to": row["target"]}
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
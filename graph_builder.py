@@ -0,0 +1,277 @@
+import os
+import json
+import math
+import hashlib
+import numpy as np
+from graph_index import GraphIndex
+from extraction_store import ExtractionStore
+
+# Version of the layout algorithm; part of the cache key so changes invalidate old layouts
+layout_version = 1
+
+# Graphs with up to this many nodes use exact pairwise repulsion; larger graphs
+# approximate repulsion from the other nodes by the centroids of grid cells
+exact_repulsion_max_nodes = 1500
+
+def iter_extraction_records(path):
+    """
+    Yields (source, chunk, kind, data) for every entity and relationship in an
+    extraction output: the output.jsonl record store, the SQLite store (.sqlite/.db)
+    or the aggregated output.json.
+    """
+    if path.endswith((".sqlite", ".db")):
+        store = ExtractionStore(path)
+        try:
+            yield from store.iter_records()
+        finally:
+            store.close()
+    elif path.endswith(".jsonl"):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Truncated last line of an interrupted run
+                yield record.get("source"), record.get("chunk"), record.get("kind"), record.get("data")
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            aggregated = json.load(f)
+        for entity in aggregated.get("entities", []):
+            yield None, None, "entity", entity
+        for relationship in aggregated.get("relationships", []):
+            yield None, None, "relationship", relationship
+
+def build_graph(records, labels=None):
+    """
+    Builds the graph from extraction records. Nodes are keyed by the entity's
+    `canonical_id` (or its label when the output was not canonicalized); relationship
+    endpoints that are chunk-local ids are resolved within their source chunk.
+    `labels` optionally maps canonical IDs to labels for endpoints without an entity record.
+    Each node records the `sources` (papers) it was extracted from.
+    Returns ({node_id: node_data}, {(source, target, label): count}).
+    """
+    nodes = {}
+    edges = {}
+    local_ids = {}  # (source, chunk, local id) -> node id
+
+    def endpoint(value, context):
+        if isinstance(value, dict):
+            value = value.get("id", value.get("label"))
+        if value is None:
+            return None
+        value = str(value)
+        node_id = local_ids.get(context + (value,), value)
+        if node_id not in nodes:
+            label = labels.get(node_id, node_id) if labels else node_id
+            nodes[node_id] = {"id": node_id, "label": label, "type": None, "mentions": 0, "sources": set()}
+        if context[0] is not None:
+            nodes[node_id]["sources"].add(context[0])
+        return node_id
+
+    for source, chunk, kind, data in records:
+        if not isinstance(data, dict):
+            continue
+        context = (source, chunk)
+        if kind == "entity":
+            label = data.get("label")
+            node_id = data.get("canonical_id") or label
+            if not node_id:
+                continue
+            node_id = str(node_id)
+            node = nodes.get(node_id)
+            if node is None:
+                node = nodes[node_id] = {"id": node_id, "label": label or node_id, "type": data.get("type"), "mentions": 0, "sources": set()}
+            elif node["type"] is None:
+                node["label"] = label or node["label"]
+                node["type"] = data.get("type")
+            node["mentions"] += data.get("mentions", 1)
+            if source is not None:
+                node["sources"].add(source)
+            if data.get("id") is not None:
+                local_ids[context + (str(data["id"]),)] = node_id
+        elif kind == "relationship":
+            source_id = endpoint(data.get("from"), context)
+            target_id = endpoint(data.get("to"), context)
+            if source_id is None or target_id is None:
+                continue
+            key = (source_id, target_id, data.get("type") or "")
+            edges[key] = edges.get(key, 0) + data.get("mentions", 1)
+
+    return nodes, edges
+
+def graph_hash(node_ids, edge_index, iterations, seed):
+    """
+    Returns the cache key of a layout: a hash of the sorted node IDs, the edges
+    between them and the layout parameters.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([layout_version, iterations, seed]).encode("utf-8"))
+    for node_id in node_ids:
+        digest.update(node_id.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(np.ascontiguousarray(edge_index, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+def _exact_repulsion(positions, block_size=1024):
+    # Fruchterman-Reingold repulsion k^2 / d with k = 1, over all pairs in row blocks
+    displacement = np.zeros_like(positions)
+    for start in range(0, len(positions), block_size):
+        block = positions[start:start + block_size]
+        delta = block[:, None, :] - positions[None, :, :]
+        distance_sq = np.einsum("ijk,ijk->ij", delta, delta)
+        np.maximum(distance_sq, 1e-4, out=distance_sq)
+        distance_sq[np.arange(len(block)), np.arange(start, start + len(block))] = np.inf  # No self-repulsion
+        displacement[start:start + block_size] = np.einsum("ijk,ij->ik", delta, 1.0 / distance_sq)
+    return displacement
+
+def _grid_repulsion(positions, nodes_per_cell=8, max_cells_per_side=48, block_size=1024):
+    # Every node is repelled by the centroid of each occupied grid cell, weighted by the
+    # number of nodes in it; its own cell's centroid is computed without the node itself
+    n = len(positions)
+    cells_per_side = max(1, min(max_cells_per_side, int(math.sqrt(n / nodes_per_cell))))
+    low = positions.min(axis=0)
+    extent = np.maximum(positions.max(axis=0) - low, 1e-9)
+    cell_xy = np.minimum((positions - low) / extent * cells_per_side, cells_per_side - 1).astype(np.int64)
+    cell = cell_xy[:, 0] * cells_per_side + cell_xy[:, 1]
+
+    occupied, cell = np.unique(cell, return_inverse=True)
+    counts = np.bincount(cell).astype(float)
+    sums = np.stack([np.bincount(cell, weights=positions[:, 0]), np.bincount(cell, weights=positions[:, 1])], axis=1)
+    centroids = sums / counts[:, None]
+
+    displacement = np.zeros_like(positions)
+    for start in range(0, n, block_size):
+        block = positions[start:start + block_size]
+        own = cell[start:start + block_size]
+        rows = np.arange(len(block))
+
+        delta = block[:, None, :] - centroids[None, :, :]
+        weights = np.broadcast_to(counts, (len(block), len(counts))).copy()
+
+        # Replace the own cell by the centroid of the other nodes in it
+        others = counts[own] - 1
+        with np.errstate(invalid="ignore", divide="ignore"):
+            own_centroid = (sums[own] - block) / others[:, None]
+        delta[rows, own] = np.where(others[:, None] > 0, block - own_centroid, 0.0)
+        weights[rows, own] = others
+
+        distance_sq = np.einsum("ijk,ijk->ij", delta, delta)
+        np.maximum(distance_sq, 1e-4, out=distance_sq)
+        displacement[start:start + block_size] = np.einsum("ijk,ij->ik", delta, weights / distance_sq)
+    return displacement
+
+def force_layout(num_nodes, edge_index, iterations=100, seed=0):
+    """
+    Fruchterman-Reingold force-directed layout, vectorized with NumPy.
+    `edge_index` is an (m, 2) integer array of node indices. Repulsion is exact for
+    small graphs and grid-approximated (O(n * cells) per iteration) for large ones.
+    Returns an (n, 2) array of positions with an ideal edge length of 1.
+    """
+    rng = np.random.default_rng(seed)
+    side = math.sqrt(max(num_nodes, 1))
+    positions = rng.uniform(-side / 2, side / 2, size=(num_nodes, 2))
+    if num_nodes < 2:
+        return positions
+
+    edge_index = np.asarray(edge_index, dtype=np.int64).reshape(-1, 2)
+    edge_index = edge_index[edge_index[:, 0] != edge_index[:, 1]]
+    repulsion = _exact_repulsion if num_nodes <= exact_repulsion_max_nodes else _grid_repulsion
+
+    temperature = side / 10
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        displacement = repulsion(positions)
+
+        # Attraction d^2 / k along every edge, applied to both endpoints
+        if len(edge_index):
+            delta = positions[edge_index[:, 0]] - positions[edge_index[:, 1]]
+            pull = delta * np.linalg.norm(delta, axis=1)[:, None]
+            for axis in range(2):
+                displacement[:, axis] -= np.bincount(edge_index[:, 0], weights=pull[:, axis], minlength=num_nodes)
+                displacement[:, axis] += np.bincount(edge_index[:, 1], weights=pull[:, axis], minlength=num_nodes)
+
+        # Move every node by at most the current temperature
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 1e-9)
+        positions += displacement / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature -= cooling
+
+    return positions
+
+def cached_layout(node_ids, edge_index, cache_dir, iterations=100, seed=0):
+    """
+    Returns the layout of the graph, loading it from `cache_dir` when a layout for
+    the same graph (by hash) has been computed before. Pass cache_dir=None to
+    always recompute.
+    """
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, graph_hash(node_ids, edge_index, iterations, seed) + ".npy")
+        if os.path.exists(cache_path):
+            positions = np.load(cache_path)
+            if positions.shape == (len(node_ids), 2):
+                return positions
+
+    positions = force_layout(len(node_ids), edge_index, iterations=iterations, seed=seed)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, positions)
+        os.replace(temp_path, cache_path)
+    return positions
+
+def file_signature(path):
+    """
+    Returns [absolute path, size, modification time] of a file, or None if it does not exist.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+def load_graph_index(path, index_dir, cache_dir=None, labels_path=None, iterations=100, seed=0, scale=120,
+                     spatial_classifier=None, temporal_classifier=None, signature_extra=None):
+    """
+    Returns the GraphIndex of an extraction output file. The index saved in `index_dir`
+    is memory-mapped if it was built from the same file (path, size and modification
+    time) with the same parameters; otherwise the graph is built, laid out and saved there.
+    `labels_path` is an entity index (entity_index.json) supplying labels for canonical IDs.
+    `signature_extra` is any JSON value whose change should also trigger a rebuild
+    (e.g. the scale vocabularies).
+    """
+    signature = json.loads(json.dumps({
+        "source": file_signature(path),
+        "labels": file_signature(labels_path),
+        "layout": [layout_version, iterations, seed, scale],
+        "extra": signature_extra
+    }))
+    if index_dir:
+        index = GraphIndex.load(index_dir)
+        if index is not None and index.meta.get("signature") == signature:
+            return index
+
+    labels = None
+    if labels_path and os.path.exists(labels_path):
+        with open(labels_path, 'r', encoding='utf-8') as f:
+            labels = json.load(f).get("labels")
+
+    graph_nodes, graph_edges = build_graph(iter_extraction_records(path), labels=labels)
+    node_ids = sorted(graph_nodes)
+    node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+    edge_keys = sorted(graph_edges)
+    edge_index = np.array([(node_index[source], node_index[target]) for source, target, _ in edge_keys], dtype=np.int64).reshape(-1, 2)
+    positions = cached_layout(node_ids, edge_index, cache_dir, iterations=iterations, seed=seed) * scale
+
+    index = GraphIndex.build(
+        node_ids, [graph_nodes[node_id] for node_id in node_ids], edge_index,
+        [label for _, _, label in edge_keys], [graph_edges[key] for key in edge_keys], positions,
+        spatial_classifier=spatial_classifier, temporal_classifier=temporal_classifier, signature=signature
+    )
+    if index_dir:
+        index.save(index_dir)
+        index = GraphIndex.load(index_dir)
+    return index
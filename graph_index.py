@@ -0,0 +1,358 @@
+import os
+import json
+import shutil
+from collections import deque
+import numpy as np
+
+def compact_ints(values):
+    """
+    Returns the values as an int32 array when they fit, otherwise as int64.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if values.size == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+        return values.astype(np.int32)
+    return values
+
+def intern(values):
+    """
+    Returns (codes, names): every distinct value gets an integer code, None gets -1.
+    """
+    values = [str(value) if value is not None else None for value in values]
+    names = sorted({value for value in values if value is not None})
+    codes = {name: i for i, name in enumerate(names)}
+    return np.array([codes[value] if value is not None else -1 for value in values], dtype=np.int32), names
+
+def build_csr(num_rows, rows, columns):
+    """
+    Builds a CSR layout of (row, column) pairs: `offsets` (num_rows + 1) such that
+    row i's columns are columns[offsets[i]:offsets[i + 1]], plus the permutation
+    applied to the pairs (to reorder any per-pair values the same way).
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows, kind="stable")
+    offsets = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=offsets[1:])
+    return offsets, compact_ints(np.asarray(columns, dtype=np.int64)[order]), order
+
+class StringTable:
+    """
+    Strings stored as one UTF-8 byte array plus offsets, so a table of millions of
+    labels can be memory-mapped instead of being loaded as Python objects.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, strings):
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def find(self, string):
+        """
+        Returns the position of `string` in a sorted table (binary search), or None.
+        """
+        key = string.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            value = bytes(self.data[self.offsets[middle]:self.offsets[middle + 1]])
+            if value < key:
+                low = middle + 1
+            elif value > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+class GraphIndex:
+    """
+    Compact knowledge-graph index: nodes have integer IDs (in node-ID order), the
+    undirected adjacency is stored in CSR form (offsets/neighbors/edge arrays), and
+    edge labels, node types, scales and source papers are interned as integer codes.
+    Saved as .npy arrays that `load` memory-maps, so startup does not depend on the
+    graph size and neighbor queries cost O(degree).
+    The Dash app serves bounded views from it (top-k nodes, filtered nodes, k-hop
+    neighborhoods) instead of sending the whole graph to the browser.
+    """
+
+    array_names = [
+        "node_id_data", "node_id_offsets", "label_data", "label_offsets", "node_types",
+        "mentions", "positions", "spatial", "temporal", "source_offsets", "source_codes",
+        "offsets", "neighbors", "neighbor_edges",
+        "edge_sources", "edge_targets", "edge_labels", "edge_weights"
+    ]
+
+    def __init__(self, arrays, meta):
+        for name in self.array_names:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.node_ids = StringTable(self.node_id_data, self.node_id_offsets)
+        self.labels = StringTable(self.label_data, self.label_offsets)
+        self.num_nodes = len(self.node_ids)
+        self.num_edges = len(self.edge_sources)
+        self.degree = np.diff(self.offsets)
+
+    @classmethod
+    def build(cls, node_ids, node_data, edge_index, edge_labels, edge_weights, positions,
+              spatial_classifier=None, temporal_classifier=None, signature=None):
+        """
+        Builds the index. `node_ids` must be sorted; `node_data[i]` holds the label, type,
+        mentions and sources of node i; `edge_index` is an (m, 2) array of node indices.
+        """
+        num_nodes = len(node_ids)
+        labels = [str(data.get("label") or node_id) for node_id, data in zip(node_ids, node_data)]
+        node_types, type_names = intern([data.get("type") for data in node_data])
+
+        # Scales are classified once for all labels, in one pass per classifier
+        spatial, spatial_names = intern(spatial_classifier.classify_many(labels) if spatial_classifier else [None] * num_nodes)
+        temporal, temporal_names = intern(temporal_classifier.classify_many(labels) if temporal_classifier else [None] * num_nodes)
+
+        source_lists = [sorted(data.get("sources") or ()) for data in node_data]
+        source_names = sorted({source for sources in source_lists for source in sources})
+        source_index = {source: i for i, source in enumerate(source_names)}
+        source_rows = np.repeat(np.arange(num_nodes), [len(sources) for sources in source_lists])
+        source_offsets, source_codes, _ = build_csr(
+            num_nodes, source_rows, [source_index[source] for sources in source_lists for source in sources]
+        )
+
+        # Undirected adjacency: every edge is listed under both endpoints (self-loops once)
+        edge_index = np.asarray(edge_index, dtype=np.int64).reshape(-1, 2)
+        edge_ids = np.arange(len(edge_index))
+        not_loop = edge_index[:, 0] != edge_index[:, 1]
+        rows = np.concatenate([edge_index[:, 0], edge_index[not_loop, 1]])
+        columns = np.concatenate([edge_index[:, 1], edge_index[not_loop, 0]])
+        offsets, neighbors, order = build_csr(num_nodes, rows, columns)
+        neighbor_edges = compact_ints(np.concatenate([edge_ids, edge_ids[not_loop]])[order])
+        edge_label_codes, edge_label_names = intern(edge_labels)
+
+        node_id_table = StringTable.build(node_ids)
+        label_table = StringTable.build(labels)
+        arrays = {
+            "node_id_data": node_id_table.data, "node_id_offsets": node_id_table.offsets,
+            "label_data": label_table.data, "label_offsets": label_table.offsets,
+            "node_types": node_types,
+            "mentions": compact_ints([data.get("mentions", 1) for data in node_data]),
+            "positions": np.asarray(positions, dtype=np.float32).reshape(-1, 2),
+            "spatial": spatial, "temporal": temporal,
+            "source_offsets": source_offsets, "source_codes": source_codes,
+            "offsets": offsets, "neighbors": neighbors, "neighbor_edges": neighbor_edges,
+            "edge_sources": compact_ints(edge_index[:, 0]), "edge_targets": compact_ints(edge_index[:, 1]),
+            "edge_labels": edge_label_codes, "edge_weights": compact_ints(edge_weights)
+        }
+        meta = {
+            "signature": signature,
+            "node_types": type_names,
+            "spatial_scales": spatial_names,
+            "temporal_scales": temporal_names,
+            "sources": source_names,
+            "edge_labels": edge_label_names
+        }
+        return cls(arrays, meta)
+
+    @classmethod
+    def from_elements(cls, nodes, edges, spatial_classifier=None, temporal_classifier=None):
+        """
+        Builds the index from Cytoscape node and edge elements (e.g. written by hand).
+        """
+        nodes = sorted(nodes, key=lambda node: str(node["data"]["id"]))
+        node_ids = [str(node["data"]["id"]) for node in nodes]
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        edges = [
+            edge for edge in edges
+            if str(edge["data"]["source"]) in index and str(edge["data"]["target"]) in index
+        ]
+        return cls.build(
+            node_ids,
+            [node["data"] for node in nodes],
+            [(index[str(edge["data"]["source"])], index[str(edge["data"]["target"])]) for edge in edges],
+            [edge["data"].get("label") for edge in edges],
+            [edge["data"].get("weight", 1) for edge in edges],
+            [(node.get("position", {}).get("x", 0), node.get("position", {}).get("y", 0)) for node in nodes],
+            spatial_classifier=spatial_classifier,
+            temporal_classifier=temporal_classifier
+        )
+
+    def save(self, directory):
+        """
+        Writes the arrays as .npy files plus a meta.json, replacing any index in `directory`.
+        """
+        temp_directory = directory.rstrip(os.sep) + ".tmp"
+        shutil.rmtree(temp_directory, ignore_errors=True)
+        os.makedirs(temp_directory)
+        for name in self.array_names:
+            np.save(os.path.join(temp_directory, name + ".npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(temp_directory, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temp_directory, directory)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads an index written by `save`, memory-mapping its arrays unless mmap=False.
+        Returns None if there is no complete index in `directory`.
+        """
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in cls.array_names:
+            path = os.path.join(directory, name + ".npy")
+            if not os.path.exists(path):
+                return None
+            arrays[name] = np.load(path, mmap_mode="r" if mmap else None)
+        return cls(arrays, meta)
+
+    def find(self, node_id):
+        """
+        Returns the integer ID of a node, or None.
+        """
+        return self.node_ids.find(str(node_id))
+
+    def label(self, node):
+        return self.labels[node]
+
+    def neighbors_of(self, node):
+        """
+        Returns the neighbor IDs of a node (a view into the CSR arrays).
+        """
+        return self.neighbors[self.offsets[node]:self.offsets[node + 1]]
+
+    def source_names(self):
+        """
+        Returns the sorted names of all source papers.
+        """
+        return list(self.meta["sources"])
+
+    def scale_names(self):
+        """
+        Returns the sorted (spatial, temporal) scales that occur in the graph.
+        """
+        return list(self.meta["spatial_scales"]), list(self.meta["temporal_scales"])
+
+    def top_nodes(self, k, rank_by="degree", spatial=None, temporal=None, source=None):
+        """
+        Returns the IDs of the `k` highest-ranked nodes (by "degree" or by
+        "mentions") among those matching the scale and source-paper filters.
+        """
+        mask = np.ones(self.num_nodes, dtype=bool)
+        for value, names, codes in (
+            (spatial, self.meta["spatial_scales"], self.spatial),
+            (temporal, self.meta["temporal_scales"], self.temporal)
+        ):
+            if value is not None:
+                if value not in names:
+                    return []
+                mask &= codes == names.index(value)
+        if source is not None:
+            if source not in self.meta["sources"]:
+                return []
+            entry_nodes = np.repeat(np.arange(self.num_nodes), np.diff(self.source_offsets))
+            has_source = np.zeros(self.num_nodes, dtype=bool)
+            has_source[entry_nodes[self.source_codes == self.meta["sources"].index(source)]] = True
+            mask &= has_source
+
+        candidates = np.flatnonzero(mask)
+        ranks = np.asarray(self.mentions if rank_by == "mentions" else self.degree)[candidates]
+        if len(candidates) > k:
+            selected = np.argpartition(-ranks, k - 1)[:k]
+            candidates, ranks = candidates[selected], ranks[selected]
+        order = np.lexsort((candidates, -ranks))
+        return candidates[order].tolist()
+
+    def neighborhood(self, node_id, hops=1, limit=None):
+        """
+        Returns the IDs of the nodes within `hops` edges of `node_id` (the node
+        itself first), in breadth-first order and at most `limit` of them.
+        """
+        start = self.find(node_id)
+        if start is None:
+            return []
+        seen = {start}
+        order = [start]
+        queue = deque([(start, 0)])
+        while queue:
+            node, distance = queue.popleft()
+            if distance == hops:
+                continue
+            for neighbor in self.neighbors_of(node).tolist():
+                if neighbor in seen:
+                    continue
+                if limit is not None and len(order) >= limit:
+                    return order
+                seen.add(neighbor)
+                order.append(neighbor)
+                queue.append((neighbor, distance + 1))
+        return order
+
+    def shortest_path(self, source_id, target_id, max_hops=None):
+        """
+        Returns the node IDs (as strings) on a shortest path between two nodes,
+        or None if they are not connected within `max_hops`.
+        """
+        start, goal = self.find(source_id), self.find(target_id)
+        if start is None or goal is None:
+            return None
+        parents = {start: None}
+        queue = deque([(start, 0)])
+        while queue:
+            node, distance = queue.popleft()
+            if node == goal:
+                path = []
+                while node is not None:
+                    path.append(self.node_ids[node])
+                    node = parents[node]
+                return path[::-1]
+            if max_hops is not None and distance == max_hops:
+                continue
+            for neighbor in self.neighbors_of(node).tolist():
+                if neighbor not in parents:
+                    parents[neighbor] = node
+                    queue.append((neighbor, distance + 1))
+        return None
+
+    def node_element(self, node):
+        data = {"id": self.node_ids[node], "label": self.labels[node], "mentions": int(self.mentions[node])}
+        if self.node_types[node] >= 0:
+            data["type"] = self.meta["node_types"][self.node_types[node]]
+        data["sources"] = [
+            self.meta["sources"][code]
+            for code in self.source_codes[self.source_offsets[node]:self.source_offsets[node + 1]].tolist()
+        ]
+        x, y = self.positions[node].tolist()
+        return {"data": data, "position": {"x": x, "y": y}}
+
+    def edge_element(self, edge):
+        label_code = self.edge_labels[edge]
+        return {"data": {
+            "id": f"edge-{edge}",
+            "source": self.node_ids[self.edge_sources[edge]],
+            "target": self.node_ids[self.edge_targets[edge]],
+            "label": self.meta["edge_labels"][label_code] if label_code >= 0 else "",
+            "weight": int(self.edge_weights[edge])
+        }}
+
+    def elements(self, node_indices):
+        """
+        Returns the Cytoscape elements of the given nodes and of the edges between them.
+        """
+        visible = np.unique(np.asarray(node_indices, dtype=np.int64))
+        edge_ids = []
+        for node in visible.tolist():
+            start, end = self.offsets[node], self.offsets[node + 1]
+            keep = np.isin(self.neighbors[start:end], visible)
+            edge_ids.append(np.asarray(self.neighbor_edges[start:end])[keep])
+        edge_ids = np.unique(np.concatenate(edge_ids)) if edge_ids else np.array([], dtype=np.int64)
+        return [self.node_element(node) for node in visible.tolist()] + [self.edge_element(edge) for edge in edge_ids.tolist()]
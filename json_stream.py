@@ -0,0 +1,88 @@
+import json
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON object of the form {"entities": [{...}, ...], "relationships": [{...}, ...]}
+    as it arrives piece by piece, returning each array element object as soon as its
+    closing brace is seen. Text before the object (e.g. a code fence) is skipped, and
+    the objects completed before a truncation are kept.
+
+    `decoders` maps array keys to functions turning an element (an object or an array,
+    as in compact encodings like {"e": [["e1", "RuBisCO", "enzyme"], ...]}) into a
+    record, or None to drop it; without a decoder, only object elements are kept.
+    """
+
+    def __init__(self, array_keys=("entities", "relationships"), decoders=None):
+        self.records = {key: [] for key in array_keys}
+        self.decoders = decoders or {}
+        self.done = False
+        self._stack = []  # Open brackets
+        self._in_string = False
+        self._escape = False
+        self._string = []  # Characters of the current string in the top-level object
+        self._key = None  # Last key seen in the top-level object
+        self._element = None  # Characters of the current array element object
+
+    def feed(self, text):
+        """
+        Consumes the next piece of text and returns the (key, object) pairs completed by it.
+        """
+        completed = []
+        for char in text:
+            if self.done:
+                break
+            if not self._stack and char != "{":
+                continue  # Text before the top-level object
+            if self._element is not None:
+                self._element.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    continue
+                if len(self._stack) == 1:
+                    self._string.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if len(self._stack) == 1:
+                    self._string = []
+            elif char == ":" and len(self._stack) == 1:
+                self._key = "".join(self._string)
+            elif char in "{[":
+                self._stack.append(char)
+                if len(self._stack) == 3 and self._stack[1] == "[":
+                    self._element = [char]  # Start of an element inside a top-level array
+            elif char in "}]":
+                self._stack.pop()
+                if self._element is not None and len(self._stack) == 2:
+                    record = self._parse_element()
+                    if record is not None and self._key in self.records:
+                        self.records[self._key].append(record)
+                        completed.append((self._key, record))
+                if not self._stack:
+                    self.done = True
+        return completed
+
+    def _parse_element(self):
+        element = "".join(self._element)
+        self._element = None
+        try:
+            record = json.loads(element)
+        except json.JSONDecodeError:
+            return None
+        decoder = self.decoders.get(self._key)
+        if decoder is not None:
+            return decoder(record)
+        return record if isinstance(record, dict) else None
+
+    def result(self):
+        """
+        Returns the objects parsed so far as {key: [object, ...]}.
+        """
+        return {key: list(records) for key, records in self.records.items()}
@@ -0,0 +1,121 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+class LLMCache:
+    """
+    Persistent on-disk cache for LLM responses, shared by paper_evaluation.py and
+    entity_extraction.py. Entries are keyed by a hash of the model, system prompt,
+    user prompt and chunk text, so identical chunks across papers and re-runs are
+    answered without an API call.
+    """
+
+    def __init__(self, path, max_entries=None, max_age=None, evict_every=1000):
+        """
+        `max_entries` caps the number of stored responses (least recently used are
+        evicted first) and `max_age` (in seconds) expires old responses. Eviction runs
+        on open and after every `evict_every` insertions.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(model, system_prompt, user_prompt, chunk):
+        """
+        Returns the content hash identifying a request.
+        """
+        payload = json.dumps([model, system_prompt, user_prompt, chunk], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model, system_prompt, user_prompt, chunk):
+        """
+        Returns the cached response text for the request, or None on a miss.
+        """
+        key = self.make_key(model, system_prompt, user_prompt, chunk)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, model, system_prompt, user_prompt, chunk, response):
+        """
+        Stores the response text for the request.
+        """
+        key = self.make_key(model, system_prompt, user_prompt, chunk)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            run_eviction = self._puts % self.evict_every == 0
+
+        if run_eviction:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes expired entries and, if over `max_entries`, the least recently used ones.
+        """
+        with self._lock:
+            if self.max_age is not None:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+            if self.max_entries is not None:
+                self._conn.execute("""
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Returns hit/miss counters for this session and the number of stored entries.
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
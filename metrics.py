@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (in seconds) of the timing histogram buckets
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Paper whose work is being done, attributed to token usage and trace events
+current_paper = contextvars.ContextVar("current_paper", default=None)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "buckets": {str(bound): count for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts)}
+        }
+
+class Metrics:
+    """
+    Thread-safe registry of per-stage timing histograms, counters and token usage.
+    Every observation can also be appended to a JSON-Lines trace file.
+    """
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        self.histograms = {}  # stage -> Histogram
+        self.counters = {}  # name -> value
+        self.tokens = {}  # model -> {"prompt_tokens": ..., "completion_tokens": ..., "total_tokens": ...}
+        self.paper_tokens = {}  # paper -> total tokens
+        self._trace = None
+        self._lock = threading.Lock()
+
+    def open_trace(self, path):
+        """
+        Starts appending trace events (one JSON object per line) to `path`.
+        """
+        with self._lock:
+            self._trace = open(path, 'a', encoding='utf-8')
+
+    def _write_event(self, event):
+        # Called with the lock held
+        if self._trace is not None:
+            paper = current_paper.get()
+            if paper is not None:
+                event["paper"] = paper
+            self._trace.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+    def observe(self, stage, seconds, start=None, **attributes):
+        """
+        Records the duration of one `stage` operation.
+        """
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+            self._write_event(dict(
+                attributes, event="span", stage=stage,
+                start=round(start if start is not None else time.time() - seconds, 6), seconds=round(seconds, 6)
+            ))
+
+    @contextmanager
+    def timer(self, stage, **attributes):
+        """
+        Times the enclosed block as one `stage` operation (also when it raises).
+        """
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, start=start, **attributes)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_usage(self, model, usage, estimated=False):
+        """
+        Adds the token usage of one API response ({"prompt_tokens", "completion_tokens",
+        "total_tokens"}) to the model's and the current paper's totals.
+        """
+        prompt_tokens = int(usage.get("prompt_tokens") or 0)
+        completion_tokens = int(usage.get("completion_tokens") or 0)
+        total_tokens = int(usage.get("total_tokens") or prompt_tokens + completion_tokens)
+        paper = current_paper.get()
+        with self._lock:
+            totals = self.tokens.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["total_tokens"] += total_tokens
+            if paper is not None:
+                self.paper_tokens[paper] = self.paper_tokens.get(paper, 0) + total_tokens
+            self._write_event({
+                "event": "usage", "time": round(time.time(), 6), "model": model, "estimated": estimated,
+                "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": total_tokens
+            })
+
+    def reset(self):
+        """
+        Clears the recorded histograms, counters and token totals.
+        """
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.tokens = {}
+            self.paper_tokens = {}
+
+    def summary(self):
+        with self._lock:
+            return {
+                "stages": {stage: histogram.to_dict() for stage, histogram in sorted(self.histograms.items())},
+                "counters": dict(sorted(self.counters.items())),
+                "tokens": {model: dict(totals) for model, totals in self.tokens.items()},
+                "paper_tokens": dict(self.paper_tokens)
+            }
+
+    def write_summary(self, path):
+        """
+        Writes the summary (histograms, counters, token totals) to a JSON file.
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=4)
+        os.replace(temp_path, path)
+
+    def prometheus_text(self):
+        """
+        Renders the metrics in the Prometheus text exposition format.
+        """
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = []
+        with self._lock:
+            lines.append("# TYPE pipeline_stage_seconds histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'pipeline_stage_seconds_bucket{{stage="{escape(stage)}",le="{bound}"}} {cumulative}')
+                lines.append(f'pipeline_stage_seconds_sum{{stage="{escape(stage)}"}} {histogram.sum}')
+                lines.append(f'pipeline_stage_seconds_count{{stage="{escape(stage)}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE pipeline_{name}_total counter")
+                lines.append(f"pipeline_{name}_total {value}")
+            lines.append("# TYPE pipeline_tokens_total counter")
+            for model, totals in sorted(self.tokens.items()):
+                for kind in ("prompt_tokens", "completion_tokens"):
+                    lines.append(f'pipeline_tokens_total{{model="{escape(model)}",kind="{kind[:-7]}"}} {totals[kind]}')
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+# Registry shared by every module of the pipeline
+metrics = Metrics()
+
+@contextmanager
+def paper_context(paper):
+    """
+    Attributes the work done in the enclosed block (on this thread) to `paper`.
+    """
+    token = current_paper.set(paper)
+    try:
+        yield
+    finally:
+        current_paper.reset(token)
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """
+    Submits `fn` to a thread pool so that it runs with the caller's paper context.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def start_metrics_server(port, host="127.0.0.1", registry=metrics):
+    """
+    Serves the registry at http://<host>:<port>/metrics in the Prometheus text format
+    from a background thread. Returns the server.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,285 @@
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from chunking import approximate_token_count
+
+# Simulated latency (in seconds) added to every completion request, and per-model
+# overrides (e.g. {"gpt-3.5-turbo": 0.1} for a faster model)
+latency = 0.5
+model_latency = {}
+
+# Streamed responses (stream=True) are sent in pieces of this many characters,
+# with the latency spread over them
+stream_piece_size = 16
+
+# Fraction of requests answered with 429 Too Many Requests, and the Retry-After
+# (in seconds) sent with them
+rate_limit_probability = 0.0
+retry_after = 1.0
+
+# Fraction of free-text answers that come back malformed (cut off at a random point, as
+# when an answer runs into max_tokens); function call answers follow their schema
+malformed_probability = 0.0
+
+# Scores differ between models by up to this many points, by a deterministic per-model
+# offset, so a model cascade shows drift against the model it screens for
+model_score_spread = 1.5
+
+# Vocabulary of the fake extraction results
+fake_entities = [
+    ("RuBisCO", "enzyme"), ("Chloroplast", "organelle"), ("Stomatal conductance", "process"),
+    ("Photosystem II", "protein complex"), ("Leaf nitrogen content", "trait"), ("Elevated CO2", "condition"),
+    ("Calvin cycle", "pathway"), ("Canopy photosynthesis", "process"), ("Drought stress", "condition")
+]
+fake_relationship_types = ["LOCATED_IN", "REGULATES", "LIMITS", "INCREASES", "PART_OF"]
+
+def fake_extraction(digest):
+    """
+    Returns a deterministic extraction result with a few entities and relationships.
+    """
+    count = 4 + digest[2] % 4
+    entities = [
+        {"id": f"e{i + 1}", "label": label, "type": entity_type,
+         "properties": {"context": "leaf level" if digest[i] % 2 else "canopy level"}}
+        for i, (label, entity_type) in enumerate(fake_entities[digest[3] % 3:][:count])
+    ]
+    relationships = [
+        {"from": f"e{i + 1}", "to": f"e{(i + 1) % len(entities) + 1}",
+         "type": fake_relationship_types[digest[i + 4] % len(fake_relationship_types)]}
+        for i in range(len(entities) - 1)
+    ]
+    return {"entities": entities, "relationships": relationships}
+
+def model_offset(model, user_content):
+    """
+    Returns the deterministic (depth, coverage) offset of `model`'s scores for a prompt,
+    each within +-`model_score_spread` / 2.
+    """
+    digest = hashlib.sha256(f"{model}\0{user_content}".encode("utf-8")).digest()
+    return tuple((digest[i] / 255 - 0.5) * model_score_spread for i in range(2))
+
+def fake_completion_content(messages, function_name=None, model=None):
+    """
+    Builds a deterministic response for the given chat messages. Scoring prompts
+    get scores in the format parsed by paper_evaluation.py, anything else gets
+    an entity/relationship JSON in the shape expected by entity_extraction.py.
+    Scores are offset per `model`, so different models score the same prompt differently.
+    With a `function_name`, the arguments of that function call are returned instead,
+    in the compact encoding of compact_schema.py.
+    """
+    user_content = messages[-1]["content"] if messages else ""
+    digest = hashlib.sha256(user_content.encode("utf-8")).digest()
+    depth_offset, coverage_offset = model_offset(model, user_content)
+    scientific_depth = min(10.0, max(0.0, digest[0] / 255 * 10 + depth_offset))
+    domain_coverage = min(10.0, max(0.0, digest[1] / 255 * 10 + coverage_offset))
+
+    if function_name == "record_scores":
+        return json.dumps({"d": round(scientific_depth, 2), "c": round(domain_coverage, 2)})
+    if function_name == "record_graph":
+        data = fake_extraction(digest)
+        return json.dumps({
+            "e": [
+                [entity["id"], entity["label"], entity["type"]]
+                + [f"{key}={value}" for key, value in entity["properties"].items()]
+                for entity in data["entities"]
+            ],
+            "r": [[relationship["from"], relationship["to"], relationship["type"]] for relationship in data["relationships"]]
+        }, separators=(",", ":"))
+
+    if "Extract entities" in user_content:
+        content = "```json\n" + json.dumps(fake_extraction(digest), indent=2) + "\n```"
+    else:
+        content = (
+            f"Scientific depth: {scientific_depth:.2f}\n"
+            f"Domain coverage: {domain_coverage:.2f}\n"
+            "Feedback: Mock response. Deepen the discussion of the molecular mechanisms and connect "
+            "the findings to canopy-scale and environmental processes."
+        )
+    if random.random() < malformed_probability:
+        content = content[:random.randrange(len(content))]
+    return content
+
+def function_name(body):
+    """
+    Returns the name of the function a request makes the model call, or None.
+    """
+    function_call = body.get("function_call")
+    return function_call.get("name") if isinstance(function_call, dict) else None
+
+def fake_completion(body):
+    """
+    Wraps the fake content in a ChatCompletion response object.
+    """
+    messages = body.get("messages", [])
+    name = function_name(body)
+    content = fake_completion_content(messages, name, body.get("model"))
+    prompt_tokens = sum(approximate_token_count(message.get("content") or "") for message in messages)
+    completion_tokens = approximate_token_count(content)
+    if name:
+        message = {"role": "assistant", "content": None, "function_call": {"name": name, "arguments": content}}
+    else:
+        message = {"role": "assistant", "content": content}
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "function_call" if name else "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+def run_fake_batch(requests_path, results_path):
+    """
+    Local stand-in for the Batch API: answers every request of a batch input
+    JSONL file and writes the results JSONL in the Batch API output format.
+    """
+    count = 0
+    with open(requests_path, 'r', encoding='utf-8') as requests_file, \
+            open(results_path, 'w', encoding='utf-8') as results_file:
+        for line in requests_file:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            results_file.write(json.dumps({
+                "id": f"batch_req_{count}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": f"req_{count}", "body": fake_completion(request["body"])},
+                "error": None
+            }) + "\n")
+            count += 1
+    return count
+
+class MockCompletionHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if random.random() < rate_limit_probability:
+            self.send_rate_limited()
+            return
+        if body.get("stream"):
+            self.stream_completion(body)
+            return
+        time.sleep(model_latency.get(body.get("model"), latency))
+
+        payload = json.dumps(fake_completion(body)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_rate_limited(self):
+        """
+        Rejects the request like the API does when a rate limit is exceeded.
+        """
+        payload = json.dumps({"error": {
+            "message": "Rate limit reached (mock server).",
+            "type": "requests",
+            "param": None,
+            "code": "rate_limit_exceeded"
+        }}).encode("utf-8")
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Retry-After", str(retry_after))
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def stream_completion(self, body):
+        """
+        Sends the completion as server-sent events in the ChatCompletion chunk format.
+        """
+        name = function_name(body)
+        content = fake_completion_content(body.get("messages", []), name, body.get("model"))
+        pieces = [content[i:i + stream_piece_size] for i in range(0, len(content), stream_piece_size)]
+        delay = model_latency.get(body.get("model"), latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def send_event(delta, finish_reason=None):
+            event = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            self.wfile.write(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+            self.wfile.flush()
+
+        if name:
+            send_event({"role": "assistant", "content": None, "function_call": {"name": name, "arguments": ""}})
+        else:
+            send_event({"role": "assistant"})
+        for piece in pieces:
+            time.sleep(delay / max(len(pieces), 1))
+            send_event({"function_call": {"arguments": piece}} if name else {"content": piece})
+        send_event({}, "function_call" if name else "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet while benchmarking
+
+def run_server(host="127.0.0.1", port=8000):
+    """
+    Serves mock ChatCompletion responses until interrupted.
+    Point the scripts at it with OPENAI_API_BASE=http://<host>:<port>/v1.
+    """
+    server = ThreadingHTTPServer((host, port), MockCompletionHandler)
+    print(f"Mock completion server listening on http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def start_server_thread(host="127.0.0.1", port=0):
+    """
+    Serves mock ChatCompletion responses from a background thread (port 0 picks a
+    free port). Returns the server; its address is `server.server_address`.
+    """
+    server = ThreadingHTTPServer((host, port), MockCompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock ChatCompletion server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=latency, help="Seconds to wait before each response")
+    parser.add_argument("--rate-limit", type=float, default=rate_limit_probability,
+                        help="Fraction of requests answered with 429 Too Many Requests")
+    parser.add_argument("--retry-after", type=float, default=retry_after, help="Retry-After (in seconds) sent with 429s")
+    parser.add_argument("--malformed", type=float, default=malformed_probability,
+                        help="Fraction of free-text answers cut off at a random point")
+    parser.add_argument("--batch", nargs=2, metavar=("REQUESTS", "RESULTS"),
+                        help="Process a batch requests JSONL file into a results JSONL file and exit")
+    args = parser.parse_args()
+
+    malformed_probability = args.malformed
+    if args.batch:
+        count = run_fake_batch(*args.batch)
+        print(f"Processed {count} batch requests into {args.batch[1]}")
+    else:
+        latency = args.latency
+        rate_limit_probability = args.rate_limit
+        retry_after = args.retry_after
+        run_server(args.host, args.port)
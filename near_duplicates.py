@@ -0,0 +1,258 @@
+import re
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+word_pattern = re.compile(r"\w+")
+
+# Modulus of the MinHash permutations (a Mersenne prime larger than the 32-bit shingle hashes)
+minhash_prime = (1 << 61) - 1
+
+def task_scope(*parts):
+    """
+    Returns a short ID for the task the results belong to (e.g. the model and its
+    prompt), so results are only reused for the same kind of request.
+    """
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def shingle_hashes(text, size=5):
+    """
+    Returns the 32-bit hashes of the word `size`-grams of the text (case and
+    punctuation ignored), or of the whole text if it has fewer words.
+    """
+    words = word_pattern.findall(text.lower())
+    if len(words) <= size:
+        return np.array([zlib.crc32(" ".join(words).encode("utf-8"))], dtype=np.uint64)
+    return np.unique(np.fromiter(
+        (zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)),
+        dtype=np.uint64, count=len(words) - size + 1
+    ))
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of the chunks sent to the API, stored in SQLite (WAL mode).
+    Each chunk is signed with `num_perm` MinHash values of its word shingles; the
+    signatures are split into `bands` bands, and chunks sharing a band are compared
+    by their estimated Jaccard similarity. A chunk at least `threshold` similar to
+    one already indexed is a near-duplicate, and the earlier result can be reused.
+    Results are kept per `scope`, and every reuse is recorded for auditing.
+    """
+
+    def __init__(self, path, scope, threshold=0.85, num_perm=128, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.scope = scope
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._lock = threading.Lock()
+
+        # Random permutations h(x) = (a * x + b) mod p; a * x stays below 2^63
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)[:, None]
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)[:, None]
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                entry_id INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                name TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                signature BLOB NOT NULL,
+                result TEXT,
+                created_at REAL NOT NULL,
+                UNIQUE (scope, name, chunk_index)
+            );
+            CREATE TABLE IF NOT EXISTS matches (
+                scope TEXT NOT NULL,
+                name TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                duplicate_of_name TEXT NOT NULL,
+                duplicate_of_chunk INTEGER NOT NULL,
+                similarity REAL NOT NULL,
+                action TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (scope, name, chunk_index)
+            );
+        """)
+        self._conn.commit()
+
+        # LSH buckets and signatures of this scope, loaded once; results still being
+        # computed in this session have an event that is set when they arrive
+        self._buckets = {}
+        self._entries = {}  # entry_id -> (name, chunk_index, signature)
+        self._pending = {}  # entry_id -> threading.Event
+        for entry_id, name, chunk_index, signature in self._conn.execute(
+            "SELECT entry_id, name, chunk_index, signature FROM chunks WHERE scope = ? AND result IS NOT NULL", (scope,)
+        ):
+            self._add_entry(entry_id, name, chunk_index, np.frombuffer(signature, dtype=np.uint64))
+
+    def signature(self, text):
+        """
+        Returns the MinHash signature of the text.
+        """
+        hashes = shingle_hashes(text, self.shingle_size)
+        return ((self._a * hashes[None, :] + self._b) % minhash_prime).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _add_entry(self, entry_id, name, chunk_index, signature):
+        self._entries[entry_id] = (name, chunk_index, signature)
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(entry_id)
+
+    def _remove_entry(self, entry_id):
+        _, _, signature = self._entries.pop(entry_id)
+        for key in self._band_keys(signature):
+            self._buckets[key].remove(entry_id)
+
+    def _best_match(self, signature, name, chunk_index):
+        candidates = {entry_id for key in self._band_keys(signature) for entry_id in self._buckets.get(key, ())}
+        best = None
+        for entry_id in candidates:
+            other_name, other_index, other_signature = self._entries[entry_id]
+            if (other_name, other_index) == (name, chunk_index):
+                continue
+            similarity = float(np.mean(signature == other_signature))
+            if similarity >= self.threshold and (best is None or similarity > best["similarity"]):
+                best = {"entry_id": entry_id, "name": other_name, "chunk_index": other_index, "similarity": similarity}
+        return best
+
+    def claim(self, name, chunk_index, text):
+        """
+        Looks the chunk up as it is produced. Returns the closest near-duplicate
+        already indexed ({"entry_id", "name", "chunk_index", "similarity"}), or None
+        after indexing the chunk as pending; its result must then be passed to
+        `resolve`. Near-duplicates are not indexed themselves.
+        """
+        signature = self.signature(text)
+        with self._lock:
+            match = self._best_match(signature, name, chunk_index)
+            if match is not None:
+                return match
+
+            # A chunk processed again (e.g. after an interrupted run) replaces its entry
+            row = self._conn.execute(
+                "SELECT entry_id FROM chunks WHERE scope = ? AND name = ? AND chunk_index = ?", (self.scope, name, chunk_index)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM chunks WHERE entry_id = ?", row)
+                if row[0] in self._entries:
+                    self._remove_entry(row[0])
+            entry_id = self._conn.execute(
+                "INSERT INTO chunks (scope, name, chunk_index, signature, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.scope, name, chunk_index, signature.tobytes(), time.time())
+            ).lastrowid
+            self._conn.commit()
+            self._add_entry(entry_id, name, chunk_index, signature)
+            self._pending[entry_id] = threading.Event()
+            return None
+
+    def resolve(self, name, chunk_index, result):
+        """
+        Stores the result of a chunk indexed by `claim`. A result of None (the request
+        failed) removes the chunk from the index, so a later near-duplicate is sent.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry_id FROM chunks WHERE scope = ? AND name = ? AND chunk_index = ?", (self.scope, name, chunk_index)
+            ).fetchone()
+            if row is None:
+                return
+            entry_id = row[0]
+            if result is None:
+                self._conn.execute("DELETE FROM chunks WHERE entry_id = ?", (entry_id,))
+                if entry_id in self._entries:
+                    self._remove_entry(entry_id)
+            else:
+                self._conn.execute(
+                    "UPDATE chunks SET result = ? WHERE entry_id = ?", (json.dumps(result, ensure_ascii=False), entry_id)
+                )
+            self._conn.commit()
+            event = self._pending.pop(entry_id, None)
+        if event is not None:
+            event.set()
+
+    def result(self, match, timeout=None):
+        """
+        Returns the result of a matched chunk, waiting up to `timeout` seconds if it is
+        still being computed. Returns None if it failed, was not ready in time, or was
+        left unfinished by an earlier run.
+        """
+        with self._lock:
+            event = self._pending.get(match["entry_id"])
+        if event is not None and not event.wait(timeout):
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM chunks WHERE entry_id = ?", (match["entry_id"],)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def record_match(self, name, chunk_index, match, action):
+        """
+        Records that a chunk was handled as a near-duplicate of `match` ("reused" or "skipped").
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO matches (scope, name, chunk_index, duplicate_of_name, duplicate_of_chunk, "
+                "similarity, action, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.scope, name, chunk_index, match["name"], match["chunk_index"], match["similarity"], action, time.time())
+            )
+            self._conn.commit()
+
+    def report(self):
+        """
+        Returns the near-duplicate report of this scope: one row per pair of papers
+        ({"name", "duplicate_of", "chunks", "mean_similarity", "actions"}), most
+        duplicated chunks first, plus the number of chunks indexed and of API calls saved.
+        """
+        return duplicate_report(self._conn, self._lock, self.scope)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def duplicate_report(conn, lock=None, scope=None):
+    """
+    Builds the report of `NearDuplicateIndex.report` from an open database,
+    for one scope or (if None) all of them.
+    """
+    where, params = (" WHERE scope = ?", (scope,)) if scope is not None else ("", ())
+    with lock or threading.Lock():
+        pairs = conn.execute(
+            "SELECT name, duplicate_of_name, COUNT(*), AVG(similarity), GROUP_CONCAT(DISTINCT action) "
+            f"FROM matches{where} GROUP BY scope, name, duplicate_of_name ORDER BY COUNT(*) DESC, name", params
+        ).fetchall()
+        indexed = conn.execute(f"SELECT COUNT(*) FROM chunks{where}", params).fetchone()[0]
+        saved = conn.execute(f"SELECT COUNT(*) FROM matches{where}", params).fetchone()[0]
+    return {
+        "chunks_indexed": indexed,
+        "calls_saved": saved,
+        "pairs": [
+            {"name": name, "duplicate_of": duplicate_of, "chunks": chunks,
+             "mean_similarity": round(similarity, 3), "actions": actions}
+            for name, duplicate_of, chunks, similarity, actions in pairs
+        ]
+    }
+
+def print_report(report):
+    print(f"Near-duplicates: {report['calls_saved']} API calls saved, {report['chunks_indexed']} chunks indexed")
+    for pair in report["pairs"]:
+        print(f"  {pair['name']}: {pair['chunks']} chunk(s) near-duplicate of {pair['duplicate_of']} "
+              f"(mean similarity {pair['mean_similarity']}, {pair['actions']})")
+
+if __name__ == "__main__":
+    # Example: python near_duplicates.py near_duplicates.sqlite
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else "near_duplicates.sqlite")
+    print_report(duplicate_report(conn))
+    conn.close()
@@ -1,22 +1,127 @@
 import os
+import sys
+import argparse
 import csv
-import PyPDF2
 import openai
 import json
-import time
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pdf_pipeline import iter_extracted_texts, open_text_cache, default_text_extractor, extractor_version
+from llm_cache import LLMCache
+from text_cache import TextCache
+from run_ledger import RunLedger, file_document_id
+from batch_jobs import parse_custom_id, append_document_requests, iter_batch_results
+from chunking import iter_chunks, chunk_budget, get_token_counter
+from section_index import SectionIndex, section_names, find_sections, select_sections
+from near_duplicates import NearDuplicateIndex, task_scope, print_report
+from compact_schema import (
+    scoring_function, function_call_request, schema_cache_prompt, message_text,
+    parse_score_arguments, output_stats, print_output_stats
+)
+from cascade import CascadeStats, heuristic_scores, in_band, audit_sample, print_cascade_report
+from api_client import RateLimitedClient, request_prompt_tokens
+from metrics import metrics, paper_context, submit_with_context, start_metrics_server
 
 # Set your OpenAI API key
 # Example: openai.api_key = os.getenv("OPENAI_API_KEY") 
 openai.api_key = "YOUR_OPENAI_API_KEY"
 
+# Optionally point the client at another endpoint, e.g. the local mock server
+# Example: OPENAI_API_BASE=http://127.0.0.1:8000/v1 (see mock_completion_server.py)
+openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
+
 # Folder path where the PDF files (papers) are stored
 # Example: folder_path = "/path/to/your/papers"
 folder_path = "/path/to/your/papers"
 
-# Paths to the CSV output file and checkpoint
+# Paths to the CSV output file and the run ledger
 csv_file_path = "evaluation_results.csv"
-checkpoint_path = "checkpoint.json"
+ledger_path = "evaluation_ledger.sqlite"
+
+# Model used to score each chunk
+evaluation_model = "gpt-4"  # Change model if needed
+
+# Answer with a record_scores function call instead of free text (or pass --structured)
+structured_outputs = False
+
+# Model cascade (or pass --cascade): screening model, uncertainty band and audit sample rate
+cascade_mode = False
+screening_model = "gpt-3.5-turbo"  # Or "heuristic" for the local keyword scorer
+cascade_band = (4.0, 6.5)
+cascade_audit_rate = 0.05
+cascade_report_path = "cascade_report.json"
+
+# Price per 1000 (prompt, completion) tokens, for the cascade's cost report
+model_prices = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+
+# Chunking: the model's context window, room kept for the answer and overlap between chunks
+model_context_window = 8192
+response_token_reserve = 1024
+chunk_overlap_tokens = 0
+count_tokens = get_token_counter(evaluation_model)
+
+# Response cache shared with entity_extraction.py, and its size and age limits (None to disable)
+llm_cache_path = "llm_cache.sqlite"
+llm_cache_max_entries = 200000
+llm_cache_max_age = 90 * 24 * 3600
+response_cache = None  # Opened in __main__
+
+# Near-duplicate chunks: record of matches (None to disable), similarity threshold, "reuse" or "skip"
+near_duplicates_path = "near_duplicates.sqlite"
+near_duplicate_threshold = 0.85
+near_duplicate_action = "reuse"
+near_duplicate_wait = 600
+duplicate_index = None  # Opened in __main__
+
+# Sections of each paper to score, or None for the whole text (or pass --sections)
+selected_sections = ["abstract", "introduction", "methods", "results", "discussion", "conclusion"]
+
+# Record of the sections found in each PDF (None to disable)
+section_index_path = "section_index.sqlite"
+section_index = None  # Opened in __main__
+
+# Cache of extracted PDF pages, shared with entity_extraction.py (None to disable)
+text_cache_path = "text_cache.sqlite"
+text_cache = None  # Opened in __main__
+
+# Attempts at a chunk before it is given up and its paper marked "incomplete"
+max_chunk_attempts = 3
+
+# Chunks scored in parallel per paper, papers in parallel, and API requests in flight
+max_concurrent_chunks = 4
+max_concurrent_papers = 2
+max_concurrent_requests = 8
+
+# Account rate limits (requests and tokens per minute; None for no limit)
+requests_per_minute = None
+tokens_per_minute = None
+
+# PDF parsing processes, and parsed texts waiting for the API stage
+extraction_workers = os.cpu_count()
+extraction_queue_size = 8
+
+# PDF text extractor; "PyPDF2" gives the text of earlier versions of this script
+text_extractor = default_text_extractor
+
+# Paths to the metrics trace and summary, and the Prometheus port (None to disable)
+metrics_trace_path = "evaluation_trace.jsonl"
+metrics_summary_path = "evaluation_metrics.json"
+metrics_port = None
+
+# API client shared by every paper: rate limits, retries and adaptive concurrency
+api_client = RateLimitedClient(
+    requests_per_minute=requests_per_minute,
+    tokens_per_minute=tokens_per_minute,
+    max_concurrency=max_concurrent_requests,
+    count_tokens=count_tokens
+)
 
 # System prompt to provide strict scoring metrics and instructions
 system_prompt = """
@@ -49,41 +154,64 @@ As a leading researcher in the fields of plant physiology, biochemistry, biology
 - Ensure that feedback is precise, actionable, and geared towards elevating the quality, clarity, and depth of future scientific discussions, thereby fostering unbiased and meaningful progress in photosynthesis research.
 """
 
-def split_text_into_chunks(text, max_tokens=4000):
-    """
-    Splits a given text into multiple chunks to keep each segment within the maximum token limit.
-    """
-    words = text.split()
-    chunks = []
-    chunk = []
-    chunk_length = 0
+# Short prompt for the screening model of the cascade
+screening_system_prompt = """
+You screen sections of photosynthesis research papers. Rate the scientific depth (accuracy and detail of
+the photosynthesis science) and the domain coverage (breadth of related fields: plant physiology, biochemistry,
+photochemistry, plant architecture, environmental science, agronomy, climatology, environmental engineering)
+from 0.00 to 10.00 each. Reference lists, author lists and boilerplate score near 0.00.
+"""
 
-    for word in words:
-        chunk.append(word)
-        # Approximate token count by character length + spaces
-        chunk_length += len(word) + 1
-        if chunk_length >= max_tokens:
-            chunks.append(' '.join(chunk))
-            chunk = []
-            chunk_length = 0
+# How the screening model is told to answer, in free text or with the `record_scores` function call
+screening_answer_formats = {
+    "free text": "Answer only with:\nScientific depth: <score>\nDomain coverage: <score>\n",
+    "function call": "Answer only by calling record_scores with the scientific depth as d and the domain coverage as c.\n"
+}
 
-    if chunk:
-        chunks.append(' '.join(chunk))
+# Token budget for each chunk: the context window minus the prompts and room for the answer
+chunk_max_tokens = chunk_budget(model_context_window, count_tokens(system_prompt) + 100, response_token_reserve)
 
-    return chunks
+# Settings that determine the chunks of a text, part of each paper's ID in the run ledger
+chunk_parameters = {"max_tokens": chunk_max_tokens, "overlap_tokens": chunk_overlap_tokens, "model": evaluation_model}
 
-def analyze_full_paper(text):
+def document_parameters(cascade=None):
     """
-    Analyzes the full text of a paper by splitting it into chunks, then calling the OpenAI API
-    to evaluate scientific depth and domain coverage for each chunk.
+    Returns the settings that are part of each paper's ID in the run ledger besides its
+    file hash: the extractor, the section selection, the chunking settings and, in
+    cascade mode (`cascade_mode` unless `cascade` is given), the cascade settings, so a
+    paper resumed with other settings starts afresh instead of mixing the two kinds of scores.
     """
-    chunks = split_text_into_chunks(text)
-    scientific_depth_total = 0.0
-    domain_coverage_total = 0.0
-    count = 0
+    parameters = dict(
+        chunk_parameters, sections=selected_sections,
+        extractor=text_extractor, extractor_version=extractor_version(text_extractor)
+    )
+    if cascade is None:
+        cascade = cascade_mode
+    if cascade:
+        parameters["cascade"] = {
+            "screening_model": screening_model, "band": list(cascade_band), "audit_rate": cascade_audit_rate
+        }
+    return parameters
 
-    for chunk in chunks:
-        prompt = f"""
+def split_text_into_chunks(text, max_tokens=chunk_max_tokens):
+    """
+    Splits a given text (a string or consecutive pieces such as pages) into chunks within
+    the maximum token limit, yielding each chunk as soon as it is filled.
+    Chunks end on sentence boundaries and new sections start new chunks where possible.
+    """
+    chunks = iter_chunks(text, max_tokens, overlap_tokens=chunk_overlap_tokens, count_tokens=count_tokens)
+    while True:
+        with metrics.timer("chunking"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def build_scoring_prompt(chunk):
+    """
+    Returns the user prompt asking for the scores of one chunk.
+    """
+    return f"""
         Evaluate the following section of a research paper based on scientific depth and domain coverage:
         \"{chunk}\"
         
@@ -91,40 +219,150 @@ def analyze_full_paper(text):
         1. Scientific depth (0.00 to 10.00):
         2. Domain coverage (0.00 to 10.00):
         """
-        for attempt in range(3):  # Retry up to 3 times if the API call fails
-            try:
-                response = openai.ChatCompletion.create(
-                    model="gpt-4",  # Change model if needed
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                output = response['choices'][0]['message']['content'].strip()
-
-                # Use regex to parse the scores from the response
-                scientific_depth_score = None
-                domain_coverage_score = None
-
-                match_depth = re.search(r"Scientific [Dd]epth[:\s]+(\d+(\.\d{1,2})?)", output)
-                match_coverage = re.search(r"Domain [Cc]overage[:\s]+(\d+(\.\d{1,2})?)", output)
-
-                if match_depth:
-                    scientific_depth_score = float(match_depth.group(1))
-                if match_coverage:
-                    domain_coverage_score = float(match_coverage.group(1))
-
-                if scientific_depth_score is not None and domain_coverage_score is not None:
-                    scientific_depth_total += scientific_depth_score
-                    domain_coverage_total += domain_coverage_score
-                    count += 1
-                break  # Exit the retry loop if successful
-            except openai.error.OpenAIError as e:
-                print(f"API error: {e}")
-                time.sleep(5)  # Wait 5 seconds before retrying
+
+def build_scoring_request(chunk, model=None, system=None):
+    """
+    Returns the ChatCompletion parameters for scoring one chunk with `model` and the
+    `system` prompt (by default `evaluation_model` and `system_prompt`). With
+    `structured_outputs`, the model is made to answer with a `record_scores` function call.
+    """
+    request = {
+        "model": model or evaluation_model,
+        "messages": [
+            {"role": "system", "content": system or system_prompt},
+            {"role": "user", "content": build_scoring_prompt(chunk)}
+        ]
+    }
+    if structured_outputs:
+        request.update(function_call_request(scoring_function))
+    return request
+
+def parse_scores(output):
+    """
+    Parses the scores from a response, free text or `record_scores` function call
+    arguments. Returns a (scientific_depth, domain_coverage) tuple, or None if either
+    score is missing.
+    """
+    if output.lstrip().startswith("{"):
+        return parse_score_arguments(output)
+
+    # Use regex to parse the scores from the response
+    match_depth = re.search(r"Scientific [Dd]epth[:\s]+(\d+(\.\d{1,2})?)", output)
+    match_coverage = re.search(r"Domain [Cc]overage[:\s]+(\d+(\.\d{1,2})?)", output)
+
+    if not (match_depth and match_coverage):
+        return None
+    return float(match_depth.group(1)), float(match_coverage.group(1))
+
+def score_chunk(chunk, model=None, system=None, usage=None):
+    """
+    Calls the OpenAI API to score a single chunk with `model` and the `system` prompt
+    (by default `evaluation_model` and `system_prompt`). Returns a
+    (scientific_depth, domain_coverage) tuple, or None if the scores could not be obtained.
+    A `usage` dict is filled with the estimated prompt and completion tokens of the
+    answer, whether it came from the API or the response cache.
+    """
+    request = build_scoring_request(chunk, model, system)
+    model = request["model"]
+    prompt = request["messages"][-1]["content"]
+    cache_prompt = request["messages"][0]["content"]
+    if structured_outputs:
+        cache_prompt = schema_cache_prompt(cache_prompt, scoring_function)
+    output = response_cache.get(model, cache_prompt, prompt, chunk) if response_cache else None
+    from_cache = output is not None
+
+    if output is None:
+        try:
+            # Retries with backoff are handled by the API client
+            response = api_client.chat_completion(**request)
+            output = (message_text(response['choices'][0]['message']) or "").strip()
+        except openai.error.OpenAIError as e:
+            print(f"Failed to process chunk ({e}): {chunk[:100]}...")
+            return None
+        response_usage = response.get('usage') or {}
+        metrics.count("scoring_responses")
+        metrics.count("scoring_output_tokens", response_usage.get('completion_tokens') or count_tokens(output))
+
+    if usage is not None:
+        usage["prompt_tokens"] = request_prompt_tokens(request, count_tokens)
+        usage["completion_tokens"] = count_tokens(output)
+
+    scores = parse_scores(output)
+    if scores is None:
+        if not from_cache:
+            metrics.count("scoring_parse_failures")
+        return None  # The API answered, but without parsable scores
+
+    # Only cache responses that could be parsed, so bad answers are retried on the next run
+    if response_cache and not from_cache:
+        response_cache.put(model, cache_prompt, prompt, chunk, output)
+    return scores
+
+cascade_stats = CascadeStats()
+
+def screening_prompt():
+    """
+    Returns the system prompt of the screening model, with the answer format that
+    matches `structured_outputs`.
+    """
+    return screening_system_prompt + screening_answer_formats["function call" if structured_outputs else "free text"]
+
+def score_chunk_cascade(chunk):
+    """
+    Scores a chunk with the cascade: the screening scores are kept unless both fall
+    inside `cascade_band`, they are missing, or the chunk is in the audit sample, in which
+    case the chunk is scored by `evaluation_model`. Every chunk is recorded in
+    `cascade_stats` for the latency, cost and drift report.
+    """
+    screening_usage = {}
+    started = time.perf_counter()
+    with metrics.timer("cascade_screening", model=screening_model):
+        if screening_model == "heuristic":
+            screening = heuristic_scores(chunk)
         else:
-            # If we reach here, all 3 attempts have failed
-            print(f"Failed to process chunk after 3 attempts: {chunk[:100]}...")
+            screening = score_chunk(chunk, model=screening_model, system=screening_prompt(), usage=screening_usage)
+    screening_seconds = time.perf_counter() - started
+
+    audited = audit_sample(chunk, cascade_audit_rate)
+    escalated = screening is None or audited or in_band(screening, cascade_band)
+    final = screening
+    escalation_seconds = None
+    escalation_usage = {}
+    if escalated:
+        started = time.perf_counter()
+        with metrics.timer("cascade_escalation", model=evaluation_model):
+            final = score_chunk(chunk, usage=escalation_usage)
+        escalation_seconds = time.perf_counter() - started
+        metrics.count("cascade_escalated")
+
+    # A failed escalation is recorded as such, so it does not count towards the drift
+    cascade_stats.record(
+        screening, final, escalated, audited, screening_seconds, escalation_seconds,
+        screening_usage, escalation_usage, request_prompt_tokens(build_scoring_request(chunk), count_tokens)
+    )
+    # Keep the screening scores if the expensive model fails
+    return final if final is not None else screening
+
+def evaluate_chunk(chunk):
+    """
+    Scores a chunk with `evaluation_model`, or with the cascade in cascade mode.
+    """
+    return score_chunk_cascade(chunk) if cascade_mode else score_chunk(chunk)
+
+def average_scores(scores):
+    """
+    Averages the (scientific_depth, domain_coverage) scores, ignoring chunks
+    without scores (None or an empty tuple). Returns (0.0, 0.0) if no chunk was scored.
+    """
+    scientific_depth_total = 0.0
+    domain_coverage_total = 0.0
+    count = 0
+
+    for score in scores:
+        if score:
+            scientific_depth_total += score[0]
+            domain_coverage_total += score[1]
+            count += 1
 
     if count > 0:
         scientific_depth = scientific_depth_total / count
@@ -135,71 +373,378 @@ def analyze_full_paper(text):
 
     return scientific_depth, domain_coverage
 
-def extract_full_text(file_path):
+def score_or_reuse(chunk, name, index, match):
     """
-    Extracts the full text from a PDF file using PyPDF2.
+    Scores one chunk of the paper `name`. If the chunk is a near-duplicate of a chunk
+    already scored (`match`, from the duplicate index), its scores are reused or the
+    chunk is skipped (an empty tuple, left out of the average) according to
+    `near_duplicate_action`, without an API call. Returns None if the chunk could not be scored.
     """
-    full_text = ""
+    if match is not None:
+        score = duplicate_index.result(match, timeout=near_duplicate_wait)
+        if score is not None:
+            action = "reused" if near_duplicate_action == "reuse" else "skipped"
+            duplicate_index.record_match(name, index, match, action)
+            metrics.count("near_duplicate_chunks")
+            return tuple(score) if action == "reused" else ()
+        # The earlier chunk has no scores, so this one is sent after all
+        return evaluate_chunk(chunk)
+
+    score = None
     try:
-        with open(file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            for page in reader.pages:
-                full_text += page.extract_text()
-    except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-    return full_text
+        score = evaluate_chunk(chunk)
+    finally:
+        if duplicate_index is not None:
+            duplicate_index.resolve(name, index, score)
+    return score
+
+def analyze_full_paper(text, max_workers=max_concurrent_chunks, ledger=None, doc_id=None, name=None):
+    """
+    Analyzes the full text of a paper (a string or its pages) by splitting it into chunks,
+    then calling the OpenAI API to evaluate scientific depth and domain coverage for each chunk.
+    Each chunk is sent as soon as it is filled and a scoring slot is free, so at most
+    `max_workers` chunks are held at a time; scores are averaged in chunk order.
+    If a run `ledger` is given, each chunk's scores are recorded under `doc_id` as they arrive
+    and chunks already recorded by an earlier run are not sent again.
+    If the duplicate index is open, near-duplicates of chunks already scored are not sent
+    (see `score_or_reuse`); `name` identifies the paper in its audit records.
+    With a `ledger`, returns None if some chunks could not be scored: they are not
+    recorded, so the paper stays pending and only those chunks are sent on the next run.
+    A chunk that has failed `max_chunk_attempts` times is recorded without scores instead
+    and left out of the average.
+    """
+    max_workers = max(max_workers, 1)
+    completed = ledger.completed_chunks(doc_id) if ledger is not None else {}
+    scores = {}  # chunk index -> score
+    given_up = set()
+    name = name or doc_id
+
+    def score_and_record(index, chunk, match):
+        score = score_or_reuse(chunk, name, index, match)
+        if ledger is None:
+            return score
+        if score is not None:
+            ledger.record_chunk(doc_id, index, score)
+        elif ledger.record_failure(doc_id, index) >= max_chunk_attempts:
+            # Chunks without scores are retried on the next run, up to `max_chunk_attempts` times
+            print(f"Giving up on chunk {index} of {name} after {max_chunk_attempts} attempts")
+            ledger.record_chunk(doc_id, index, None)
+            given_up.add(index)
+        return score
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+
+        def collect(done):
+            for future in done:
+                scores[futures.pop(future)] = future.result()
+
+        for index, chunk in enumerate(split_text_into_chunks(text)):
+            if index in completed:
+                if completed[index] is None:
+                    given_up.add(index)
+                scores[index] = tuple(completed[index]) if completed[index] is not None else None
+                continue
+            # Only chunk further once a scoring slot is free
+            while len(futures) >= max_workers:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(done)
+            match = None
+            if duplicate_index is not None and name is not None:
+                with metrics.timer("minhash"):
+                    match = duplicate_index.claim(name, index, chunk)
+            # Chunks run with the paper context of the caller, for token accounting
+            futures[submit_with_context(executor, score_and_record, index, chunk, match)] = index
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    unscored = sum(1 for index, score in scores.items() if score is None and index not in given_up)
+    if ledger is not None and unscored:
+        print(f"{unscored} of {len(scores)} chunks of {name} could not be scored; the paper stays pending")
+        return None
+    return average_scores(scores[index] for index in sorted(scores))
+
+def append_result_to_csv(result, csv_file_path):
+    """
+    Appends one paper's scores to the CSV file, writing the header if the file is empty.
+    """
+    with metrics.timer("csv_write"), open(csv_file_path, 'a', newline='', encoding='utf-8') as csvfile:
+        fieldnames = ['filename', 'scientific_depth', 'domain_coverage']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        if csvfile.tell() == 0:  # Write header if the file is empty
+            writer.writeheader()
+        writer.writerow(result)
 
-def save_checkpoint(data, checkpoint_path):
+def export_csv_from_ledger(ledger_path, csv_file_path):
     """
-    Saves the checkpoint data (e.g., already processed files) in JSON format.
+    Rebuilds the CSV file from every paper completed in the run ledger.
     """
-    with open(checkpoint_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    ledger = RunLedger(ledger_path)
+    try:
+        if os.path.exists(csv_file_path):
+            os.remove(csv_file_path)
+        for filename, result in ledger.iter_done_documents():
+            append_result_to_csv(result, csv_file_path)
+    finally:
+        ledger.close()
 
-def load_checkpoint(checkpoint_path):
+def iter_pending_papers(folder_path, ledger, text_cache):
     """
-    Loads the checkpoint data from a JSON file, if it exists.
+    Yields (filename, file_hash, pieces) for every PDF in the folder that the run ledger
+    does not list as evaluated, `pieces` being a generator of the text of the
+    `selected_sections`, read page by page from the `text_cache`. PDFs are parsed in a
+    process pool ahead of the consumer, and their sections are recorded in the section index.
     """
-    if os.path.exists(checkpoint_path):
-        with open(checkpoint_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return None
+    processed_files = ledger.done_names()
+    file_paths = [
+        os.path.join(folder_path, filename) for filename in os.listdir(folder_path)
+        if filename.endswith('.pdf') and filename not in processed_files
+    ]
+    texts = iter_extracted_texts(
+        file_paths, text_cache, selected_sections,
+        max_workers=extraction_workers, max_pending=extraction_queue_size, extractor=text_extractor
+    )
+    for file_path, file_hash, pages in texts:
+        if not any(pages):
+            continue
+        filename = os.path.basename(file_path)
+        sections = find_sections(pages)
+        if section_index is not None:
+            section_index.put(filename, text_extractor, sections)
+        pieces, selected_chars, read_chars = select_sections(pages, selected_sections, sections)
+        metrics.count("section_chars_read", read_chars)
+        metrics.count("section_chars_selected", selected_chars)
+        yield filename, file_hash, pieces
 
-def evaluate_papers_in_folder(folder_path, csv_file_path, checkpoint_path):
+def evaluate_papers_in_folder(folder_path, csv_file_path, ledger_path, max_workers=max_concurrent_papers):
     """
     Iterates over all PDF files in the specified folder, evaluates them,
-    and saves results to a CSV file. Uses checkpointing to avoid re-evaluation
-    of already processed files.
-    """
-    results = []
-    checkpoint = load_checkpoint(checkpoint_path)
-    processed_files = checkpoint.get('processed_files', []) if checkpoint else []
-
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.pdf') and filename not in processed_files:
-            file_path = os.path.join(folder_path, filename)
-            full_text = extract_full_text(file_path)
-            if full_text:
-                scientific_depth, domain_coverage = analyze_full_paper(full_text)
+    and saves results to a CSV file. Progress is recorded per chunk in the run ledger,
+    so completed papers are skipped and an interrupted paper resumes at its missing chunks.
+    PDFs are parsed in a process pool while earlier papers are being scored, and up to
+    `max_workers` papers are scored concurrently, sharing the global limit on in-flight
+    API requests.
+    """
+    ledger = RunLedger(ledger_path)
+    futures = {}
+
+    def record_result(future):
+        # Ledger and CSV writes for finished papers stay on this thread, in completion order
+        filename, doc_id = futures.pop(future)
+        scores = future.result()
+        if scores is None:
+            return  # Not finished, so the paper is evaluated again on the next run
+        scientific_depth, domain_coverage = scores
+        result = {
+            'filename': filename,
+            'scientific_depth': scientific_depth,
+            'domain_coverage': domain_coverage
+        }
+        # Chunks given up are recorded without scores
+        complete = None not in ledger.completed_chunks(doc_id).values()
+        if not complete:
+            print(f"{filename} is averaged without the chunks that could not be scored; marked incomplete")
+        ledger.finish_document(doc_id, filename, result, complete=complete)
+
+        # Immediately append the result to CSV
+        append_result_to_csv(result, csv_file_path)
+
+    try:
+        with open_text_cache(text_cache) as cache, ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for filename, file_hash, pieces in iter_pending_papers(folder_path, ledger, cache):
+                # Only pull the next text once a scoring slot is free
+                while len(futures) >= max_workers:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        record_result(future)
+
+                doc_id = file_document_id(file_hash, document_parameters())
+                ledger.start_document(doc_id, filename)
+
+                with paper_context(filename):
+                    future = submit_with_context(
+                        executor, analyze_full_paper, pieces, ledger=ledger, doc_id=doc_id, name=filename
+                    )
+                futures[future] = (filename, doc_id)
+
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record_result(future)
+    finally:
+        ledger.close()
+
+def write_evaluation_batch(folder_path, batch_path, ledger_path):
+    """
+    Offline batch mode: instead of calling the API, appends one Batch API request
+    per chunk still missing from the run ledger to `batch_path`.
+    Returns the number of requests written.
+    """
+    ledger = RunLedger(ledger_path)
+    written = set()
+    count = 0
+    try:
+        with open_text_cache(text_cache) as cache:
+            for filename, file_hash, pieces in iter_pending_papers(folder_path, ledger, cache):
+                # Batch requests are scored by `evaluation_model` alone, whatever `cascade_mode` says
+                doc_id = file_document_id(file_hash, document_parameters(cascade=False))
+                ledger.start_document(doc_id, filename)
+                if doc_id in written:
+                    continue  # Identical to a paper already in this batch
+                written.add(doc_id)
+                requests, num_chunks = append_document_requests(
+                    batch_path, doc_id, split_text_into_chunks(pieces), ledger.completed_chunks(doc_id), build_scoring_request
+                )
+                ledger.set_num_chunks(doc_id, num_chunks)
+                count += requests
+    finally:
+        ledger.close()
+    return count
+
+def ingest_evaluation_batch(results_path, csv_file_path, ledger_path):
+    """
+    Maps a Batch API results file back to papers and chunks: records each chunk's
+    scores in the run ledger, then averages the scores of every paper in the batch
+    and appends it to the CSV file. Failed requests and answers without scores are
+    not recorded, and their papers stay pending so `--write-batch` sends those chunks again,
+    until a chunk has failed `max_chunk_attempts` times and is given up. Chunks the ledger
+    already records are skipped, and a paper with chunks missing from the results stays pending.
+    """
+    ledger = RunLedger(ledger_path)
+    recorded = {}  # doc_id -> chunks recorded in the ledger, in order of appearance
+    failed = set()
+    papers = 0
+    try:
+        for custom_id, output in iter_batch_results(results_path):
+            doc_id, chunk_index = parse_custom_id(custom_id)
+            if doc_id not in recorded:
+                recorded[doc_id] = set(ledger.completed_chunks(doc_id))
+            if chunk_index in recorded[doc_id]:
+                continue  # Already ingested, e.g. from the same results file
+            scores = None
+            if output is not None:
+                scores = parse_scores(output)
+                metrics.count("scoring_responses")
+                if scores is None:
+                    metrics.count("scoring_parse_failures")
+            if scores is not None:
+                ledger.record_chunk(doc_id, chunk_index, scores)
+            elif ledger.record_failure(doc_id, chunk_index) >= max_chunk_attempts:
+                print(f"Giving up on chunk {chunk_index} of {doc_id} after {max_chunk_attempts} attempts")
+                ledger.record_chunk(doc_id, chunk_index, None)
+            else:
+                failed.add(doc_id)
+                continue
+            recorded[doc_id].add(chunk_index)
+
+        for doc_id in recorded:
+            names = ledger.pending_names(doc_id)
+            if not names:
+                continue
+            if doc_id in failed:
+                print(f"Some chunks of {', '.join(names)} failed; left pending for the next batch")
+                continue
+            missing = ledger.missing_chunks(doc_id)
+            if missing:
+                print(f"{missing} chunks of {', '.join(names)} have no results yet; left pending")
+                continue
+            completed = ledger.completed_chunks(doc_id)
+            scientific_depth, domain_coverage = average_scores(completed[index] for index in sorted(completed))
+            complete = None not in completed.values()
+            for filename in names:
                 result = {
                     'filename': filename,
                     'scientific_depth': scientific_depth,
                     'domain_coverage': domain_coverage
                 }
-                results.append(result)
-                processed_files.append(filename)
+                ledger.finish_document(doc_id, filename, result, complete=complete)
+                append_result_to_csv(result, csv_file_path)
+                papers += 1
+    finally:
+        ledger.close()
+    return papers
 
-                # Save progress to checkpoint
-                save_checkpoint({'processed_files': processed_files, 'results': results}, checkpoint_path)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score research papers for scientific depth and domain coverage")
+    parser.add_argument("--export-csv", action="store_true", help="Rebuild the CSV from the run ledger and exit")
+    parser.add_argument("--write-batch", metavar="PATH", help="Write Batch API requests to PATH instead of calling the API")
+    parser.add_argument("--ingest-batch", metavar="PATH", help="Ingest a Batch API results file and update the CSV")
+    parser.add_argument("--sections", nargs="+", choices=section_names + ["all"],
+                        help=f"Sections to score (default: {' '.join(selected_sections or ['all'])})")
+    parser.add_argument("--structured", action="store_true", help="Ask for the scores as a function call instead of free text")
+    parser.add_argument("--cascade", action="store_true",
+                        help=f"Screen every chunk with a cheaper model and escalate uncertain ones to {evaluation_model}")
+    parser.add_argument("--screening-model", help=f"Screening model of the cascade, or 'heuristic' (default: {screening_model})")
+    args = parser.parse_args()
+    if args.sections:
+        selected_sections = None if "all" in args.sections else args.sections
+    cascade_mode = cascade_mode or args.cascade
+    if args.structured:
+        structured_outputs = True
+    screening_model = args.screening_model or screening_model
 
-                # Immediately append the result to CSV
-                with open(csv_file_path, 'a', newline='', encoding='utf-8') as csvfile:
-                    fieldnames = ['filename', 'scientific_depth', 'domain_coverage']
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    if csvfile.tell() == 0:  # Write header if the file is empty
-                        writer.writeheader()
-                    writer.writerow(result)
+    if args.export_csv:
+        # Only rebuild the CSV from the run ledger
+        export_csv_from_ledger(ledger_path, csv_file_path)
+        print(f"Exported {ledger_path} to {csv_file_path}")
+        sys.exit(0)
 
-if __name__ == "__main__":
-    evaluate_papers_in_folder(folder_path, csv_file_path, checkpoint_path)
-    print(f"Evaluation results saved to {csv_file_path}")
+    if args.ingest_batch:
+        papers = ingest_evaluation_batch(args.ingest_batch, csv_file_path, ledger_path)
+        print(f"Ingested batch results for {papers} papers into {csv_file_path}")
+        sys.exit(0)
+
+    if text_cache_path:
+        text_cache = TextCache(text_cache_path)
+    if section_index_path:
+        section_index = SectionIndex(section_index_path)
+    if metrics_trace_path:
+        metrics.open_trace(metrics_trace_path)
+    if metrics_port:
+        start_metrics_server(metrics_port)
+
+    if args.write_batch:
+        requests = write_evaluation_batch(folder_path, args.write_batch, ledger_path)
+        print(f"Wrote {requests} batch requests to {args.write_batch}")
+    else:
+        if llm_cache_path:
+            response_cache = LLMCache(llm_cache_path, max_entries=llm_cache_max_entries, max_age=llm_cache_max_age)
+        if near_duplicates_path:
+            duplicate_index = NearDuplicateIndex(
+                near_duplicates_path, task_scope(
+                    "evaluation", evaluation_model, system_prompt,
+                    *([screening_model, screening_prompt(), cascade_band, cascade_audit_rate] if cascade_mode else [])
+                ),
+                threshold=near_duplicate_threshold
+            )
+        evaluate_papers_in_folder(folder_path, csv_file_path, ledger_path)
+        print(f"Evaluation results saved to {csv_file_path}")
+
+    if text_cache:
+        print(f"Text cache: {text_cache.stats()}")
+        text_cache.close()
+    if response_cache:
+        print(f"LLM cache: {response_cache.stats()}")
+        response_cache.close()
+    print(f"API client: {api_client.stats()}")
+    print_output_stats(
+        output_stats(metrics.summary()["counters"], "scoring"), "scoring",
+        "function call" if structured_outputs else "free text"
+    )
+    if cascade_mode:
+        cascade_report = cascade_stats.report(metrics.summary()["tokens"], model_prices, screening_model, evaluation_model)
+        print_cascade_report(cascade_report)
+        if cascade_report and cascade_report_path:
+            with open(cascade_report_path, 'w', encoding='utf-8') as f:
+                json.dump(cascade_report, f, indent=4)
+    if duplicate_index:
+        print_report(duplicate_index.report())
+        duplicate_index.close()
+    if section_index:
+        section_index.close()
+    if metrics_summary_path:
+        metrics.write_summary(metrics_summary_path)
+        print(f"Metrics written to {metrics_summary_path}")
+    metrics.close()
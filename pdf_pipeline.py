@@ -0,0 +1,196 @@
+import os
+import time
+import shutil
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import fitz  # PyMuPDF
+from metrics import metrics
+from text_cache import TextCache
+from section_index import structured_page_text, iter_pages_until_sections_end, pages_until_sections_end
+
+# Page text extractors: PyMuPDF with run-in section headings put on lines of their own
+# (the default of both scripts, so the text cache entries of one serve the other), and the
+# plain PyMuPDF and PyPDF2 text that entity_extraction.py and paper_evaluation.py used before
+default_text_extractor = "PyMuPDF (section headings)"
+text_extractors = [default_text_extractor, "PyMuPDF", "PyPDF2"]
+
+def extractor_version(extractor):
+    """
+    Returns the version of the library behind `extractor`, part of its text cache key.
+    """
+    if extractor not in text_extractors:
+        raise ValueError(f"Unknown text extractor {extractor!r} (expected one of {text_extractors})")
+    if extractor == "PyPDF2":
+        import PyPDF2  # Only needed for this extractor
+        return PyPDF2.__version__
+    return fitz.VersionBind
+
+@contextmanager
+def open_page_texts(pdf_path, extractor):
+    """
+    Opens a PDF and yields (page count, iterator over the text of its pages) as
+    extracted by `extractor`.
+    """
+    if extractor == "PyPDF2":
+        import PyPDF2
+        with open(pdf_path, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            yield len(reader.pages), (page.extract_text() or "" for page in reader.pages)
+        return
+    with fitz.open(pdf_path) as doc:
+        page_text = structured_page_text if extractor == default_text_extractor else (lambda page: page.get_text())
+        yield doc.page_count, (page_text(page) for page in doc)
+
+def cache_section_pages(cache_path, file_hash, pdf_path, sections=None, extractor=default_text_extractor):
+    """
+    Extracts the pages of a PDF with `extractor` into the text cache at `cache_path`,
+    storing each page as soon as it is parsed, so no worker holds more than one page.
+    Pages are parsed only until the given `sections` have ended (all pages if None).
+    Returns the number of pages stored. Defined at module level so it can run in the
+    extraction process pool.
+    """
+    version = extractor_version(extractor)
+    text_cache = TextCache(cache_path)
+    try:
+        with open_page_texts(pdf_path, extractor) as (page_count, page_texts):
+            num_pages = 0
+            for page in iter_pages_until_sections_end(page_texts, sections):
+                text_cache.put_page(file_hash, extractor, version, num_pages, page)
+                num_pages += 1
+            text_cache.finish(file_hash, extractor, version, num_pages, num_pages == page_count)
+        return num_pages
+    finally:
+        text_cache.close()
+
+class CachedPages:
+    """
+    The first `num_pages` pages of a file in the text cache. Each iteration reads
+    them from the cache one page at a time, so the pages can be passed over more than
+    once without being held in memory.
+    """
+
+    def __init__(self, text_cache, file_hash, num_pages, extractor=default_text_extractor):
+        self.text_cache = text_cache
+        self.file_hash = file_hash
+        self.num_pages = num_pages
+        self.extractor = extractor
+        self.version = extractor_version(extractor)
+
+    def __len__(self):
+        return self.num_pages
+
+    def __iter__(self):
+        return self.text_cache.iter_pages(self.file_hash, self.extractor, self.version, self.num_pages)
+
+@contextmanager
+def open_text_cache(text_cache):
+    """
+    Yields `text_cache`, or a temporary text cache for the duration of the block if it
+    is None: parsed pages reach the API stage through the cache.
+    """
+    if text_cache is not None:
+        yield text_cache
+        return
+    temp_dir = tempfile.mkdtemp(prefix="text_cache_")
+    text_cache = TextCache(os.path.join(temp_dir, "text_cache.sqlite"))
+    try:
+        yield text_cache
+    finally:
+        text_cache.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def timed_call(fn, *args):
+    """
+    Runs `fn` (in a worker process) and returns (result, seconds), so the
+    parent can record how long the call took.
+    """
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+def cached_page_count(text_cache, file_hash, sections, extractor=default_text_extractor):
+    """
+    Returns the number of cached pages of the file the `sections` need, or None if
+    the cache does not hold them (because nothing is cached, or only pages that end
+    before those sections do).
+    """
+    entry = text_cache.entry(file_hash, extractor, extractor_version(extractor))
+    if entry is None:
+        return None
+    num_pages, complete = entry
+    needed = pages_until_sections_end(CachedPages(text_cache, file_hash, num_pages, extractor), sections)
+    if needed is not None:
+        return needed
+    return num_pages if complete else None
+
+def iter_extracted_texts(paths, text_cache, sections=None, max_workers=None, max_pending=8, extractor=default_text_extractor):
+    """
+    Extracts text from the given PDF paths with `extractor` in a process pool and yields
+    (path, file_hash, pages) as soon as each file is ready, `pages` being the
+    `CachedPages` up to the end of the given `sections`, read from `text_cache`
+    as they are iterated.
+
+    At most `max_pending` files are parsing or waiting to be consumed at any time,
+    so the caller can send ready texts to the API while later files are still parsing.
+    Workers write each page to the text cache as soon as it is parsed, and pages are
+    read back one at a time, so memory does not grow with the length of a PDF.
+
+    The raw pages of each file are looked up in the cache by its content hash, whatever
+    the sections, and files whose cached pages cover the `sections` are not parsed.
+    Use `open_text_cache` for a temporary cache if no persistent one is wanted.
+    """
+    paths = list(paths)
+    if not paths:
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max(max_pending, 1)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        remaining = iter(paths)
+        pending = {}
+        ready = deque()
+
+        def fill():
+            while len(pending) + len(ready) < max_pending:
+                path = next(remaining, None)
+                if path is None:
+                    return
+                try:
+                    file_hash = text_cache.file_hash(path)
+                except OSError as e:
+                    print(f"Error reading {path}: {e}")
+                    continue
+                num_pages = cached_page_count(text_cache, file_hash, sections, extractor)
+                if num_pages is not None:
+                    text_cache.hits += 1
+                    metrics.count("text_cache_hits")
+                    ready.append((path, file_hash, CachedPages(text_cache, file_hash, num_pages, extractor)))
+                else:
+                    text_cache.misses += 1
+                    future = executor.submit(
+                        timed_call, cache_section_pages, text_cache.path, file_hash, path, sections, extractor
+                    )
+                    pending[future] = path, file_hash
+
+        while True:
+            fill()
+            if ready:
+                yield ready.popleft()
+                continue
+            if not pending:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, file_hash = pending.pop(future)
+                try:
+                    num_pages, seconds = future.result()
+                    metrics.observe("pdf_parse", seconds, path=path)
+                except Exception as e:
+                    print(f"Error extracting text from {path}: {e}")
+                    metrics.count("pdf_parse_failures")
+                    num_pages = 0
+                ready.append((path, file_hash, CachedPages(text_cache, file_hash, num_pages, extractor)))
@@ -0,0 +1,245 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+def file_document_id(file_hash, parameters):
+    """
+    Returns a stable ID for a document from the content hash of its file and the
+    settings that determine its chunks (extractor, section selection, chunking
+    `parameters`), so it is known before the text is read. A change to the file or to
+    the parameters starts the document afresh.
+    """
+    digest = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(file_hash.encode("utf-8"))
+    return digest.hexdigest()
+
+class RunLedger:
+    """
+    Transactional record of a run, stored in SQLite (WAL mode). Each chunk's result
+    is recorded as it arrives with a single-row insert, so progress is saved in O(1)
+    per chunk and an interrupted run resumes exactly at the chunks still missing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                num_chunks INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (doc_id, name)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_name ON documents (name)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                result TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (doc_id, chunk_index)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_failures (
+                doc_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                attempts INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (doc_id, chunk_index)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_writes (
+                doc_id TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                sizes TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (doc_id, chunk_index)
+            )
+        """)
+        self._conn.commit()
+
+    def start_document(self, doc_id, name, num_chunks=None):
+        """
+        Registers a document under `name` (if not already known) and marks it in progress.
+        Files with identical content share their chunk results through `doc_id`.
+        `num_chunks` may be left out (stored as 0) for documents chunked as they are processed.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO documents (doc_id, name, num_chunks, status, updated_at) "
+                "VALUES (?, ?, ?, 'in_progress', ?)",
+                (doc_id, name, num_chunks or 0, time.time())
+            )
+            self._conn.commit()
+
+    def set_num_chunks(self, doc_id, num_chunks):
+        """
+        Records the number of chunks of a document, e.g. once it has been chunked for a batch.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE documents SET num_chunks = ?, updated_at = ? WHERE doc_id = ?", (num_chunks, time.time(), doc_id)
+            )
+            self._conn.commit()
+
+    def num_chunks(self, doc_id):
+        """
+        Returns the recorded number of chunks of a document, or 0 if it is not known.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(num_chunks) FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] or 0
+
+    def missing_chunks(self, doc_id):
+        """
+        Returns the number of chunks of a document that are not recorded yet, or None
+        if its number of chunks is not known.
+        """
+        num_chunks = self.num_chunks(doc_id)
+        if not num_chunks:
+            return None
+        completed = self.completed_chunks(doc_id)
+        return sum(1 for index in range(num_chunks) if index not in completed)
+
+    def completed_chunks(self, doc_id):
+        """
+        Returns {chunk_index: result} for the chunks already recorded for the document.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_index, result FROM chunks WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+        return {index: json.loads(result) if result is not None else None for index, result in rows}
+
+    def record_chunk(self, doc_id, chunk_index, result):
+        """
+        Records the result of one chunk, completing its write (see `begin_chunk_write`)
+        in the same transaction.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (doc_id, chunk_index, result, updated_at) VALUES (?, ?, ?, ?)",
+                (doc_id, chunk_index, json.dumps(result, ensure_ascii=False), time.time())
+            )
+            self._conn.execute("DELETE FROM chunk_writes WHERE doc_id = ? AND chunk_index = ?", (doc_id, chunk_index))
+            self._conn.commit()
+
+    def begin_chunk_write(self, doc_id, chunk_index, sizes):
+        """
+        Records that the outputs of one chunk are about to be appended to files whose
+        sizes are `sizes` ({filename: size in bytes, or None if the file does not
+        exist}). The write is complete once the chunk is recorded with `record_chunk`.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunk_writes (doc_id, chunk_index, sizes, updated_at) VALUES (?, ?, ?, ?)",
+                (doc_id, chunk_index, json.dumps(sizes), time.time())
+            )
+            self._conn.commit()
+
+    def interrupted_writes(self):
+        """
+        Returns [(doc_id, chunk_index, sizes)] for the chunk writes begun but never
+        recorded, e.g. because the run stopped in between.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, chunk_index, sizes FROM chunk_writes").fetchall()
+        return [(doc_id, chunk_index, json.loads(sizes)) for doc_id, chunk_index, sizes in rows]
+
+    def clear_chunk_write(self, doc_id, chunk_index):
+        """
+        Forgets an interrupted chunk write once it has been rolled back.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM chunk_writes WHERE doc_id = ? AND chunk_index = ?", (doc_id, chunk_index))
+            self._conn.commit()
+
+    def record_failure(self, doc_id, chunk_index):
+        """
+        Counts a failed attempt at one chunk and returns the number of failed attempts so far.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO chunk_failures (doc_id, chunk_index, attempts, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (doc_id, chunk_index) DO UPDATE SET attempts = attempts + 1, updated_at = excluded.updated_at",
+                (doc_id, chunk_index, time.time())
+            )
+            self._conn.commit()
+            row = self._conn.execute(
+                "SELECT attempts FROM chunk_failures WHERE doc_id = ? AND chunk_index = ?", (doc_id, chunk_index)
+            ).fetchone()
+        return row[0]
+
+    def failed_attempts(self, doc_id):
+        """
+        Returns {chunk_index: failed attempts} for the chunks of the document that have failed.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_index, attempts FROM chunk_failures WHERE doc_id = ?", (doc_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def finish_document(self, doc_id, name, result=None, num_chunks=None, complete=True):
+        """
+        Marks the document as done, storing its aggregated result (and its number of
+        chunks, if given). A document finished with `complete=False` (some chunks were
+        given up) is marked "incomplete"; it counts as processed all the same.
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE documents SET status = ?, result = ?, num_chunks = COALESCE(?, num_chunks), updated_at = ? "
+                "WHERE doc_id = ? AND name = ?",
+                ("done" if complete else "incomplete", json.dumps(result, ensure_ascii=False), num_chunks,
+                 time.time(), doc_id, name)
+            )
+            self._conn.commit()
+
+    def pending_names(self, doc_id):
+        """
+        Returns the names registered for the document that are not done yet.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM documents WHERE doc_id = ? AND status NOT IN ('done', 'incomplete') "
+                "ORDER BY updated_at", (doc_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def done_names(self):
+        """
+        Returns the set of document names that have been processed (completely or not).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT name FROM documents WHERE status IN ('done', 'incomplete')"
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def iter_done_documents(self):
+        """
+        Yields (name, result) for every processed document, in completion order.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, result FROM documents WHERE status IN ('done', 'incomplete') ORDER BY updated_at"
+            ).fetchall()
+        for name, result in rows:
+            yield name, json.loads(result) if result is not None else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
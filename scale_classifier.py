@@ -0,0 +1,95 @@
+import re
+import json
+from bisect import bisect_right
+
+def load_scales(path):
+    """
+    Loads the scale vocabularies from a JSON config file of the form
+    {"spatial_scale": {scale: [keywords]}, "temporal_scale": {scale: [keywords]}}.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def trie_pattern(keywords):
+    """
+    Compiles keywords into a regex that shares common prefixes, so each position is
+    matched in time proportional to the keyword length rather than the keyword count.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}  # End of a keyword
+
+    def to_pattern(node):
+        if "" in node and len(node) == 1:
+            return ""
+        alternatives = [re.escape(char) + to_pattern(child) for char, child in sorted(node.items()) if char]
+        optional = "" in node
+        if len(alternatives) == 1 and not optional:
+            return alternatives[0]
+        pattern = "(?:" + "|".join(alternatives) + ")"
+        return pattern + "?" if optional else pattern
+
+    return to_pattern(trie)
+
+class ScaleClassifier:
+    """
+    Classifies labels into the first scale (in vocabulary order) that has a keyword
+    contained in the label, the same rule as `classify_spatial`/`classify_temporal`.
+    All keywords are compiled once into a single regex, so a label (or a whole batch
+    of labels) is scanned in one pass regardless of the vocabulary size.
+    """
+
+    def __init__(self, scales, case_insensitive=False, unknown="Unknown"):
+        self.scales = list(scales)
+        self.case_insensitive = case_insensitive
+        self.unknown = unknown
+
+        # One capturing group per scale inside a lookahead: at every position the regex
+        # reports the first scale (lowest group number) with a keyword starting there
+        groups = []
+        for keywords in scales.values():
+            keywords = [self._fold(keyword) for keyword in keywords if keyword and "\n" not in keyword]
+            groups.append("(" + trie_pattern(keywords) + ")" if keywords else "(?!)")
+        self._pattern = re.compile("(?=" + "|".join(groups) + ")") if groups else None
+
+    def _fold(self, text):
+        return text.casefold() if self.case_insensitive else text
+
+    def classify(self, label):
+        """
+        Returns the scale of a single label.
+        """
+        return self.classify_many([label])[0]
+
+    def classify_many(self, labels):
+        """
+        Returns the scale of every label, scanning the whole batch in one pass.
+        """
+        results = [self.unknown] * len(labels)
+        if self._pattern is None:
+            return results
+
+        # Join the labels with newlines (no keyword contains one, so no match spans two labels)
+        starts = []
+        parts = []
+        offset = 0
+        for label in labels:
+            starts.append(offset)
+            text = self._fold(label) if isinstance(label, str) else ""
+            parts.append(text)
+            offset += len(text) + 1
+
+        best = [None] * len(labels)
+        for match in self._pattern.finditer("\n".join(parts)):
+            index = bisect_right(starts, match.start()) - 1
+            scale_index = match.lastindex - 1
+            if best[index] is None or scale_index < best[index]:
+                best[index] = scale_index
+
+        for index, scale_index in enumerate(best):
+            if scale_index is not None:
+                results[index] = self.scales[scale_index]
+        return results
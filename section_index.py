@@ -0,0 +1,219 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import Counter
+
+# Sections in their usual order; text before the first recognised heading is "front_matter"
+# (title, author list, affiliations)
+section_names = [
+    "front_matter", "abstract", "introduction", "methods", "results", "discussion",
+    "conclusion", "acknowledgements", "references", "appendix"
+]
+
+# Heading titles recognised for each section
+section_titles = {
+    "abstract": r"abstract|a b s t r a c t",
+    "introduction": r"introduction|background",
+    "methods": r"materials? and methods|methods and materials|methods|methodology|experimental procedures|experimental",
+    "results": r"results and discussion|results",
+    "discussion": r"general discussion|discussion",
+    "conclusion": r"conclusions?|concluding remarks",
+    "acknowledgements": r"acknowledge?ments?",
+    "references": r"references and notes|references|bibliography|literature cited",
+    "appendix": r"appendix|appendices|supplementary (?:information|materials?|data)|supporting information"
+}
+
+# A heading on a line of its own, optionally numbered ("2.", "2.1", "II.") and followed by ":" or "."
+heading_line_pattern = re.compile(
+    r"^[ \t]*(?:(?:\d+(?:\.\d+)*|[IVX]+)\.?[ \t]+)?"
+    r"(?:" + "|".join(f"(?P<{name}>{titles})" for name, titles in section_titles.items()) + r")"
+    r"[ \t]*[:.]?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Spans set this much larger than the body text (or in bold) are heading candidates
+heading_size_ratio = 1.15
+bold_flag = 16  # PyMuPDF span flag
+
+def heading_section(line):
+    """
+    Returns the section a heading line starts, or None if it is not a section heading.
+    """
+    match = heading_line_pattern.fullmatch(line.strip())
+    return match.lastgroup if match else None
+
+def structured_page_text(page):
+    """
+    Returns the text of a PyMuPDF page, one line per text line like `page.get_text()`.
+    Run-in headings set in a heading font (bold or larger than the body text), as in
+    "Methods. Plants were grown...", are moved to a line of their own so the
+    line-based heading detection finds them.
+    """
+    blocks = [block for block in page.get_text("dict")["blocks"] if block.get("type", 0) == 0]
+    sizes = Counter()
+    for block in blocks:
+        for line in block["lines"]:
+            for span in line["spans"]:
+                sizes[round(span["size"], 1)] += len(span["text"])
+    body_size = sizes.most_common(1)[0][0] if sizes else 0
+
+    def heading_font(span):
+        return span["flags"] & bold_flag or span["size"] >= body_size * heading_size_ratio
+
+    lines = []
+    for block in blocks:
+        for line in block["lines"]:
+            spans = line["spans"]
+            lead = 0
+            while lead < len(spans) and (heading_font(spans[lead]) or not spans[lead]["text"].strip()):
+                lead += 1
+            lead_text = "".join(span["text"] for span in spans[:lead]).strip()
+            rest_text = "".join(span["text"] for span in spans[lead:]).strip()
+            if lead_text and rest_text and heading_section(lead_text.rstrip(".:")):
+                lines.append(lead_text)
+                lines.append(rest_text)
+            else:
+                lines.append("".join(span["text"] for span in spans))
+    return "".join(line + "\n" for line in lines)
+
+def iter_section_pieces(pages):
+    """
+    Splits consecutive pages at section headings and yields (section, heading, text)
+    pieces in order; each piece lies within one page, and the heading line stays
+    at the start of its section's text.
+    """
+    section = "front_matter"
+    heading = None
+    for page in pages:
+        position = 0
+        for match in heading_line_pattern.finditer(page):
+            if match.start() > position:
+                yield section, heading, page[position:match.start()]
+            section = match.lastgroup
+            heading = match.group(0).strip()
+            position = match.start()
+        if position < len(page):
+            yield section, heading, page[position:]
+
+def find_sections(pages):
+    """
+    Returns the sections of the text as a list of {"section", "heading", "start", "end"},
+    with character offsets into the concatenated pages.
+    """
+    sections = []
+    offset = 0
+    for section, heading, text in iter_section_pieces(pages):
+        if sections and sections[-1]["section"] == section and sections[-1]["heading"] == heading \
+                and sections[-1]["end"] == offset:
+            sections[-1]["end"] += len(text)
+        else:
+            sections.append({"section": section, "heading": heading, "start": offset, "end": offset + len(text)})
+        offset += len(text)
+    return sections
+
+def select_sections(pages, selected, sections=None):
+    """
+    Returns (pieces, selected_chars, total_chars): the text of the `selected` sections as
+    a generator of consecutive pieces, split from `pages` as it is consumed. If `selected`
+    is None, or none of its sections is found, all of the text is returned. `sections`
+    are the sections found by `find_sections`; if left out, `pages` is read once more to
+    find them, so it must then be re-iterable.
+    """
+    if sections is None:
+        sections = find_sections(pages)
+    total_chars = sections[-1]["end"] if sections else 0
+    chosen = None
+    if selected is not None:
+        chosen = {entry["section"] for entry in sections if entry["section"] in selected}
+        if not chosen:
+            print(f"[INFO] None of the sections {', '.join(selected)} found, using full text instead.")
+            chosen = None
+    if chosen is None:
+        return (text for _, _, text in iter_section_pieces(pages)), total_chars, total_chars
+
+    selected_chars = sum(entry["end"] - entry["start"] for entry in sections if entry["section"] in chosen)
+    pieces = (text for section, _, text in iter_section_pieces(pages) if section in chosen)
+    return pieces, selected_chars, total_chars
+
+def iter_pages_until_sections_end(pages, selected):
+    """
+    Yields pages until every `selected` section has been read to its end, so the
+    pages after them need not be parsed. Yields every page if `selected` is None
+    or a selected section does not occur.
+    """
+    remaining = set(selected) if selected is not None else None
+    section = "front_matter"
+    for page in pages:
+        yield page
+        if remaining is None:
+            continue
+        for match in heading_line_pattern.finditer(page):
+            remaining.discard(section)  # The section before this heading has ended
+            section = match.lastgroup
+        if not remaining:
+            return
+
+def pages_until_sections_end(pages, selected):
+    """
+    Returns the number of leading pages that hold every `selected` section to its end,
+    or None if they do not (always None if `selected` is None).
+    """
+    if selected is None:
+        return None
+    remaining = set(selected)
+    section = "front_matter"
+    for count, page in enumerate(pages, 1):
+        for match in heading_line_pattern.finditer(page):
+            remaining.discard(section)
+            section = match.lastgroup
+        if not remaining:
+            return count
+    return None
+
+class SectionIndex:
+    """
+    SQLite record of the sections found in each PDF: section name, heading and
+    character offsets into the extracted text, per extractor. Documents read only
+    up to the end of the selected sections list the sections read so far.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sections (
+                name TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                sections TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (name, extractor)
+            )
+        """)
+        self._conn.commit()
+
+    def put(self, name, extractor, sections):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sections (name, extractor, sections, updated_at) VALUES (?, ?, ?, ?)",
+                (name, extractor, json.dumps(sections, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def get(self, name, extractor):
+        """
+        Returns the recorded sections of the document, or None if unknown.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sections FROM sections WHERE name = ? AND extractor = ?", (name, extractor)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,75 @@
+import time
+import openai
+import pytest
+from api_client import TokenBucket, RateLimitedClient, retry_after_seconds, request_prompt_tokens
+
+def rate_limit_error(headers=None):
+    return openai.error.RateLimitError("Rate limit reached", headers=headers)
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=6000)  # 100 per second
+    started = time.monotonic()
+    bucket.acquire(10 ** 6)  # An oversized request takes the full bucket
+    assert time.monotonic() - started < 0.05
+    bucket.acquire(10)
+    assert time.monotonic() - started >= 0.08
+    bucket.refund(20)
+    bucket.acquire(20)
+    assert time.monotonic() - started < 0.5
+
+def test_retry_after_headers():
+    assert retry_after_seconds(rate_limit_error({"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(rate_limit_error({"retry-after-ms": "250", "retry-after": "2"})) == 0.25
+    assert retry_after_seconds(rate_limit_error({"Retry-After": "soon"})) is None
+    assert retry_after_seconds(rate_limit_error()) is None
+
+def test_concurrency_is_halved_once_per_burst_and_grows_back():
+    client = RateLimitedClient(max_concurrency=8)
+    epoch = client._acquire_slot()
+    client._release_slot()
+    client._on_rate_limited(epoch, 0)
+    client._on_rate_limited(epoch, 0)  # Same burst
+    assert client.concurrency == 4
+    client._on_rate_limited(client._epoch, 0)
+    assert client.concurrency == 2
+    for _ in range(100):
+        client._on_success()
+    assert client.concurrency == 8
+    client._on_rate_limited(client._epoch, 0)
+    client._on_rate_limited(client._epoch, 0)
+    client._on_rate_limited(client._epoch, 0)
+    client._on_rate_limited(client._epoch, 0)
+    assert client.concurrency == client.min_concurrency
+
+def test_rate_limited_requests_wait_for_retry_after(monkeypatch):
+    calls = []
+
+    def create(stream=False, **request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise rate_limit_error({"retry-after-ms": "200"})
+        return {"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 10}}
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    client = RateLimitedClient(max_concurrency=4, base_delay=0.01)
+    response = client.chat_completion(model="gpt-4", messages=[{"role": "user", "content": "Hi"}])
+    assert response["choices"][0]["message"]["content"] == "ok"
+    assert calls[1] - calls[0] >= 0.2
+    assert client.stats() == {"requests": 2, "retries": 1, "rate_limited": 1, "failures": 0, "concurrency": 2.5}
+
+def test_retries_are_bounded(monkeypatch):
+    def create(stream=False, **request):
+        raise openai.error.Timeout("timed out")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    client = RateLimitedClient(max_retries=2, base_delay=0.001)
+    with pytest.raises(openai.error.Timeout):
+        client.chat_completion(model="gpt-4", messages=[])
+    assert client.counters == {"requests": 3, "retries": 2, "rate_limited": 0, "failures": 1}
+
+def test_token_estimate_includes_the_function_schema():
+    function = {"name": "record_scores", "parameters": {"type": "object", "properties": {"d": {"type": "number"}}}}
+    request = {"messages": [{"role": "user", "content": "Score this section."}], "max_tokens": 100}
+    client = RateLimitedClient()
+    assert client.estimate_tokens(request) == request_prompt_tokens(request) + 100
+    assert request_prompt_tokens(dict(request, functions=[function])) > request_prompt_tokens(request)
@@ -0,0 +1,67 @@
+import os
+import csv
+import json
+import pytest
+import benchmark
+import paper_evaluation
+import entity_extraction
+from mock_completion_server import run_fake_batch
+from batch_jobs import make_custom_id, parse_custom_id
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return benchmark.generate_corpus(str(tmp_path / "papers"), papers=2, pages=2)
+
+def drop_last_result(path):
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines[:-1])
+    return lines[-1]
+
+def test_custom_ids_round_trip():
+    assert parse_custom_id(make_custom_id("a:b", 12)) == ("a:b", 12)
+
+def test_evaluation_batch_round_trip(tmp_path, corpus):
+    requests = paper_evaluation.write_evaluation_batch(str(tmp_path / "papers"), "requests.jsonl", "ledger.sqlite")
+    assert requests >= 2
+    run_fake_batch("requests.jsonl", "results.jsonl")
+
+    # A truncated results file leaves the paper with a missing chunk pending
+    last = drop_last_result("results.jsonl")
+    paper_evaluation.ingest_evaluation_batch("results.jsonl", "scores.csv", "ledger.sqlite")
+    with open("scores.csv", encoding="utf-8") as f:
+        assert len(list(csv.DictReader(f))) == 1
+
+    with open("results.jsonl", "a", encoding="utf-8") as f:
+        f.write(last)
+    paper_evaluation.ingest_evaluation_batch("results.jsonl", "scores.csv", "ledger.sqlite")
+    paper_evaluation.ingest_evaluation_batch("results.jsonl", "scores.csv", "ledger.sqlite")  # Writes nothing twice
+    with open("scores.csv", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted(row["filename"] for row in rows) == sorted(os.path.basename(path) for path in corpus)
+
+    # Every chunk is recorded, so the next batch is empty
+    open("requests.jsonl", "w").close()
+    assert paper_evaluation.write_evaluation_batch(str(tmp_path / "papers"), "requests.jsonl", "ledger.sqlite") == 0
+
+def test_extraction_batch_round_trip(monkeypatch, corpus):
+    monkeypatch.setattr(entity_extraction, "ledger_path", "ledger.sqlite")
+    monkeypatch.setattr(entity_extraction, "output_csv", "output.csv")
+    monkeypatch.setattr(entity_extraction, "output_jsonl", "output.jsonl")
+    monkeypatch.setattr(entity_extraction, "output_json", "output.json")
+    assert entity_extraction.write_extraction_batch(corpus, "requests.jsonl") == len(corpus)
+    run_fake_batch("requests.jsonl", "results.jsonl")
+
+    entity_extraction.ingest_extraction_batch("results.jsonl")
+    with open("output.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert {(record["source"], record["chunk"]) for record in records} == {(path, 0) for path in corpus}
+
+    entity_extraction.ingest_extraction_batch("results.jsonl")  # Writes nothing twice
+    with open("output.jsonl", encoding="utf-8") as f:
+        assert len(f.readlines()) == len(records)
+
+    open("requests.jsonl", "w").close()
+    assert entity_extraction.write_extraction_batch(corpus, "requests.jsonl") == 0
@@ -0,0 +1,31 @@
+from chunking import iter_chunks, split_sentences
+
+text = (
+    "1. Introduction\n"
+    "Photosynthesis converts light into chemical energy. RuBisCO fixes CO2 in the Calvin cycle. "
+    "Stomatal conductance limits the supply of CO2 under drought.\n"
+    "2. Methods\n"
+    "Leaves were sampled at noon. Gas exchange was measured with a portable system. "
+    "Chlorophyll fluorescence was recorded in the dark-adapted state.\n"
+    "3. Results\n"
+    "Conductance fell by half under drought. Quenching increased accordingly.\n"
+)
+
+def split_at(text, positions):
+    bounds = [0] + positions + [len(text)]
+    return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+def test_page_splits_do_not_change_the_chunks():
+    expected = list(iter_chunks(text, max_tokens=40))
+    assert len(expected) > 1
+    # Splits inside a word, inside a sentence, right after a heading and at a line end
+    for positions in ([10], [100, 101], [text.index("2. Methods") + 5], [text.index("\n") + 1], list(range(7, len(text), 37))):
+        assert list(iter_chunks(split_at(text, positions), max_tokens=40)) == expected
+
+def test_chunks_keep_every_sentence_once():
+    chunks = list(iter_chunks(split_at(text, [50, 180, 300]), max_tokens=40))
+    assert " ".join(chunks).split() == " ".join(split_sentences(text)).split()
+
+def test_overlap_repeats_the_last_sentences():
+    chunks = list(iter_chunks(text, max_tokens=40, overlap_tokens=15, min_section_fill=1.0))
+    assert any(chunk.split(". ")[-1] in following for chunk, following in zip(chunks, chunks[1:]))
@@ -0,0 +1,42 @@
+import json
+from compact_schema import (
+    decode_entity, decode_relationship, expand_compact_extraction, parse_score_arguments,
+    message_text, schema_cache_prompt, scoring_function, extraction_function
+)
+
+def test_decode_entity():
+    assert decode_entity(["e1", "RuBisCO", "enzyme", "location=stroma", "role = carboxylation", "note"]) == {
+        "id": "e1", "label": "RuBisCO", "type": "enzyme",
+        "properties": {"location": "stroma", "role": "carboxylation"}
+    }
+    assert decode_entity([2, "Leaf", "organ"])["id"] == "2"
+    assert decode_entity(["e1", "RuBisCO"]) is None
+    assert decode_entity("e1, RuBisCO, enzyme") is None
+
+def test_decode_relationship():
+    assert decode_relationship(["e1", "e2", "LOCATED_IN"]) == {"from": "e1", "to": "e2", "type": "LOCATED_IN"}
+    assert decode_relationship(["e1", "e2"]) is None
+
+def test_expand_compact_extraction_skips_malformed_records():
+    data = {
+        "e": [["e1", "RuBisCO", "enzyme"], ["e2"], ["e3", "Chloroplast", "organelle", "x=1"]],
+        "r": [["e1", "e3", "LOCATED_IN"], "e1-e3"]
+    }
+    expanded = expand_compact_extraction(data)
+    assert [entity["label"] for entity in expanded["entities"]] == ["RuBisCO", "Chloroplast"]
+    assert expanded["relationships"] == [{"from": "e1", "to": "e3", "type": "LOCATED_IN"}]
+    assert expand_compact_extraction({"e": None}) == {"entities": [], "relationships": []}
+
+def test_parse_score_arguments():
+    assert parse_score_arguments('{"d": 7.25, "c": "6.5"}') == (7.25, 6.5)
+    assert parse_score_arguments('{"d": 7.25}') is None
+    assert parse_score_arguments('{"d": 7.25, "c": null}') is None
+    assert parse_score_arguments('{"d": 7.25, "c": 6') is None
+
+def test_function_call_answers_and_cache_prompts():
+    message = {"content": None, "function_call": {"name": "record_scores", "arguments": '{"d": 1, "c": 2}'}}
+    assert message_text(message) == '{"d": 1, "c": 2}'
+    assert message_text({"content": "Scientific depth: 1"}) == "Scientific depth: 1"
+    prompts = {schema_cache_prompt("system", function) for function in (scoring_function, extraction_function)}
+    assert len(prompts | {"system"}) == 3
+    assert json.dumps(scoring_function, sort_keys=True) in schema_cache_prompt("system", scoring_function)
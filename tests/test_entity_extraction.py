@@ -0,0 +1,58 @@
+import pytest
+import entity_extraction
+from run_ledger import RunLedger
+
+data = {
+    "entities": [{"id": "e1", "label": "Leaf", "type": "organ"}],
+    "relationships": [{"from": "e1", "to": "e1", "type": "SELF"}]
+}
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(entity_extraction, "output_csv", "output.csv")
+    monkeypatch.setattr(entity_extraction, "output_jsonl", "output.jsonl")
+    ledger = RunLedger("ledger.sqlite")
+    yield ledger
+    ledger.close()
+
+def read(filename):
+    with open(filename, encoding="utf-8") as f:
+        return f.read()
+
+def write_chunk(ledger, chunk_index):
+    entity_extraction.write_chunk_outputs(
+        data, "paper.pdf", chunk_index, ledger, "doc", entity_extraction.chunk_summary(data)
+    )
+
+def test_writing_a_chunk_records_it(ledger):
+    write_chunk(ledger, 0)
+    assert ledger.completed_chunks("doc") == {0: {"entities": 1, "relationships": 1}}
+    assert ledger.interrupted_writes() == []
+    assert len(read("output.jsonl").splitlines()) == 2
+
+def test_interrupted_writes_are_rolled_back(ledger, monkeypatch):
+    write_chunk(ledger, 0)
+    written = read("output.csv"), read("output.jsonl")
+
+    def crash(*args):
+        raise KeyboardInterrupt
+
+    # The run stops after the chunk's records are appended, before it is recorded
+    with monkeypatch.context() as patch:
+        patch.setattr(ledger, "record_chunk", crash)
+        with pytest.raises(KeyboardInterrupt):
+            write_chunk(ledger, 1)
+    assert read("output.jsonl") != written[1]
+    assert [write[:2] for write in ledger.interrupted_writes()] == [("doc", 1)]
+
+    entity_extraction.roll_back_interrupted_writes(ledger)
+    assert (read("output.csv"), read("output.jsonl")) == written
+    assert ledger.interrupted_writes() == []
+    assert set(ledger.completed_chunks("doc")) == {0}
+
+def test_files_created_by_an_interrupted_write_are_removed(ledger, tmp_path):
+    ledger.begin_chunk_write("doc", 0, entity_extraction.output_sizes())
+    entity_extraction.append_to_jsonl(data, "output.jsonl", "paper.pdf", 0)
+    entity_extraction.roll_back_interrupted_writes(ledger)
+    assert not (tmp_path / "output.jsonl").exists()
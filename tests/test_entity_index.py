@@ -0,0 +1,40 @@
+from entity_index import EntityIndex, is_canonical_id
+
+def test_declared_local_ids_resolve_to_canonical_ids():
+    index = EntityIndex()
+    data = {
+        "entities": [{"id": "e1", "label": "RuBisCO"}, {"id": "e2", "label": "Chloroplast"}],
+        "relationships": [{"from": "e1", "to": "e2", "type": "LOCATED_IN"}]
+    }
+    result = index.canonicalize(data)
+    rubisco, chloroplast = (entity["canonical_id"] for entity in result["entities"])
+    assert is_canonical_id(rubisco) and is_canonical_id(chloroplast)
+    assert result["relationships"] == [{"from": rubisco, "to": chloroplast, "type": "LOCATED_IN"}]
+
+def test_labels_shaped_like_local_ids_are_kept():
+    index = EntityIndex()
+    data = {
+        "entities": [{"id": "e1", "label": "Stomatal conductance"}, {"id": "e2", "label": "CO2"}],
+        "relationships": [
+            {"from": "e1", "to": "CO2", "type": "LIMITS"},
+            {"from": "e1", "to": "C4", "type": "PART_OF"}
+        ]
+    }
+    result = index.canonicalize(data)
+    conductance, co2 = (entity["canonical_id"] for entity in result["entities"])
+    # "CO2" is the label of an entity of the chunk, "C4" is unknown and kept verbatim
+    assert [(r["from"], r["to"]) for r in result["relationships"]] == [(conductance, co2), (conductance, "C4")]
+
+def test_undeclared_local_id_resolves_as_known_label():
+    index = EntityIndex()
+    no3 = index.resolve("NO3")
+    result = index.canonicalize({
+        "entities": [{"id": "e1", "label": "Leaf nitrogen content"}],
+        "relationships": [{"from": "NO3", "to": "e1", "type": "INCREASES"}]
+    })
+    assert result["relationships"][0]["from"] == no3
+
+def test_variants_share_a_canonical_id():
+    index = EntityIndex()
+    assert index.resolve("Chloroplasts") == index.resolve("chloroplast")
+    assert index.lookup("Calvin cycle") is None
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from graph_index import GraphIndex
+
+def node(node_id, label=None, sources=(), mentions=1):
+    return {"data": {"id": node_id, "label": label or node_id, "sources": list(sources), "mentions": mentions},
+            "position": {"x": len(node_id), "y": 0}}
+
+def edge(source, target, label="RELATED_TO", weight=1):
+    return {"data": {"source": source, "target": target, "label": label, "weight": weight}}
+
+# A chain a - b - c - d, a branch b - e, a self-loop on e and an isolated node f
+nodes = [node("a", "RuBisCO", ["p1.pdf"], 3), node("b", sources=["p1.pdf", "p2.pdf"]), node("c"),
+         node("d", sources=["p2.pdf"]), node("e"), node("f")]
+edges = [edge("a", "b", "PART_OF", 2), edge("b", "c"), edge("c", "d"), edge("b", "e"), edge("e", "e"),
+         edge("a", "missing")]
+
+@pytest.fixture(params=[True, False], ids=["built", "loaded"])
+def index(request, tmp_path):
+    index = GraphIndex.from_elements(nodes, edges)
+    if request.param:
+        return index
+    index.save(str(tmp_path / "graph"))
+    return GraphIndex.load(str(tmp_path / "graph"))
+
+def test_csr_adjacency(index):
+    assert index.num_nodes == 6 and index.num_edges == 5  # The edge to a missing node is dropped
+    neighbors = {index.node_ids[i]: sorted(index.node_ids[j] for j in index.neighbors_of(i).tolist())
+                 for i in range(index.num_nodes)}
+    assert neighbors == {"a": ["b"], "b": ["a", "c", "e"], "c": ["b", "d"], "d": ["c"], "e": ["b", "e"], "f": []}
+    assert index.degree.tolist() == [1, 3, 2, 1, 2, 0]
+
+def test_node_and_edge_elements(index):
+    assert index.find("missing") is None
+    element = index.node_element(index.find("a"))
+    assert element["data"] == {"id": "a", "label": "RuBisCO", "mentions": 3, "sources": ["p1.pdf"]}
+    assert index.source_names() == ["p1.pdf", "p2.pdf"]
+    elements = index.elements([index.find("a"), index.find("b")])
+    edge_data = [element["data"] for element in elements if "source" in element["data"]]
+    assert edge_data == [{"id": "edge-0", "source": "a", "target": "b", "label": "PART_OF", "weight": 2}]
+
+def test_neighborhood(index):
+    ids = lambda nodes: [index.node_ids[i] for i in nodes]
+    assert ids(index.neighborhood("a", hops=1)) == ["a", "b"]
+    assert sorted(ids(index.neighborhood("a", hops=2))) == ["a", "b", "c", "e"]
+    assert len(index.neighborhood("a", hops=3, limit=3)) == 3
+    assert index.neighborhood("missing") == []
+
+def test_shortest_path(index):
+    assert index.shortest_path("a", "d") == ["a", "b", "c", "d"]
+    assert index.shortest_path("d", "e") == ["d", "c", "b", "e"]
+    assert index.shortest_path("a", "d", max_hops=2) is None
+    assert index.shortest_path("a", "f") is None
+    assert index.shortest_path("a", "a") == ["a"]
+
+def test_top_nodes(index):
+    assert [index.node_ids[i] for i in index.top_nodes(2)] == ["b", "c"]
+    assert [index.node_ids[i] for i in index.top_nodes(1, rank_by="mentions")] == ["a"]
+    assert sorted(index.node_ids[i] for i in index.top_nodes(5, source="p2.pdf")) == ["b", "d"]
+
+def test_load_memory_maps_the_arrays(tmp_path):
+    GraphIndex.from_elements(nodes, edges).save(str(tmp_path / "graph"))
+    loaded = GraphIndex.load(str(tmp_path / "graph"))
+    assert isinstance(loaded.neighbors, np.memmap)
+    assert GraphIndex.load(str(tmp_path / "nothing")) is None
@@ -0,0 +1,38 @@
+from json_stream import IncrementalJSONParser
+
+response = (
+    "```json\n"
+    '{"entities": [{"id": "e1", "label": "RuBisCO {enzyme}"}, {"id": "e2", "label": "Calvin \\"cycle\\""}], '
+    '"relationships": [{"from": "e1", "to": "e2", "type": "PART_OF"}]}\n'
+    "```"
+)
+
+def test_pieces_give_the_same_records_as_whole_text():
+    whole = IncrementalJSONParser()
+    whole.feed(response)
+    assert whole.done
+    pieces = IncrementalJSONParser()
+    for i in range(0, len(response), 3):
+        pieces.feed(response[i:i + 3])
+    assert pieces.result() == whole.result()
+    assert whole.result()["entities"][1]["label"] == 'Calvin "cycle"'
+
+def test_truncated_input_keeps_the_completed_records():
+    cut = response.index('"relationships"') + 30  # Inside the first relationship
+    parser = IncrementalJSONParser()
+    completed = parser.feed(response[:cut])
+    assert not parser.done
+    assert [key for key, _ in completed] == ["entities", "entities"]
+    assert parser.result() == {"entities": [{"id": "e1", "label": "RuBisCO {enzyme}"}, {"id": "e2", "label": 'Calvin "cycle"'}],
+                               "relationships": []}
+
+def test_truncated_inside_a_string_drops_the_open_record():
+    cut = response.index("Calvin") + 3
+    parser = IncrementalJSONParser()
+    parser.feed(response[:cut])
+    assert parser.result() == {"entities": [{"id": "e1", "label": "RuBisCO {enzyme}"}], "relationships": []}
+
+def test_decoders_expand_compact_arrays():
+    parser = IncrementalJSONParser(("e", "r"), decoders={"e": lambda row: {"id": row[0], "label": row[1]}})
+    parser.feed('{"e": [["e1", "RuBisCO"], ["e2", "Chlor')
+    assert parser.result() == {"e": [{"id": "e1", "label": "RuBisCO"}], "r": []}
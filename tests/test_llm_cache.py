@@ -0,0 +1,52 @@
+import time
+from llm_cache import LLMCache
+
+def put(cache, chunk):
+    cache.put("gpt-4", "system", "prompt", chunk, f"answer to {chunk}")
+
+def get(cache, chunk):
+    return cache.get("gpt-4", "system", "prompt", chunk)
+
+def test_hits_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = LLMCache(path)
+    put(cache, "chunk")
+    assert get(cache, "other chunk") is None
+    assert cache.get("gpt-4o", "system", "prompt", "chunk") is None
+    cache.close()
+
+    cache = LLMCache(path)
+    assert get(cache, "chunk") == "answer to chunk"
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 1}
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), max_entries=2, evict_every=1)
+    put(cache, "a")
+    time.sleep(0.01)
+    put(cache, "b")
+    time.sleep(0.01)
+    assert get(cache, "a") is not None  # "b" is now the least recently used
+    time.sleep(0.01)
+    put(cache, "c")
+    assert get(cache, "b") is None
+    assert get(cache, "a") is not None and get(cache, "c") is not None
+    assert cache.stats()["entries"] == 2
+    cache.close()
+
+def test_expired_entries_are_misses_and_evicted_on_open(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = LLMCache(path, max_age=60)
+    put(cache, "old")
+    put(cache, "new")
+    cache._conn.execute("UPDATE responses SET created_at = created_at - 120 WHERE response = 'answer to old'")
+    cache._conn.commit()
+    assert get(cache, "old") is None
+    assert get(cache, "new") == "answer to new"
+    cache._conn.execute("UPDATE responses SET created_at = created_at - 120")
+    cache._conn.commit()
+    cache.close()
+
+    cache = LLMCache(path, max_age=60)
+    assert cache.stats()["entries"] == 0
+    cache.close()
@@ -0,0 +1,63 @@
+import random
+import threading
+from near_duplicates import NearDuplicateIndex
+
+rng = random.Random(0)
+vocabulary = ["leaf", "stomatal", "conductance", "rubisco", "carboxylation", "drought", "canopy", "yield",
+              "photosystem", "quenching", "nitrogen", "chlorophyll", "temperature", "mesophyll", "crop", "light"]
+text = " ".join(rng.choice(vocabulary) + str(i % 37) for i in range(400))
+other_text = " ".join(rng.choice(vocabulary) + str(i % 41) for i in range(400))
+
+def near_copy(text, changes=2):
+    words = text.split()
+    for i in range(changes):
+        words[100 + 150 * i] = "changed"
+    return " ".join(words)
+
+def open_index(tmp_path, scope="scoring"):
+    return NearDuplicateIndex(str(tmp_path / "near_duplicates.sqlite"), scope)
+
+def test_claim_and_resolve(tmp_path):
+    index = open_index(tmp_path)
+    assert index.claim("paper.pdf", 0, text) is None
+    assert index.claim("other.pdf", 0, other_text) is None
+    index.resolve("paper.pdf", 0, [5.5, 6.0])
+    index.resolve("other.pdf", 0, [1.0, 2.0])
+
+    match = index.claim("preprint.pdf", 3, near_copy(text))
+    assert (match["name"], match["chunk_index"]) == ("paper.pdf", 0)
+    assert match["similarity"] >= index.threshold
+    assert index.result(match) == [5.5, 6.0]
+    index.record_match("preprint.pdf", 3, match, "reused")
+    report = index.report()
+    assert report["pairs"][0]["duplicate_of"] == "paper.pdf" and report["calls_saved"] == 1
+    index.close()
+
+def test_failed_results_are_not_matched(tmp_path):
+    index = open_index(tmp_path)
+    assert index.claim("paper.pdf", 0, text) is None
+    index.resolve("paper.pdf", 0, None)
+    assert index.claim("copy.pdf", 0, text) is None
+    index.close()
+
+def test_pending_results_are_waited_for(tmp_path):
+    index = open_index(tmp_path)
+    assert index.claim("paper.pdf", 0, text) is None
+    match = index.claim("copy.pdf", 0, text)
+    assert index.result(match, timeout=0.01) is None  # Still being computed
+    threading.Timer(0.05, index.resolve, ("paper.pdf", 0, {"entities": []})).start()
+    assert index.result(match, timeout=5) == {"entities": []}
+    index.close()
+
+def test_results_persist_per_scope(tmp_path):
+    index = open_index(tmp_path)
+    index.claim("paper.pdf", 0, text)
+    index.resolve("paper.pdf", 0, [5.5, 6.0])
+    index.close()
+
+    index = open_index(tmp_path)
+    assert index.result(index.claim("copy.pdf", 0, text)) == [5.5, 6.0]
+    index.close()
+    index = open_index(tmp_path, scope="extraction")
+    assert index.claim("copy.pdf", 0, text) is None
+    index.close()
@@ -0,0 +1,59 @@
+import threading
+import time
+import pytest
+import paper_evaluation
+from run_ledger import RunLedger
+
+@pytest.fixture
+def chunks(monkeypatch):
+    """
+    Replaces the chunker with a fixed list of chunks, so each chunk's scores can be
+    read from its text: "chunk <depth> <coverage>".
+    """
+    chunks = [f"chunk {i} {10 - i}" for i in range(8)]
+    monkeypatch.setattr(paper_evaluation, "split_text_into_chunks", lambda text: iter(chunks))
+    return chunks
+
+def test_chunks_are_scored_concurrently_and_averaged(monkeypatch, chunks):
+    lock = threading.Lock()
+    in_flight = 0
+    most_in_flight = 0
+
+    def evaluate_chunk(chunk):
+        nonlocal in_flight, most_in_flight
+        with lock:
+            in_flight += 1
+            most_in_flight = max(most_in_flight, in_flight)
+        # Later chunks finish first, so the scores arrive out of order
+        time.sleep(0.05 / (1 + int(chunk.split()[1])))
+        with lock:
+            in_flight -= 1
+        _, depth, coverage = chunk.split()
+        return float(depth), float(coverage)
+
+    monkeypatch.setattr(paper_evaluation, "evaluate_chunk", evaluate_chunk)
+    result = paper_evaluation.analyze_full_paper("text", max_workers=3)
+    assert result == pytest.approx((3.5, 6.5))
+    assert 1 < most_in_flight <= 3
+
+def test_unscored_chunks_leave_the_paper_pending(monkeypatch, tmp_path, chunks):
+    attempts = []
+
+    def evaluate_chunk(chunk):
+        attempts.append(chunk)
+        _, depth, coverage = chunk.split()
+        return None if depth == "5" else (float(depth), float(coverage))
+
+    monkeypatch.setattr(paper_evaluation, "evaluate_chunk", evaluate_chunk)
+    ledger = RunLedger(str(tmp_path / "ledger.sqlite"))
+    assert paper_evaluation.analyze_full_paper("text", max_workers=2, ledger=ledger, doc_id="doc") is None
+    assert sorted(ledger.completed_chunks("doc")) == [0, 1, 2, 3, 4, 6, 7]
+
+    # The next run only sends the failed chunk; on its last attempt it is left out of the average
+    attempts.clear()
+    for _ in range(paper_evaluation.max_chunk_attempts - 1):
+        result = paper_evaluation.analyze_full_paper("text", max_workers=2, ledger=ledger, doc_id="doc")
+    assert attempts == ["chunk 5 5"] * (paper_evaluation.max_chunk_attempts - 1)
+    scored = [i for i in range(8) if i != 5]
+    assert result == pytest.approx((sum(scored) / 7, sum(10 - i for i in scored) / 7))
+    ledger.close()
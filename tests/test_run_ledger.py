@@ -0,0 +1,51 @@
+from run_ledger import RunLedger, file_document_id
+
+def open_ledger(tmp_path):
+    return RunLedger(str(tmp_path / "ledger.sqlite"))
+
+def test_document_id_depends_on_file_and_parameters():
+    assert file_document_id("abc", {"max_tokens": 100}) == file_document_id("abc", {"max_tokens": 100})
+    assert file_document_id("abc", {"max_tokens": 100}) != file_document_id("abc", {"max_tokens": 200})
+    assert file_document_id("abc", {"max_tokens": 100}) != file_document_id("abd", {"max_tokens": 100})
+
+def test_resume_after_reopening(tmp_path):
+    ledger = open_ledger(tmp_path)
+    ledger.start_document("doc", "paper.pdf")
+    ledger.set_num_chunks("doc", 3)
+    ledger.record_chunk("doc", 0, [5.0, 6.0])
+    ledger.record_chunk("doc", 2, [7.0, 8.0])
+    ledger.close()
+
+    ledger = open_ledger(tmp_path)
+    assert ledger.completed_chunks("doc") == {0: [5.0, 6.0], 2: [7.0, 8.0]}
+    assert ledger.missing_chunks("doc") == 1
+    assert ledger.pending_names("doc") == ["paper.pdf"]
+    ledger.record_chunk("doc", 1, [1.0, 2.0])
+    assert ledger.missing_chunks("doc") == 0
+    ledger.finish_document("doc", "paper.pdf", result={"score": 1})
+    assert ledger.pending_names("doc") == []
+    assert list(ledger.iter_done_documents()) == [("paper.pdf", {"score": 1})]
+    ledger.close()
+
+def test_identical_files_share_chunks(tmp_path):
+    ledger = open_ledger(tmp_path)
+    ledger.start_document("doc", "a.pdf")
+    ledger.start_document("doc", "copy of a.pdf")
+    ledger.record_chunk("doc", 0, None)
+    assert ledger.pending_names("doc") == ["a.pdf", "copy of a.pdf"]
+    assert ledger.missing_chunks("doc") is None  # Chunk count not known yet
+    ledger.close()
+
+def test_failures_are_counted_and_incomplete_documents_count_as_done(tmp_path):
+    ledger = open_ledger(tmp_path)
+    ledger.start_document("doc", "paper.pdf", num_chunks=2)
+    assert [ledger.record_failure("doc", 1) for _ in range(3)] == [1, 2, 3]
+    assert ledger.failed_attempts("doc") == {1: 3}
+    ledger.record_chunk("doc", 0, [5.0, 6.0])
+    ledger.record_chunk("doc", 1, None)  # Given up
+    ledger.finish_document("doc", "paper.pdf", complete=False)
+    assert ledger.pending_names("doc") == []
+    assert ledger.done_names() == {"paper.pdf"}
+    status = ledger._conn.execute("SELECT status FROM documents WHERE doc_id = 'doc'").fetchone()[0]
+    assert status == "incomplete"
+    ledger.close()
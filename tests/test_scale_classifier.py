@@ -0,0 +1,48 @@
+import os
+import random
+from scale_classifier import ScaleClassifier, load_scales
+
+scales = load_scales(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scales.json"))
+
+def classify(label, scale_keywords):
+    """
+    The keyword scan of the former classify_spatial/classify_temporal.
+    """
+    if label is None:
+        return "Unknown"
+    for scale, keywords in scale_keywords.items():
+        if any(keyword in label for keyword in keywords):
+            return scale
+    return "Unknown"
+
+def sample_labels(scale_keywords, count=500, seed=0):
+    rng = random.Random(seed)
+    keywords = [keyword for keywords in scale_keywords.values() for keyword in keywords]
+    words = ["Leaf", "Rate", "of", "under", "Drought", "chloroplast", "Crops", "Seasonal", "", "RuBisCO-like"]
+    labels = [None, "", "Unrelated label"]
+    for _ in range(count):
+        parts = rng.sample(keywords, rng.randint(0, 3)) + rng.sample(words, rng.randint(0, 3))
+        rng.shuffle(parts)
+        label = " ".join(parts)
+        # Cut some labels inside a keyword
+        labels.append(label[:rng.randint(0, len(label))] if rng.random() < 0.2 else label)
+    return labels
+
+def test_agrees_with_the_keyword_scan():
+    for scale_keywords in (scales["spatial_scale"], scales["temporal_scale"]):
+        classifier = ScaleClassifier(scale_keywords)
+        labels = sample_labels(scale_keywords)
+        expected = [classify(label, scale_keywords) for label in labels]
+        assert classifier.classify_many(labels) == expected
+        assert [classifier.classify(label) for label in labels[:50]] == expected[:50]
+
+def test_earlier_scales_win_and_prefixes_are_shared():
+    classifier = ScaleClassifier({"first": ["Leaf Area"], "second": ["Leaf", "Le"], "third": ["Area"]})
+    assert classifier.classify_many(["Area of the Leaf", "Leaf Are", "Area", "leaf area"]) == [
+        "second", "second", "third", "Unknown"
+    ]
+    assert classifier.classify("Total Leaf Area Index") == "first"
+
+def test_case_insensitive_matching():
+    classifier = ScaleClassifier({"cellular": ["Chloroplast"]}, case_insensitive=True)
+    assert classifier.classify_many(["chloroplast envelope", "CHLOROPLAST", "Plastid"]) == ["cellular", "cellular", "Unknown"]
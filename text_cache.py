@@ -0,0 +1,144 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+class TextCache:
+    """
+    On-disk cache of extracted PDF text, keyed by file content hash plus extractor
+    name and version. Each page is stored zlib-compressed in a row of its own, so
+    repeated runs (and both scripts, which use the same extractor) skip PDF parsing,
+    and pages can be read back one at a time. Files parsed only up to the end of some
+    sections are stored as an incomplete prefix of their pages. Unchanged files are
+    recognised by size and mtime without re-hashing their contents.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                file_hash TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                file_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                version TEXT NOT NULL,
+                num_pages INTEGER NOT NULL,
+                complete INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (file_hash, extractor, version)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                file_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                version TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                text BLOB NOT NULL,
+                PRIMARY KEY (file_hash, extractor, version, page_number)
+            )
+        """)
+        self._conn.commit()
+
+    def file_hash(self, file_path):
+        """
+        Returns the SHA-256 of the file contents, reusing the stored hash
+        when the file's size and mtime have not changed.
+        """
+        abs_path = os.path.abspath(file_path)
+        stat = os.stat(abs_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime, file_hash FROM files WHERE path = ?", (abs_path,)
+            ).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+
+        digest = hashlib.sha256()
+        with open(abs_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        file_hash = digest.hexdigest()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime, file_hash) VALUES (?, ?, ?, ?)",
+                (abs_path, stat.st_size, stat.st_mtime, file_hash)
+            )
+            self._conn.commit()
+        return file_hash
+
+    def entry(self, file_hash, extractor, version):
+        """
+        Returns (num_pages, complete) for the cached pages of the file, or None if
+        nothing is cached. `complete` is False if only the first pages were stored.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT num_pages, complete FROM documents WHERE file_hash = ? AND extractor = ? AND version = ?",
+                (file_hash, extractor, version)
+            ).fetchone()
+        return (row[0], bool(row[1])) if row is not None else None
+
+    def iter_pages(self, file_hash, extractor, version, num_pages):
+        """
+        Yields the first `num_pages` cached pages of the file, reading one page at a time.
+        """
+        for page_number in range(num_pages):
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT text FROM pages WHERE file_hash = ? AND extractor = ? AND version = ? AND page_number = ?",
+                    (file_hash, extractor, version, page_number)
+                ).fetchone()
+            if row is None:
+                return
+            yield zlib.decompress(row[0]).decode("utf-8")
+
+    def put_page(self, file_hash, extractor, version, page_number, text):
+        """
+        Stores one extracted page of the file. The pages become visible to `entry`
+        once `finish` is called.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (file_hash, extractor, version, page_number, text) VALUES (?, ?, ?, ?, ?)",
+                (file_hash, extractor, version, page_number, zlib.compress(text.encode("utf-8")))
+            )
+            self._conn.commit()
+
+    def finish(self, file_hash, extractor, version, num_pages, complete):
+        """
+        Records that the first `num_pages` pages of the file are stored, and whether
+        they are all of its pages.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (file_hash, extractor, version, num_pages, complete, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file_hash, extractor, version, num_pages, int(complete), time.time())
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """
+        Returns hit/miss counters for this session.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()